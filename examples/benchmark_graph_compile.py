@@ -0,0 +1,46 @@
+"""
+Micro-benchmark of the agent graph construction cost per alert.
+
+Compares building and compiling the graphs on every call, as the pipelines and
+the alert route used to, with the cached compiled graphs they use now. No LLM
+is called; run it with LLM_MODE=replay when no LLM endpoint is configured.
+"""
+
+import time
+
+from alm.agents.graph import (
+    build_graph_without_clustering,
+    build_inference_graph,
+    graph_without_clustering,
+    inference_graph,
+)
+
+ITERATIONS = 200
+
+
+def _per_call_ms(get_graph) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        get_graph()
+    return (time.perf_counter() - start) / ITERATIONS * 1000
+
+
+def main():
+    graphs = (
+        (
+            "graph_without_clustering",
+            build_graph_without_clustering,
+            graph_without_clustering,
+        ),
+        ("inference_graph", build_inference_graph, inference_graph),
+    )
+    for name, build, cached in graphs:
+        cached()
+        print(
+            f"{name}: build + compile {_per_call_ms(build):.3f} ms/call, "
+            f"cached {_per_call_ms(cached):.4f} ms/call"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Quality and latency parity of the fused triage call with the current graph.
+
+Runs every sampled log through both triage paths:
+- current: `summarize_log` -> `classify_log` -> `router_step_by_step_solution`
+  (three sequential LLM calls)
+- fused: `triage_log` (one LLM call, see GRAPH_FUSED_TRIAGE)
+
+and reports how often the category and the need-more-context decision agree,
+the cosine similarity of the two summaries and the latency of each path. The
+current path is the reference; there is no ground truth.
+
+The LLM cache is off by default so every log costs real calls. With
+LLM_MODE=replay both paths are served from recordings (record them first with
+LLM_MODE=record).
+
+Usage:
+    python examples/eval_fused_triage.py --limit 50 --output fused_triage.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+from alm.agents.node import (  # noqa: E402
+    classify_log,
+    router_step_by_step_solution,
+    summarize_log,
+    triage_log,
+)
+from alm.llm import get_llm  # noqa: E402
+from alm.pipeline.ingestion import ingest_directory  # noqa: E402
+from alm.utils.encoders import get_encoder  # noqa: E402
+
+
+async def _current_triage(log: str, llm) -> dict:
+    start = time.perf_counter()
+    summary = await summarize_log(log, llm)
+    category = await classify_log(summary, llm)
+    suggestion = await router_step_by_step_solution(summary, llm)
+    return {
+        "summary": summary,
+        "category": category,
+        "suggestion": suggestion,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+async def _fused_triage(log: str, llm) -> dict:
+    start = time.perf_counter()
+    triage = await triage_log(log, llm)
+    return {
+        **triage.model_dump(),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+async def _evaluate(logs, concurrency: int) -> list:
+    llm = get_llm()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def evaluate_log(log: str) -> dict:
+        async with semaphore:
+            current = await _current_triage(log, llm)
+            fused = await _fused_triage(log, llm)
+        return {"log": log, "current": current, "fused": fused}
+
+    return await asyncio.gather(*(evaluate_log(log) for log in logs))
+
+
+def _report(results: list) -> dict:
+    summaries = get_encoder().encode(
+        [
+            result[path]["summary"]
+            for result in results
+            for path in ("current", "fused")
+        ],
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    similarities = (summaries[0::2] * summaries[1::2]).sum(axis=1)
+    for result, similarity in zip(results, similarities):
+        result["summary_similarity"] = float(similarity)
+
+    def agreement(field: str) -> float:
+        return statistics.mean(
+            result["current"][field] == result["fused"][field] for result in results
+        )
+
+    def latency(path: str) -> dict:
+        seconds = sorted(result[path]["seconds"] for result in results)
+        return {
+            "mean": statistics.mean(seconds),
+            "p50": seconds[len(seconds) // 2],
+            "p95": seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+        }
+
+    return {
+        "logs": len(results),
+        "category_agreement": agreement("category"),
+        "need_more_context_agreement": agreement("suggestion"),
+        "summary_similarity_mean": float(similarities.mean()),
+        "summary_similarity_min": float(similarities.min()),
+        "llm_calls_per_log": {"current": 3, "fused": 1},
+        "latency_seconds": {"current": latency("current"), "fused": latency("fused")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logs-dir", default="data/logs/failed")
+    parser.add_argument("--limit", type=int, default=50, help="Distinct logs")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", help="Write the per-log results as JSON")
+    args = parser.parse_args()
+
+    logs = list(
+        dict.fromkeys(alert.logMessage for alert in ingest_directory(args.logs_dir))
+    )[: args.limit]
+    results = asyncio.run(_evaluate(logs, args.concurrency))
+    report = _report(results)
+    print(json.dumps(report, indent=2))
+
+    disagreements = [
+        result
+        for result in results
+        if result["current"]["category"] != result["fused"]["category"]
+        or result["current"]["suggestion"] != result["fused"]["suggestion"]
+    ]
+    for result in disagreements:
+        print(
+            f"\n{result['log'][:200]}\n"
+            f"  current: {result['current']['category']} / "
+            f"{result['current']['suggestion']}\n"
+            f"  fused:   {result['fused']['category']} / "
+            f"{result['fused']['suggestion']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"report": report, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
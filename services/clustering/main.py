@@ -1,23 +1,139 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import io
+import logging
+import time
+from fastapi import FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel, ValidationError
 import joblib
 import numpy as np
 import os
-from model_loader import load_from_minio
+from model_loader import (
+    get_version_from_local_file,
+    get_version_from_minio,
+    load_from_minio,
+)
 from sklearn.base import BaseEstimator
 
 app = FastAPI()
-# TODO change it for cluster deployment to be model registry.
-if os.getenv("MINIO_BUCKET_NAME"):
-    model: BaseEstimator = load_from_minio(
-        os.getenv("MINIO_BUCKET_NAME"), "clustering_model.joblib"
-    )
-else:
-    model = joblib.load("clustering_model.joblib")
+
+MODEL_FILE_NAME = "clustering_model.joblib"
+# Interval between checks for a new model version. The model is updated online
+# by the training pipelines, and every replica reloads it when it changes.
+MODEL_REFRESH_SECONDS = float(os.getenv("MODEL_REFRESH_SECONDS", "30"))
+
+
+def _model_version():
+    if os.getenv("MINIO_BUCKET_NAME"):
+        return get_version_from_minio(os.getenv("MINIO_BUCKET_NAME"), MODEL_FILE_NAME)
+    return get_version_from_local_file(MODEL_FILE_NAME)
+
+
+def _load_model() -> dict | BaseEstimator:
+    # TODO change it for cluster deployment to be model registry.
+    if os.getenv("MINIO_BUCKET_NAME"):
+        return load_from_minio(os.getenv("MINIO_BUCKET_NAME"), MODEL_FILE_NAME)
+    return joblib.load(MODEL_FILE_NAME)
+
+
+# Either the cluster assignment model saved by training (a dict of arrays) or a
+# legacy estimator with `predict`
+model_version = _model_version()
+model = _load_model()
+_model_checked_at = time.monotonic()
+_model_refresh_lock = asyncio.Lock()
+
+
+async def _refresh_model() -> None:
+    """Reload the model if a new version was persisted since the last check."""
+    global model, model_version, _model_checked_at
+    if time.monotonic() - _model_checked_at < MODEL_REFRESH_SECONDS:
+        return
+    # Concurrent requests keep using the loaded model during the check
+    if _model_refresh_lock.locked():
+        return
+    async with _model_refresh_lock:
+        _model_checked_at = time.monotonic()
+        try:
+            version = await asyncio.to_thread(_model_version)
+            if version != model_version:
+                model = await asyncio.to_thread(_load_model)
+                model_version = version
+        except Exception:
+            logging.exception("reloading the clustering model failed")
+
+
+# Content types of the binary request bodies
+NPY_CONTENT_TYPE = "application/x-npy"
+RAW_FLOAT32_CONTENT_TYPE = "application/octet-stream"
 
 
 class InputData(BaseModel):
-    embeddings: list[float]  # Adjust based on your model's input shape
+    embeddings: list[list[float]]  # N x D matrix, one row per log
+
+
+class ClusterResponse(BaseModel):
+    # -1 for logs too far from every known cluster (a new cluster)
+    labels: list[int]
+    # Cosine distance of each row to the nearest prototype of the cluster
+    # assignment model (Euclidean distance to the centroid for legacy models
+    # with centroids, None for other legacy models)
+    distances: Optional[list[float]] = None
+    # Revision of an online updated cluster assignment model, so clients can tell
+    # which state of the clusters the labels refer to
+    revision: Optional[int] = None
+
+
+def _assign(
+    model: dict | BaseEstimator, embeddings: np.ndarray
+) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """Labels and distances of a batch, see `alm.agents.cluster_model`."""
+    if isinstance(model, dict):
+        embeddings = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+        )
+        similarities = embeddings @ model["prototypes"].T
+        nearest = similarities.argmax(axis=1)
+        distances = np.maximum(
+            1.0 - similarities[np.arange(len(embeddings)), nearest], 0.0
+        )
+        labels = np.where(
+            distances <= model["prototype_thresholds"][nearest],
+            model["prototype_labels"][nearest],
+            -1,
+        )
+        return labels, distances
+
+    labels = model.predict(embeddings)
+    centers = getattr(model, "cluster_centers_", None)
+    if centers is None:
+        return labels, None
+    return labels, np.linalg.norm(embeddings - centers[labels], axis=1)
+
+
+def _parse_embeddings(body: bytes, content_type: str, dim: Optional[int]) -> np.ndarray:
+    """Read an N x D embedding matrix from a JSON, npy or raw float32 body."""
+    if not body:
+        raise HTTPException(status_code=422, detail="empty request body")
+    try:
+        if content_type == NPY_CONTENT_TYPE:
+            embeddings = np.load(io.BytesIO(body), allow_pickle=False)
+        elif content_type == RAW_FLOAT32_CONTENT_TYPE:
+            if not dim:
+                raise ValueError("raw float32 bodies need the dim query parameter")
+            embeddings = np.frombuffer(body, dtype="<f4").reshape(-1, dim)
+        else:
+            embeddings = np.asarray(
+                InputData.model_validate_json(body).embeddings, dtype=np.float32
+            )
+    # np.load raises EOFError / OSError on truncated or non-npy bodies
+    except (ValueError, ValidationError, EOFError, OSError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if embeddings.ndim != 2:
+        raise HTTPException(
+            status_code=422, detail=f"expected an N x D matrix, got {embeddings.shape}"
+        )
+    return embeddings
 
 
 @app.get("/health")
@@ -26,11 +142,48 @@ def health_check():
     return {"status": "healthy"}
 
 
-@app.post("/cluster")
-def predict(data: InputData):
-    input_array = np.array(data.embeddings)
-    prediction = model.predict(input_array)
-    return {"labels": prediction.tolist()}
+@app.post(
+    "/cluster",
+    response_model=ClusterResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": InputData.model_json_schema()},
+                NPY_CONTENT_TYPE: {},
+                RAW_FLOAT32_CONTENT_TYPE: {},
+            }
+        }
+    },
+)
+async def predict(
+    request: Request,
+    dim: Optional[int] = Query(None, description="Row length of raw float32 bodies"),
+) -> ClusterResponse:
+    """Predict the clusters of a batch of embeddings.
+
+    The body is either JSON (`{"embeddings": [[...], ...]}`), an npy file
+    (`application/x-npy`) or raw little-endian float32 values
+    (`application/octet-stream`, with the `dim` query parameter).
+    """
+    content_type = request.headers.get("content-type", "application/json")
+    embeddings = _parse_embeddings(
+        await request.body(), content_type.split(";")[0].strip(), dim
+    )
+    await _refresh_model()
+    # A reload during the prediction must not mix two models
+    current_model = model
+    revision = (
+        current_model.get("revision") if isinstance(current_model, dict) else None
+    )
+    if len(embeddings) == 0:
+        return ClusterResponse(labels=[], distances=[], revision=revision)
+
+    labels, distances = await asyncio.to_thread(_assign, current_model, embeddings)
+    return ClusterResponse(
+        labels=labels.tolist(),
+        distances=distances.tolist() if distances is not None else None,
+        revision=revision,
+    )
 
 
 def main():
@@ -39,6 +39,25 @@ def load_from_minio(bucket_name: str, file_name: str) -> BaseEstimator:
         return joblib.load(buffer)
 
 
+def get_version_from_minio(bucket_name: str, file_name: str) -> str:
+    """Version id of an object, or its ETag when the bucket is unversioned."""
+    from minio import Minio
+
+    minio_client = Minio(
+        endpoint=f"{os.getenv('MINIO_ENDPOINT')}:{os.getenv('MINIO_PORT')}",
+        access_key=os.getenv("MINIO_ACCESS_KEY"),
+        secret_key=os.getenv("MINIO_SECRET_KEY"),
+        secure=False,
+    )
+    stat = minio_client.stat_object(bucket_name, file_name)
+    return stat.version_id or stat.etag
+
+
+def get_version_from_local_file(model_path: str) -> tuple[int, int]:
+    stat = os.stat(model_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
 def load_from_model_registry(model_name: str) -> BaseEstimator:
     from model_registry import ModelRegistry  # , utils
 
@@ -0,0 +1,568 @@
+"""
+Cluster assignment model shared by training, inference and the clustering service.
+
+Whatever algorithm trained the clusters, the persisted model is a set of labeled
+prototype embeddings, each with a cosine distance threshold:
+
+- dbscan: the core samples of every cluster, so non-convex clusters keep their
+  shape, plus the logs of single-log clusters; the threshold is the model one
+- meanshift / agglomerative: the centroid of every cluster; the threshold is
+  the model one, widened to the cluster's radius so its members still fit
+
+A log is assigned to the cluster of its nearest prototype, or to NEW_CLUSTER when
+that prototype is further than its threshold. The model is persisted as a plain
+dict of numpy arrays (see `to_artifact`), so consumers without this package, like
+the clustering service, can load it with joblib.
+
+The model can also be updated online, without retraining (see `partial_fit` and
+`maintain`): every prototype keeps the number of logs it attracted, the sum of
+their distances and a small reservoir sample of them. Prototypes drift toward
+the mean of their logs, logs that fit no cluster open new ones, and periodic
+maintenance merges clusters that converged and splits widely spread ones.
+
+The model optionally carries the log template miner of its training logs (see
+`alm.patterns.template_miner`), whose templates map logs to clusters without
+embedding them.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from alm.patterns.template_miner import TemplateMiner
+
+# Label of logs that fit no existing cluster
+NEW_CLUSTER = -1
+ARTIFACT_FORMAT = "cluster_assignment/v1"
+# Logs kept per prototype to split it during maintenance
+MAX_PROTOTYPE_SAMPLES = 8
+_KMEANS_ITERATIONS = 10
+
+
+class RetrainRequiredError(ValueError):
+    """The persisted clustering model cannot assign logs, it must be retrained."""
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class ClusterAssignmentModel:
+    """Nearest-prototype cluster assignment with a new-cluster threshold."""
+
+    def __init__(
+        self,
+        prototypes: np.ndarray,
+        prototype_labels: np.ndarray,
+        threshold: float,
+        algorithm: Optional[str] = None,
+        prototype_thresholds: Optional[np.ndarray] = None,
+        prototype_counts: Optional[np.ndarray] = None,
+        prototype_spread: Optional[np.ndarray] = None,
+        prototype_samples: Optional[List[np.ndarray]] = None,
+        revision: int = 0,
+        template_miner: Optional[TemplateMiner] = None,
+    ):
+        self.prototypes = _normalize(prototypes)
+        self.prototype_labels = np.asarray(prototype_labels, dtype=np.int64)
+        self.threshold = threshold
+        if prototype_thresholds is None:
+            prototype_thresholds = np.full(len(self.prototypes), threshold)
+        self.prototype_thresholds = np.asarray(prototype_thresholds, dtype=np.float32)
+        self.algorithm = algorithm
+        # Online statistics: logs attracted by every prototype, sum of their
+        # cosine distances to it, and a reservoir sample of them
+        if prototype_counts is None:
+            prototype_counts = np.ones(len(self.prototypes))
+        self.prototype_counts = np.asarray(prototype_counts, dtype=np.float64)
+        if prototype_spread is None:
+            prototype_spread = np.zeros(len(self.prototypes))
+        self.prototype_spread = np.asarray(prototype_spread, dtype=np.float64)
+        if prototype_samples is None:
+            prototype_samples = [prototype[None] for prototype in self.prototypes]
+        self.prototype_samples = [
+            np.asarray(samples, dtype=np.float32) for samples in prototype_samples
+        ]
+        # Incremented by every online update
+        self.revision = revision
+        self.template_miner = template_miner
+        self._index = None
+        self._rng = np.random.default_rng()
+
+    @classmethod
+    def from_clustering(
+        cls,
+        cluster_model,
+        embeddings: np.ndarray,
+        labels: np.ndarray,
+        threshold: float,
+        algorithm: Optional[str] = None,
+        sample_weight: Optional[np.ndarray] = None,
+    ) -> "ClusterAssignmentModel":
+        """
+        Build the assignment model of a trained clustering.
+
+        Args:
+            cluster_model: Fitted sklearn estimator
+            embeddings: Training embeddings
+            labels: Final cluster label of every training row (no noise label)
+            threshold: Max cosine distance to the nearest prototype; centroids
+                get at least their cluster's radius
+            algorithm: Clustering algorithm, for reference
+            sample_weight: Number of logs each row stands for
+        """
+        embeddings = _normalize(embeddings)
+        labels = np.asarray(labels, dtype=np.int64)
+        core_sample_indices = getattr(cluster_model, "core_sample_indices_", None)
+        if core_sample_indices is not None:
+            keep = np.zeros(len(labels), dtype=bool)
+            keep[core_sample_indices] = True
+            # Former noise points are single-log clusters without core samples
+            _, inverse, counts = np.unique(
+                labels, return_inverse=True, return_counts=True
+            )
+            keep |= counts[inverse] == 1
+            model = cls(embeddings[keep], labels[keep], threshold, algorithm)
+        else:
+            cluster_labels, inverse = np.unique(labels, return_inverse=True)
+            centroids, radii, _ = _centroids(
+                embeddings, inverse, len(cluster_labels), threshold
+            )
+            model = cls(centroids, cluster_labels, threshold, algorithm, radii)
+
+        # Online statistics of the training logs, each counted with the nearest
+        # prototype of its own cluster
+        nearest, distances = model._nearest_in_cluster(embeddings, labels)
+        weights = np.ones(len(labels)) if sample_weight is None else sample_weight
+        model.prototype_counts = np.bincount(
+            nearest, weights, minlength=len(model.prototypes)
+        )
+        model.prototype_spread = np.bincount(
+            nearest, weights * distances, minlength=len(model.prototypes)
+        )
+        model.prototype_samples = [
+            embeddings[model._rng.permutation(np.flatnonzero(nearest == index))][
+                :MAX_PROTOTYPE_SAMPLES
+            ]
+            for index in range(len(model.prototypes))
+        ]
+        return model
+
+    @classmethod
+    def from_artifact(
+        cls, artifact, legacy_threshold: float
+    ) -> "ClusterAssignmentModel":
+        """Load a persisted model; legacy centroid estimators are converted.
+
+        Args:
+            artifact: Persisted model (see `to_artifact`) or a fitted estimator
+                with `cluster_centers_`
+            legacy_threshold: Threshold for converted estimators
+
+        Raises:
+            RetrainRequiredError: For other legacy estimators
+        """
+        if isinstance(artifact, cls):
+            return artifact
+        if isinstance(artifact, dict) and artifact.get("format") == ARTIFACT_FORMAT:
+            return cls(
+                artifact["prototypes"],
+                artifact["prototype_labels"],
+                artifact["threshold"],
+                artifact.get("algorithm"),
+                artifact["prototype_thresholds"],
+                artifact.get("prototype_counts"),
+                artifact.get("prototype_spread"),
+                artifact.get("prototype_samples"),
+                artifact.get("revision", 0),
+                (
+                    TemplateMiner.from_dict(artifact["templates"])
+                    if artifact.get("templates")
+                    else None
+                ),
+            )
+        centers = getattr(artifact, "cluster_centers_", None)
+        if centers is not None:
+            return cls(centers, np.arange(len(centers)), legacy_threshold, "legacy")
+        # Legacy DBSCAN (fitted on precomputed distances) and agglomerative
+        # estimators keep neither centroids nor embeddings to build prototypes of
+        raise RetrainRequiredError(
+            f"Legacy {type(artifact).__name__} cluster model has no cluster centers "
+            "to assign logs with, retrain the clustering model"
+        )
+
+    def to_artifact(self) -> dict:
+        return {
+            "format": ARTIFACT_FORMAT,
+            "prototypes": self.prototypes,
+            "prototype_labels": self.prototype_labels,
+            "threshold": self.threshold,
+            "algorithm": self.algorithm,
+            "prototype_thresholds": self.prototype_thresholds,
+            "prototype_counts": self.prototype_counts,
+            "prototype_spread": self.prototype_spread,
+            "prototype_samples": self.prototype_samples,
+            "revision": self.revision,
+            "templates": (
+                self.template_miner.to_dict() if self.template_miner else None
+            ),
+        }
+
+    @property
+    def n_clusters(self) -> int:
+        return len(np.unique(self.prototype_labels))
+
+    def _nearest(self, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Index and cosine similarity of the nearest prototype of every row."""
+        if self._index is None:
+            import faiss
+
+            self._index = faiss.IndexFlatIP(self.prototypes.shape[1])
+            self._index.add(self.prototypes)
+        similarities, indices = self._index.search(embeddings, 1)
+        return indices[:, 0], similarities[:, 0]
+
+    def _nearest_in_cluster(
+        self, embeddings: np.ndarray, labels: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Index of and cosine distance to the nearest prototype of each row's
+        own cluster."""
+        nearest = np.zeros(len(embeddings), dtype=np.int64)
+        distances = np.zeros(len(embeddings))
+        for label in np.unique(labels):
+            rows = np.flatnonzero(labels == label)
+            candidates = np.flatnonzero(self.prototype_labels == label)
+            similarities = embeddings[rows] @ self.prototypes[candidates].T
+            best = similarities.argmax(axis=1)
+            nearest[rows] = candidates[best]
+            distances[rows] = np.maximum(
+                1.0 - similarities[np.arange(len(rows)), best], 0.0
+            )
+        return nearest, distances
+
+    def assign(
+        self, embeddings: np.ndarray, threshold: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Assign embeddings to clusters.
+
+        Args:
+            embeddings: Embedding matrix, one row per log
+            threshold: Use this threshold for every prototype instead of theirs
+
+        Returns:
+            (label per row, NEW_CLUSTER beyond the threshold; cosine distance per
+            row to its nearest prototype)
+        """
+        embeddings = _normalize(embeddings)
+        if len(embeddings) == 0 or len(self.prototypes) == 0:
+            return (
+                np.full(len(embeddings), NEW_CLUSTER, dtype=np.int64),
+                np.full(len(embeddings), np.inf, dtype=np.float32),
+            )
+        nearest, similarities = self._nearest(embeddings)
+        distances = np.maximum(1.0 - similarities, 0.0)
+        if threshold is None:
+            threshold = self.prototype_thresholds[nearest]
+        labels = np.where(
+            distances <= threshold, self.prototype_labels[nearest], NEW_CLUSTER
+        )
+        return labels, distances
+
+    def predict(self, embeddings: np.ndarray) -> np.ndarray:
+        return self.assign(embeddings)[0]
+
+    def add_clusters(
+        self,
+        embeddings: np.ndarray,
+        labels: np.ndarray,
+        sample_weight: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Add the clusters of newly clustered logs, one centroid prototype each.
+
+        As in `from_clustering`, a centroid's threshold is widened to its
+        cluster's radius so the members still fit, and its statistics are
+        those of the members.
+
+        Args:
+            embeddings: Embeddings of the new logs
+            labels: Cluster of every row among the new logs
+            sample_weight: Number of logs each row stands for
+
+        Returns:
+            Model label of the new cluster of every row
+        """
+        embeddings = _normalize(embeddings)
+        weights = np.ones(len(embeddings)) if sample_weight is None else sample_weight
+        cluster_labels, inverse = np.unique(labels, return_inverse=True)
+        centroids, radii, distances = _centroids(
+            embeddings, inverse, len(cluster_labels), self.threshold
+        )
+        first_label = int(self.prototype_labels.max(initial=-1)) + 1
+        new_labels = np.arange(first_label, first_label + len(cluster_labels))
+        self._add_prototypes(
+            centroids,
+            new_labels,
+            counts=np.bincount(inverse, weights, minlength=len(cluster_labels)),
+            thresholds=radii,
+        )
+        first = len(self.prototypes) - len(cluster_labels)
+        self.prototype_spread[first:] = np.bincount(
+            inverse, weights * distances, minlength=len(cluster_labels)
+        )
+        for cluster in range(len(cluster_labels)):
+            self.prototype_samples[first + cluster] = embeddings[
+                self._rng.permutation(np.flatnonzero(inverse == cluster))
+            ][:MAX_PROTOTYPE_SAMPLES]
+        return new_labels[inverse]
+
+    def _add_prototypes(
+        self,
+        prototypes: np.ndarray,
+        labels: np.ndarray,
+        counts: Optional[np.ndarray] = None,
+        thresholds: Optional[np.ndarray] = None,
+    ) -> None:
+        if thresholds is None:
+            thresholds = np.full(len(prototypes), self.threshold)
+        self.prototypes = np.vstack([self.prototypes, prototypes])
+        self.prototype_labels = np.concatenate([self.prototype_labels, labels])
+        self.prototype_thresholds = np.concatenate(
+            [self.prototype_thresholds, np.asarray(thresholds, dtype=np.float32)]
+        )
+        if counts is None:
+            counts = np.ones(len(prototypes))
+        self.prototype_counts = np.concatenate([self.prototype_counts, counts])
+        self.prototype_spread = np.concatenate(
+            [self.prototype_spread, np.zeros(len(prototypes))]
+        )
+        self.prototype_samples.extend(prototype[None] for prototype in prototypes)
+        self._index = None
+
+    def partial_fit(
+        self, embeddings: np.ndarray, sample_weight: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Assign embeddings online and update the clusters with them.
+
+        A row that fits no existing cluster joins the first cluster opened in
+        this call within the threshold, or opens a new one (leader clustering).
+        The prototypes then move to the running mean of the logs they attracted.
+
+        Args:
+            embeddings: Embedding matrix, one row per log
+            sample_weight: Number of logs each row stands for
+
+        Returns:
+            Cluster label of every row, never NEW_CLUSTER
+        """
+        embeddings = _normalize(embeddings)
+        weights = (
+            np.ones(len(embeddings))
+            if sample_weight is None
+            else np.asarray(sample_weight, dtype=np.float64)
+        )
+        nearest = np.full(len(embeddings), -1, dtype=np.int64)
+        distances = np.zeros(len(embeddings))
+        if len(self.prototypes) and len(embeddings):
+            nearest, similarities = self._nearest(embeddings)
+            distances = np.maximum(1.0 - similarities, 0.0)
+            nearest[distances > self.prototype_thresholds[nearest]] = -1
+
+        first_new = len(self.prototypes)
+        leaders: List[np.ndarray] = []
+        for row in np.flatnonzero(nearest == -1):
+            if leaders:
+                similarities = np.stack(leaders) @ embeddings[row]
+                best = int(similarities.argmax())
+                if 1.0 - similarities[best] <= self.threshold:
+                    nearest[row] = first_new + best
+                    distances[row] = max(1.0 - similarities[best], 0.0)
+                    continue
+            leaders.append(embeddings[row])
+            nearest[row] = first_new + len(leaders) - 1
+        if leaders:
+            first_label = int(self.prototype_labels.max(initial=-1)) + 1
+            self._add_prototypes(
+                np.stack(leaders),
+                np.arange(first_label, first_label + len(leaders)),
+                counts=np.zeros(len(leaders)),
+            )
+            # Leaders are sampled below with the other logs of their cluster
+            for index in range(first_new, len(self.prototypes)):
+                self.prototype_samples[index] = self.prototypes[:0].copy()
+
+        self._update_statistics(embeddings, weights, nearest, distances)
+        self.revision += 1
+        return self.prototype_labels[nearest]
+
+    def _update_statistics(
+        self,
+        embeddings: np.ndarray,
+        weights: np.ndarray,
+        nearest: np.ndarray,
+        distances: np.ndarray,
+    ) -> None:
+        size = len(self.prototypes)
+        added = np.bincount(nearest, weights, minlength=size)
+        sums = np.zeros_like(self.prototypes)
+        np.add.at(sums, nearest, embeddings * weights[:, None])
+        moved = added > 0
+        self.prototypes[moved] = _normalize(
+            self.prototypes[moved] * self.prototype_counts[moved, None] + sums[moved]
+        )
+        self.prototype_spread += np.bincount(
+            nearest, weights * distances, minlength=size
+        )
+        # Reservoir sampling of the logs of every prototype
+        seen = self.prototype_counts.copy()
+        for row, index in enumerate(nearest):
+            seen[index] += weights[row]
+            samples = self.prototype_samples[index]
+            if len(samples) < MAX_PROTOTYPE_SAMPLES:
+                self.prototype_samples[index] = np.vstack([samples, embeddings[row]])
+            elif self._rng.random() < MAX_PROTOTYPE_SAMPLES / seen[index]:
+                samples[self._rng.integers(MAX_PROTOTYPE_SAMPLES)] = embeddings[row]
+        self.prototype_counts = seen
+        self._index = None
+
+    def maintain(
+        self, merge_threshold: float, split_threshold: float
+    ) -> Dict[str, Dict[int, int]]:
+        """
+        Merge clusters whose centroids converged and split widely spread ones.
+
+        Args:
+            merge_threshold: Clusters whose count-weighted centroids are within
+                this cosine distance are merged into the largest of them
+            split_threshold: Prototypes whose logs are on average further than
+                this cosine distance are split in two with 2-means over their
+                sampled logs; the second half becomes a new cluster
+
+        Returns:
+            {"merged": {absorbed label: surviving label},
+             "split": {split label: new label}}
+        """
+        merged = self._merge(merge_threshold)
+        split = self._split(split_threshold)
+        if self.template_miner is not None:
+            # Logs of a split cluster's templates may belong to either half
+            self.template_miner.relabel_clusters(merged)
+            self.template_miner.relabel_clusters({label: None for label in split})
+        if merged or split:
+            self.revision += 1
+            self._index = None
+        return {"merged": merged, "split": split}
+
+    def _merge(self, merge_threshold: float) -> Dict[int, int]:
+        labels, inverse = np.unique(self.prototype_labels, return_inverse=True)
+        if len(labels) < 2:
+            return {}
+        centroids = np.zeros((len(labels), self.prototypes.shape[1]))
+        np.add.at(centroids, inverse, self.prototypes * self.prototype_counts[:, None])
+        centroids = _normalize(centroids)
+        sizes = np.bincount(inverse, self.prototype_counts, minlength=len(labels))
+
+        # Union-find over the close pairs, the largest cluster of a group survives
+        parents = np.arange(len(labels))
+
+        def find(cluster: int) -> int:
+            while parents[cluster] != cluster:
+                parents[cluster] = parents[parents[cluster]]
+                cluster = parents[cluster]
+            return cluster
+
+        for first, second in zip(
+            *np.nonzero(np.triu(1.0 - centroids @ centroids.T <= merge_threshold, 1))
+        ):
+            first, second = find(first), find(second)
+            if first != second:
+                if (sizes[second], -second) > (sizes[first], -first):
+                    first, second = second, first
+                parents[second] = first
+                sizes[first] += sizes[second]
+
+        roots = np.array([find(cluster) for cluster in range(len(labels))])
+        merged = {
+            int(labels[cluster]): int(labels[root])
+            for cluster, root in enumerate(roots)
+            if root != cluster
+        }
+        self.prototype_labels = labels[roots][inverse]
+        return merged
+
+    def _split(self, split_threshold: float) -> Dict[int, int]:
+        spread = self.prototype_spread / np.maximum(self.prototype_counts, 1e-12)
+        split = {}
+        for index in np.flatnonzero(spread > split_threshold):
+            samples = self.prototype_samples[index]
+            if len(samples) < 4:
+                continue
+            assignment, centroids = _two_means(samples)
+            if assignment.all() or not assignment.any():
+                continue
+            # Counts and spread are shared in proportion to the sampled logs
+            share = assignment.mean()
+            count = self.prototype_counts[index]
+            distances = 1.0 - np.einsum(
+                "ij,ij->i", samples, centroids[assignment.astype(int)]
+            )
+            self.prototypes[index] = centroids[0]
+            self.prototype_counts[index] = count * (1 - share)
+            self.prototype_spread[index] = (
+                distances[~assignment].mean() * count * (1 - share)
+            )
+            self.prototype_samples[index] = samples[~assignment]
+
+            new_label = int(self.prototype_labels.max()) + 1
+            self._add_prototypes(
+                centroids[1:], np.array([new_label]), counts=np.array([count * share])
+            )
+            self.prototype_spread[-1] = distances[assignment].mean() * count * share
+            self.prototype_samples[-1] = samples[assignment]
+            split[int(self.prototype_labels[index])] = new_label
+        return split
+
+
+def _centroids(
+    embeddings: np.ndarray, inverse: np.ndarray, size: int, threshold: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Centroids of normalized embeddings grouped by `inverse`.
+
+    Returns:
+        (the centroids, their thresholds widened to the cluster's radius, the
+        cosine distance of every row to its centroid)
+    """
+    centroids = np.zeros((size, embeddings.shape[1]), np.float32)
+    np.add.at(centroids, inverse, embeddings)
+    centroids = _normalize(centroids)
+    radii = np.full(size, threshold, dtype=np.float32)
+    distances = np.maximum(
+        1.0 - np.einsum("ij,ij->i", embeddings, centroids[inverse]), 0.0
+    )
+    np.maximum.at(radii, inverse, distances)
+    return centroids, radii, distances
+
+
+def _two_means(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical 2-means, seeded with the two most distant samples.
+
+    Returns:
+        (True for the samples of the second centroid, the two centroids)
+    """
+    similarities = samples @ samples.T
+    first, second = np.unravel_index(similarities.argmin(), similarities.shape)
+    centroids = samples[[first, second]]
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = (samples @ centroids.T).argmax(axis=1).astype(bool)
+        if assignment.all() or not assignment.any():
+            break
+        centroids = _normalize(
+            np.stack(
+                [samples[~assignment].mean(axis=0), samples[assignment].mean(axis=0)]
+            )
+        )
+    return assignment, centroids
@@ -14,7 +14,10 @@ llm = get_llm()
 
 
 async def cheat_sheet_context_node(state: ContextAgentState):
-    cheat_sheet_context = await get_cheat_sheet_context(state.log_summary)
+    cheat_sheet_context = state.cheat_sheet_context
+    # The alert graph retrieves it concurrently with its router
+    if cheat_sheet_context is None:
+        cheat_sheet_context = await get_cheat_sheet_context(state.log_summary)
     return Command(
         goto="loki_router_node", update={"cheat_sheet_context": cheat_sheet_context}
     )
@@ -1,6 +1,9 @@
+import asyncio
 import os
+import threading
 from typing import Optional
 
+from alm.utils.env import env_flag
 from alm.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -18,6 +21,8 @@ class RAGHandler:
     _instance: Optional["RAGHandler"] = None
     _pipeline = None
     _enabled: Optional[bool] = None
+    # Retrieval runs in worker threads, only one of them loads the index
+    _init_lock = threading.Lock()
 
     def __new__(cls):
         """Singleton pattern implementation."""
@@ -36,11 +41,15 @@ class RAGHandler:
         # Check if already initialized
         if self._enabled is not None:
             return self._pipeline
+        with self._init_lock:
+            if self._enabled is not None:
+                return self._pipeline
+            return self._load_rag_pipeline()
 
+    def _load_rag_pipeline(self):
         # Check if RAG is enabled via environment variable
-        rag_enabled_env = os.getenv("RAG_ENABLED", "true").lower()
-        if rag_enabled_env not in ["true", "1", "yes"]:
-            logger.info("RAG is disabled (RAG_ENABLED=%s)", rag_enabled_env)
+        if not env_flag("RAG_ENABLED", default=True):
+            logger.info("RAG is disabled (RAG_ENABLED=%s)", os.getenv("RAG_ENABLED"))
             self._enabled = False
             self._pipeline = None
             return None
@@ -141,6 +150,8 @@ class RAGHandler:
         3. Formats the results for LLM consumption
         4. Returns empty string if RAG is disabled or fails
 
+        The first two steps are blocking and run in a worker thread.
+
         Args:
             log_summary: Summary of the Ansible error log
 
@@ -150,7 +161,7 @@ class RAGHandler:
         logger.info("Retrieving cheat sheet context for log summary")
 
         # Initialize RAG pipeline (lazy loading)
-        pipeline = self._initialize_rag_pipeline()
+        pipeline = await asyncio.to_thread(self._initialize_rag_pipeline)
 
         if pipeline is None:
             logger.debug("RAG pipeline not available, returning empty context")
@@ -161,7 +172,7 @@ class RAGHandler:
             logger.debug(
                 "Querying RAG system with log summary: %s...", log_summary[:100]
             )
-            response = pipeline.query(log_summary)
+            response = await asyncio.to_thread(pipeline.query, log_summary)
 
             # Format results
             formatted_context = self._format_rag_results(response)
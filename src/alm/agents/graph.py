@@ -1,3 +1,6 @@
+import functools
+
+from alm.agents.get_more_context_agent.node import get_cheat_sheet_context
 from alm.agents.get_more_context_agent.state import ContextAgentState
 from alm.llm import get_llm
 from alm.agents.state import GrafanaAlertState
@@ -6,43 +9,58 @@ from alm.agents.node import (
     classify_log,
     suggest_step_by_step_solution,
     router_step_by_step_solution,
-    infer_cluster_log,
+    triage_log,
+    ainfer_cluster_log,
 )
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
 from alm.agents.get_more_context_agent.graph import more_context_agent_graph
+from alm.utils.env import env_flag
+from alm.utils.metrics import timed_node
 
 
 llm = get_llm()
 
+# Summarize, classify and route a log in one LLM call (`triage_log_node`)
+# instead of three sequential ones
+GRAPH_FUSED_TRIAGE = env_flag("GRAPH_FUSED_TRIAGE")
+# Retrieve the cheat sheet next to the router (`cheat_sheet_context_node`)
+# instead of only after it asks for more context. This saves the retrieval
+# latency on alerts that need more context and spends it on those that do not.
+GRAPH_PREFETCH_CHEAT_SHEET = env_flag("GRAPH_PREFETCH_CHEAT_SHEET")
+
 
 # Nodes
 async def cluster_logs_node(
     state: GrafanaAlertState,
 ) -> Command:
     logs = state.log_entry.message
-    log_cluster = infer_cluster_log(logs)
+    log_cluster = await ainfer_cluster_log(logs)
     return Command(goto="no_clustering_graph_node", update={"logCluster": log_cluster})
 
 
+# summarize_log_node fans out to classify_log_node and
+# router_step_by_step_solution_node (and cheat_sheet_context_node with
+# GRAPH_PREFETCH_CHEAT_SHEET), which only read the summary and so run
+# concurrently; route_step_by_step_solution_node waits for all of them.
+@timed_node
 async def summarize_log_node(
     state: GrafanaAlertState,
-) -> Command:
+) -> dict:
     log_summary = await summarize_log(state.log_entry.message, llm)
-    return Command(goto="classify_log_node", update={"logSummary": log_summary})
+    return {"logSummary": log_summary}
 
 
+@timed_node
 async def classify_log_node(
     state: GrafanaAlertState,
-) -> Command:
+) -> dict:
     log_summary = state.logSummary
     log_category = await classify_log(log_summary, llm)
-    return Command(
-        goto="router_step_by_step_solution_node",
-        update={"expertClassification": log_category},
-    )
+    return {"expertClassification": log_category}
 
 
+@timed_node
 async def suggest_step_by_step_solution_node(
     state: GrafanaAlertState,
 ) -> Command:
@@ -55,19 +73,55 @@ async def suggest_step_by_step_solution_node(
     return Command(goto=END, update={"stepByStepSolution": step_by_step_solution})
 
 
+@timed_node
 async def router_step_by_step_solution_node(
     state: GrafanaAlertState,
-) -> Command:
+) -> dict:
     log_summary = state.logSummary
     classification = await router_step_by_step_solution(log_summary, llm)
+    return {"needMoreContext": classification == "Need More Context"}
+
+
+@timed_node
+async def cheat_sheet_context_node(
+    state: GrafanaAlertState,
+) -> dict:
+    # Retrieved while the router decides, used if it asks for more context
+    cheat_sheet_context = await get_cheat_sheet_context(state.logSummary)
+    return {"cheatSheetContext": cheat_sheet_context}
+
+
+def _step_by_step_solution_node(need_more_context: bool) -> str:
+    return (
+        "get_more_context_node"
+        if need_more_context
+        else "suggest_step_by_step_solution_node"
+    )
+
+
+async def route_step_by_step_solution_node(
+    state: GrafanaAlertState,
+) -> Command:
+    return Command(goto=_step_by_step_solution_node(state.needMoreContext))
+
+
+@timed_node
+async def triage_log_node(
+    state: GrafanaAlertState,
+) -> Command:
+    triage = await triage_log(state.log_entry.message, llm)
+    need_more_context = triage.suggestion == "Need More Context"
     return Command(
-        goto="suggest_step_by_step_solution_node"
-        if classification == "No More Context Needed"
-        else "get_more_context_node",
-        update={"needMoreContext": classification == "Need More Context"},
+        goto=_step_by_step_solution_node(need_more_context),
+        update={
+            "logSummary": triage.summary,
+            "expertClassification": triage.category,
+            "needMoreContext": need_more_context,
+        },
     )
 
 
+@timed_node
 async def get_more_context_node(
     state: GrafanaAlertState,
 ) -> Command:
@@ -77,6 +131,7 @@ async def get_more_context_node(
             log_summary=log_summary,
             log_entry=state.log_entry,
             expert_classification=state.expertClassification,
+            cheat_sheet_context=state.cheatSheetContext,
         )
     )
     context_agent_state = ContextAgentState.model_validate(subgraph_state)
@@ -95,28 +150,67 @@ async def get_more_context_node(
     )
 
 
-def graph_without_clustering():
+def build_graph_without_clustering(
+    fused_triage: bool = GRAPH_FUSED_TRIAGE,
+    prefetch_cheat_sheet: bool = GRAPH_PREFETCH_CHEAT_SHEET,
+):
+    """
+    Args:
+        fused_triage: Start with `triage_log_node` instead of the summarize,
+            classify and router nodes
+        prefetch_cheat_sheet: Retrieve the cheat sheet concurrently with the
+            router, otherwise the context subgraph retrieves it when needed
+    """
     builder = StateGraph(GrafanaAlertState)
-    builder.add_edge(START, "summarize_log_node")
-    builder.add_node("summarize_log_node", summarize_log_node)
-    builder.add_node(classify_log_node)
+    if fused_triage:
+        builder.add_edge(START, "triage_log_node")
+        builder.add_node("triage_log_node", triage_log_node)
+    else:
+        builder.add_edge(START, "summarize_log_node")
+        builder.add_node("summarize_log_node", summarize_log_node)
+        builder.add_node(classify_log_node)
+        builder.add_node(router_step_by_step_solution_node)
+        builder.add_node(route_step_by_step_solution_node)
+        branches = ["classify_log_node", "router_step_by_step_solution_node"]
+        if prefetch_cheat_sheet:
+            builder.add_node(cheat_sheet_context_node)
+            branches.append("cheat_sheet_context_node")
+        for branch in branches:
+            builder.add_edge("summarize_log_node", branch)
+        builder.add_edge(branches, "route_step_by_step_solution_node")
     builder.add_node(suggest_step_by_step_solution_node)
-    builder.add_node(router_step_by_step_solution_node)
     builder.add_node(get_more_context_node)
 
     return builder.compile()
 
 
+# Compiled graphs hold no per-run state, so one instance serves every run
+@functools.cache
+def graph_without_clustering():
+    return build_graph_without_clustering()
+
+
 async def no_clustering_graph_node(state: GrafanaAlertState) -> Command:
     graph = await graph_without_clustering().ainvoke(state)
     return Command(goto=END, update=graph)
 
 
 # infernece graph
-def inference_graph():
+def build_inference_graph():
     builder = StateGraph(GrafanaAlertState)
     builder.add_edge(START, "cluster_logs_node")
     builder.add_node("cluster_logs_node", cluster_logs_node)
     builder.add_node(no_clustering_graph_node)
 
     return builder.compile()
+
+
+@functools.cache
+def inference_graph():
+    return build_inference_graph()
+
+
+def warm_up_graphs() -> None:
+    """Compile the graphs before serving, instead of on the first alert."""
+    graph_without_clustering()
+    inference_graph()
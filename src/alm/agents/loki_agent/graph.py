@@ -5,6 +5,7 @@ This subgraph handles retrieval of additional log context from Loki:
 - START → identify_missing_log_data_node → loki_execute_query_node → END
 """
 
+import asyncio
 from typing import Literal
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
@@ -14,6 +15,7 @@ from alm.agents.loki_agent.nodes import identify_missing_data
 from alm.agents.loki_agent.agent import create_loki_agent
 from alm.agents.loki_agent.schemas import LogToolOutput, LokiAgentOutput, ToolStatus
 from alm.llm import get_llm
+from alm.utils.log_compression import compress_log
 from alm.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -80,7 +82,7 @@ async def loki_execute_query_node(
         context = {
             "logSummary": state.log_summary,
             "expertClassification": state.expert_classification,
-            "logMessage": log_message,
+            "logMessage": await asyncio.to_thread(compress_log, log_message),
             "logLabels": log_labels,
             "logTimestamp": log_timestamp,
         }
@@ -1,18 +1,32 @@
-from typing import List, Optional
+from typing import Callable, List, Optional, TypeVar
+import asyncio
+import fcntl
+import functools
+import io
+import json
 import os
-from sentence_transformers import SentenceTransformer
 from sklearn.cluster import DBSCAN, MeanShift, AgglomerativeClustering
 from sklearn.metrics.pairwise import cosine_distances
 import joblib
+from scipy.sparse import csr_matrix
 from langchain_openai import ChatOpenAI
 from alm.agents.output_scheme import (
     SummarySchema,
     ClassifySchema,
     SuggestStepByStepSolutionSchema,
     RouterStepByStepSolutionSchema,
+    TriageLogSchema,
 )
 import numpy as np
-from alm.utils.minio import upload_model_to_minio
+from alm.agents.cluster_model import ClusterAssignmentModel
+from alm.patterns.template_miner import TemplateMiner
+from alm.utils.minio import (
+    download_model_from_minio,
+    download_model_with_etag_from_minio,
+    upload_bytes_to_minio,
+    upload_model_to_minio,
+    upload_model_to_minio_if_match,
+)
 import requests
 
 from alm.agents.prompts.prompts import (
@@ -25,14 +39,88 @@ from alm.agents.prompts.prompts import (
     suggest_step_by_step_solution_system_message,
     router_step_by_step_solution_user_message,
     router_step_by_step_solution_system_message,
+    triage_log_system_message,
+    triage_log_user_message,
 )
+from alm.utils.batching import MicroBatcher
+from alm.utils.embedding_cache import cached_encode
+from alm.utils.env import env_flag
+from alm.utils.encoders import get_encoder
+from alm.utils.llm_cache import cache_key, cached_llm_call, prompt_version
+from alm.utils.log_compression import compress_log
+from alm.utils.log_normalization import prepare_log_for_embedding
 from alm.utils.logger import get_logger
+from alm.utils.model_cache import CachedModel
 
 logger = get_logger(__name__)
 
+CLUSTER_MODEL_FILE_NAME = "clustering_model.joblib"
+RUN_REPORT_PREFIX = "run_reports/"
+# Max cosine distance between a log and the nearest prototype of a cluster to
+# join that cluster (see `ClusterAssignmentModel`)
+CLUSTER_ASSIGN_THRESHOLD = float(os.getenv("CLUSTER_ASSIGN_THRESHOLD", "0.3"))
+# Logs matching a template of the persisted model get its cluster without being
+# embedded (see `alm.patterns.template_miner`)
+LOG_TEMPLATE_FAST_PATH = env_flag("LOG_TEMPLATE_FAST_PATH", default=True)
+# Online cluster maintenance: max cosine distance between the centroids of two
+# clusters to merge them, and mean cosine distance of a prototype's logs from
+# which it is split (see `ClusterAssignmentModel.maintain`)
+CLUSTER_MERGE_THRESHOLD = float(os.getenv("CLUSTER_MERGE_THRESHOLD", "0.1"))
+CLUSTER_SPLIT_THRESHOLD = float(os.getenv("CLUSTER_SPLIT_THRESHOLD", "0.2"))
+# Attempts of an online model update that lost a race with another writer
+CLUSTER_UPDATE_RETRIES = 5
+# Corpus size from which DBSCAN runs on a sparse FAISS radius graph instead of
+# a dense N x N distance matrix
+DBSCAN_SPARSE_MIN_ROWS = int(os.getenv("DBSCAN_SPARSE_MIN_ROWS", "5000"))
+_RANGE_SEARCH_CHUNK_SIZE = 4096
+# Micro-batching of the cluster inference of concurrent alerts
+CLUSTER_INFERENCE_BATCH_SIZE = int(os.getenv("CLUSTER_INFERENCE_BATCH_SIZE", "32"))
+CLUSTER_INFERENCE_BATCH_WAIT_MS = float(
+    os.getenv("CLUSTER_INFERENCE_BATCH_WAIT_MS", "10")
+)
+
+
+SUMMARIZE_LOG_PROMPT_VERSION = prompt_version(
+    log_summary_system_message, log_summary_user_message
+)
+CLASSIFY_LOG_PROMPT_VERSION = prompt_version(
+    log_category_system_message, log_category_user_message
+)
+ROUTER_PROMPT_VERSION = prompt_version(
+    router_step_by_step_solution_system_message,
+    router_step_by_step_solution_user_message,
+)
+TRIAGE_LOG_PROMPT_VERSION = prompt_version(
+    triage_log_system_message, triage_log_user_message
+)
+SUGGEST_SOLUTION_PROMPT_VERSION = prompt_version(
+    suggest_step_by_step_solution_system_message,
+    suggest_step_by_step_solution_user_message,
+    suggest_step_by_step_solution_with_context_user_message,
+)
+
+
+def _model_name(llm: ChatOpenAI) -> Optional[str]:
+    return getattr(llm, "model_name", None)
+
+
+async def _prompt_log(log: str) -> str:
+    """The log compressed to its prompt token budget, off the event loop."""
+    return await asyncio.to_thread(compress_log, log)
+
 
 # Can be improve by using eval-optimizer.
 async def summarize_log(log, llm: ChatOpenAI):
+    log = await _prompt_log(log)
+    return await cached_llm_call(
+        "summarize_log",
+        cache_key("summarize_log", SUMMARIZE_LOG_PROMPT_VERSION, _model_name(llm), log),
+        lambda: _summarize_log(log, llm),
+        semantic_text=log,
+    )
+
+
+async def _summarize_log(log, llm: ChatOpenAI):
     llm_summary = llm.with_structured_output(SummarySchema)
     log_summary = await llm_summary.ainvoke(
         [
@@ -47,6 +135,17 @@ async def summarize_log(log, llm: ChatOpenAI):
 
 
 async def classify_log(log_summary, llm: ChatOpenAI):
+    return await cached_llm_call(
+        "classify_log",
+        cache_key(
+            "classify_log", CLASSIFY_LOG_PROMPT_VERSION, _model_name(llm), log_summary
+        ),
+        lambda: _classify_log(log_summary, llm),
+        semantic_text=log_summary,
+    )
+
+
+async def _classify_log(log_summary, llm: ChatOpenAI):
     llm_categorize = llm.with_structured_output(ClassifySchema)
     log_category = await llm_categorize.ainvoke(
         [
@@ -61,6 +160,20 @@ async def classify_log(log_summary, llm: ChatOpenAI):
 
 
 async def router_step_by_step_solution(log_summary: str, llm: ChatOpenAI):
+    return await cached_llm_call(
+        "router_step_by_step_solution",
+        cache_key(
+            "router_step_by_step_solution",
+            ROUTER_PROMPT_VERSION,
+            _model_name(llm),
+            log_summary,
+        ),
+        lambda: _router_step_by_step_solution(log_summary, llm),
+        semantic_text=log_summary,
+    )
+
+
+async def _router_step_by_step_solution(log_summary: str, llm: ChatOpenAI):
     llm_router_step_by_step_solution = llm.with_structured_output(
         RouterStepByStepSolutionSchema
     )
@@ -81,11 +194,66 @@ async def router_step_by_step_solution(log_summary: str, llm: ChatOpenAI):
     return router_step_by_step_solution.suggestion
 
 
+async def triage_log(log: str, llm: ChatOpenAI) -> TriageLogSchema:
+    """
+    Summarize, classify and route a log in a single structured LLM call.
+
+    Replaces `summarize_log`, `classify_log` and `router_step_by_step_solution`
+    (three sequential calls) when GRAPH_FUSED_TRIAGE is set.
+
+    Returns:
+        The summary, category and router suggestion of the log
+    """
+    log = await _prompt_log(log)
+    return await cached_llm_call(
+        "triage_log",
+        cache_key("triage_log", TRIAGE_LOG_PROMPT_VERSION, _model_name(llm), log),
+        lambda: _triage_log(log, llm),
+        semantic_text=log,
+    )
+
+
+async def _triage_log(log: str, llm: ChatOpenAI) -> TriageLogSchema:
+    llm_triage = llm.with_structured_output(TriageLogSchema)
+    return await llm_triage.ainvoke(
+        [
+            {"role": "system", "content": triage_log_system_message},
+            {
+                "role": "user",
+                "content": triage_log_user_message.format(error_log=log),
+            },
+        ]
+    )
+
+
 async def suggest_step_by_step_solution(
     log_summary: str,
     log: str,
     llm: ChatOpenAI,
     context: Optional[str] = None,
+):
+    log = await _prompt_log(log)
+    return await cached_llm_call(
+        "suggest_step_by_step_solution",
+        cache_key(
+            "suggest_step_by_step_solution",
+            SUGGEST_SOLUTION_PROMPT_VERSION,
+            _model_name(llm),
+            log_summary,
+            log,
+            context,
+        ),
+        # Exact tier only: the solution depends on the log and its context too,
+        # which an embedding of this size of input would mostly truncate away
+        lambda: _suggest_step_by_step_solution(log_summary, log, llm, context),
+    )
+
+
+async def _suggest_step_by_step_solution(
+    log_summary: str,
+    log: str,
+    llm: ChatOpenAI,
+    context: Optional[str] = None,
 ):
     llm_suggest_step_by_step_solution = llm.with_structured_output(
         SuggestStepByStepSolutionSchema
@@ -121,34 +289,100 @@ async def suggest_step_by_step_solution(
     )
 
 
-def _embed_logs(logs: List[str]):
-    model_name = os.getenv("SENTENCE_TRANSFORMER_MODEL_NAME")
-    encoder = SentenceTransformer(model_name)
-
-    embeddings = encoder.encode(
-        [summary[-50:] for summary in logs],
+def _encode(texts: List[str]) -> np.ndarray:
+    return get_encoder().encode(
+        texts,
         convert_to_numpy=True,
         show_progress_bar=True,
         # batch_size=10,
     )
+
+
+def _embed_logs(logs: List[str]):
+    # Cached embeddings skip loading the encoder and its forward pass
+    embeddings = cached_encode(
+        [prepare_log_for_embedding(log) for log in logs],
+        os.getenv("SENTENCE_TRANSFORMER_MODEL_NAME"),
+        _encode,
+    )
     logger.info("finished embeddings")
 
     return embeddings
 
 
-def _cluster_logs(embeddings: np.ndarray):
+def _radius_neighbors_graph(embeddings: np.ndarray, eps: float) -> csr_matrix:
+    """
+    Sparse cosine distance graph of all pairs within `eps`, built with FAISS.
+
+    Gives DBSCAN the same neighborhoods as the dense `cosine_distances` matrix
+    while only the neighbor pairs are held in memory. Queries run in chunks, so
+    the FAISS range search results are bounded as well.
+    """
+    import faiss
+
+    vectors = np.array(embeddings, dtype=np.float32, order="C")
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+
+    # The margin absorbs float32 rounding, the exact bound is applied below
+    min_similarity = 1.0 - eps - 1e-5
+    row_counts, indices, distances = [], [], []
+    for start in range(0, len(vectors), _RANGE_SEARCH_CHUNK_SIZE):
+        lims, similarities, neighbors = index.range_search(
+            vectors[start : start + _RANGE_SEARCH_CHUNK_SIZE], min_similarity
+        )
+        lims = lims.astype(np.int64)
+        chunk_distances = 1.0 - similarities
+        keep = chunk_distances <= eps
+        rows = np.repeat(np.arange(len(lims) - 1), np.diff(lims))
+        row_counts.append(np.bincount(rows[keep], minlength=len(lims) - 1))
+        indices.append(neighbors[keep])
+        # Zero distances (duplicates) must stay stored entries of the graph
+        distances.append(np.maximum(chunk_distances[keep], 1e-12))
+
+    indptr = np.concatenate([[0], np.cumsum(np.concatenate(row_counts))])
+    return csr_matrix(
+        (np.concatenate(distances), np.concatenate(indices), indptr),
+        shape=(len(vectors), len(vectors)),
+    )
+
+
+def _fit_predict_repeated(
+    cluster_model, embeddings: np.ndarray, sample_weight: Optional[np.ndarray]
+) -> np.ndarray:
+    """fit_predict for estimators without sample_weight.
+
+    Rows are repeated by their weight, so deduplicated logs get the clusters
+    they would get without deduplication; copies of a row always share a label.
+    """
+    if sample_weight is None:
+        return cluster_model.fit_predict(embeddings)
+    counts = np.asarray(sample_weight, dtype=np.int64)
+    cluster_labels = cluster_model.fit_predict(np.repeat(embeddings, counts, axis=0))
+    return cluster_labels[np.cumsum(counts) - counts]
+
+
+def _cluster_logs(embeddings: np.ndarray, sample_weight: Optional[np.ndarray] = None):
     algorithm = os.getenv("CLUSTERING_ALGORITHM")
     if algorithm.lower() == "dbscan":
         # DBSCAN - Good for finding clusters of varying shapes and handling noise
         # Uses cosine distance for text similarity
-        distance_matrix = cosine_distances(embeddings)
+        if len(embeddings) >= DBSCAN_SPARSE_MIN_ROWS:
+            # Sparse radius graph, memory grows with the neighbor pairs not N^2
+            distance_matrix = _radius_neighbors_graph(embeddings, eps=0.3)
+        else:
+            distance_matrix = cosine_distances(embeddings)
         cluster_model = DBSCAN(eps=0.3, min_samples=2, metric="precomputed")
-        cluster_labels = cluster_model.fit_predict(distance_matrix)
+        # Weights count duplicate logs as core samples
+        cluster_labels = cluster_model.fit_predict(
+            distance_matrix, sample_weight=sample_weight
+        )
 
     elif algorithm.lower() == "meanshift":
         # Mean Shift - Automatically determines number of clusters
         cluster_model = MeanShift(bandwidth=None)  # Auto-estimate bandwidth
-        cluster_labels = cluster_model.fit_predict(embeddings)
+        cluster_labels = _fit_predict_repeated(cluster_model, embeddings, sample_weight)
 
     elif algorithm.lower() == "agglomerative":
         # Agglomerative Clustering with distance threshold
@@ -156,7 +390,7 @@ def _cluster_logs(embeddings: np.ndarray):
         cluster_model = AgglomerativeClustering(
             n_clusters=None, distance_threshold=0.5, linkage="average", metric="cosine"
         )
-        cluster_labels = cluster_model.fit_predict(embeddings)
+        cluster_labels = _fit_predict_repeated(cluster_model, embeddings, sample_weight)
 
     else:
         raise ValueError(
@@ -165,19 +399,212 @@ def _cluster_logs(embeddings: np.ndarray):
     return cluster_model, cluster_labels
 
 
-def infer_cluster_log(log: str):
-    embeddings = _embed_logs([log])
-    if os.getenv("CLUSTERING_HOST"):
-        response = requests.post(
-            f"{os.getenv('CLUSTERING_HOST')}:{os.getenv('CLUSTERING_PORT')}/cluster",
-            json={"embeddings": embeddings.tolist()},
+def persist_cluster_model(cluster_model: ClusterAssignmentModel) -> None:
+    """Persist the cluster assignment model to MinIO, or to TMP_CLUSTER_MODEL_PATH."""
+    artifact = cluster_model.to_artifact()
+    if os.getenv("MINIO_BUCKET_NAME"):
+        upload_model_to_minio(
+            artifact, os.getenv("MINIO_BUCKET_NAME"), CLUSTER_MODEL_FILE_NAME
         )
-        label_as_int = response.json()["labels"][0]
     else:
-        cluster_model = joblib.load(os.getenv("TMP_CLUSTER_MODEL_PATH"))
-        cluster_label = cluster_model.predict(embeddings)
-        label_as_int = cluster_label.tolist()[0]
-    return str(label_as_int)
+        # Write aside and rename, so readers never load a partially written file
+        model_path = os.getenv("TMP_CLUSTER_MODEL_PATH")
+        joblib.dump(artifact, f"{model_path}.tmp")
+        os.replace(f"{model_path}.tmp", model_path)
+
+
+def save_run_report(report: dict, file_name: str) -> str:
+    """Save a pipeline run report next to the clustering model.
+
+    Returns:
+        Location the report was written to
+    """
+    data = json.dumps(report, indent=2).encode()
+    if os.getenv("MINIO_BUCKET_NAME"):
+        bucket_name = os.getenv("MINIO_BUCKET_NAME")
+        upload_bytes_to_minio(data, bucket_name, f"{RUN_REPORT_PREFIX}{file_name}")
+        return f"minio://{bucket_name}/{RUN_REPORT_PREFIX}{file_name}"
+    model_dir = os.path.dirname(os.path.abspath(os.getenv("TMP_CLUSTER_MODEL_PATH")))
+    path = os.path.join(model_dir, RUN_REPORT_PREFIX, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+    return path
+
+
+def _load_cluster_assignment_model(artifact) -> ClusterAssignmentModel:
+    return ClusterAssignmentModel.from_artifact(artifact, CLUSTER_ASSIGN_THRESHOLD)
+
+
+def load_cluster_model() -> Optional[ClusterAssignmentModel]:
+    """Load the persisted cluster assignment model, or None if there is none yet."""
+    if os.getenv("MINIO_BUCKET_NAME"):
+        artifact = download_model_from_minio(
+            os.getenv("MINIO_BUCKET_NAME"), CLUSTER_MODEL_FILE_NAME
+        )
+    else:
+        model_path = os.getenv("TMP_CLUSTER_MODEL_PATH")
+        if not model_path or not os.path.exists(model_path):
+            return None
+        artifact = joblib.load(model_path)
+    if artifact is None:
+        return None
+    return _load_cluster_assignment_model(artifact)
+
+
+T = TypeVar("T")
+
+
+def update_cluster_model(update: Callable[[ClusterAssignmentModel], T]) -> T:
+    """
+    Apply an update to the persisted cluster model and persist it.
+
+    Writers are serialized so concurrent replicas do not overwrite each other's
+    updates: a local model file is locked while it is updated, and a MinIO model
+    is written back with a conditional put on the ETag it was loaded with (S3
+    If-Match), which fails if another writer persisted the model in between;
+    the update is then applied again to the newer model.
+
+    Args:
+        update: Function updating the model in place; it may run more than once
+
+    Returns:
+        The result of `update` on the model that was persisted
+    """
+    if not os.getenv("MINIO_BUCKET_NAME"):
+        model_path = os.getenv("TMP_CLUSTER_MODEL_PATH")
+        with open(f"{model_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            cluster_model = load_cluster_model()
+            if cluster_model is None:
+                raise FileNotFoundError(f"No cluster model at {model_path}")
+            result = update(cluster_model)
+            persist_cluster_model(cluster_model)
+            return result
+
+    bucket_name = os.getenv("MINIO_BUCKET_NAME")
+    for attempt in range(CLUSTER_UPDATE_RETRIES):
+        loaded = download_model_with_etag_from_minio(
+            bucket_name, CLUSTER_MODEL_FILE_NAME
+        )
+        if loaded is None:
+            raise FileNotFoundError(
+                f"No cluster model {CLUSTER_MODEL_FILE_NAME} in bucket {bucket_name}"
+            )
+        artifact, etag = loaded
+        cluster_model = _load_cluster_assignment_model(artifact)
+        result = update(cluster_model)
+        if upload_model_to_minio_if_match(
+            cluster_model.to_artifact(), bucket_name, CLUSTER_MODEL_FILE_NAME, etag
+        ):
+            return result
+        logger.info("cluster model changed during update, retrying (%d)", attempt + 1)
+    raise RuntimeError(
+        f"Cluster model update lost {CLUSTER_UPDATE_RETRIES} races with other writers"
+    )
+
+
+def cluster_new_logs(embeddings: np.ndarray) -> np.ndarray:
+    """Cluster embeddings that fit no existing cluster, without saving a model."""
+    if len(embeddings) < 2:
+        return np.zeros(len(embeddings), dtype=int)
+    try:
+        _, cluster_labels = _cluster_logs(embeddings)
+    except ValueError as e:
+        # e.g. mean shift cannot estimate a bandwidth for identical points
+        logger.warning("clustering new logs failed (%s), one cluster per log", e)
+        return np.arange(len(embeddings))
+    cluster_labels = _handle_outlaier_cluster(cluster_labels)
+    # Make the labels consecutive from 0
+    return np.unique(cluster_labels, return_inverse=True)[1]
+
+
+@functools.cache
+def _cluster_model_cache() -> CachedModel:
+    """Process-wide cache of the clustering model used for inference."""
+    if os.getenv("MINIO_BUCKET_NAME"):
+        return CachedModel(
+            bucket_name=os.getenv("MINIO_BUCKET_NAME"),
+            file_name=CLUSTER_MODEL_FILE_NAME,
+            load=_load_cluster_assignment_model,
+        )
+    return CachedModel(
+        path=os.getenv("TMP_CLUSTER_MODEL_PATH"), load=_load_cluster_assignment_model
+    )
+
+
+def template_cluster_labels(
+    cluster_model: Optional[ClusterAssignmentModel], logs: List[str]
+) -> List[Optional[str]]:
+    """Cluster of every log whose template maps to one, None for the rest."""
+    if (
+        not LOG_TEMPLATE_FAST_PATH
+        or cluster_model is None
+        or cluster_model.template_miner is None
+    ):
+        return [None] * len(logs)
+    return cluster_model.template_miner.lookup_many(logs)
+
+
+def infer_cluster_logs(logs: List[str]) -> List[str]:
+    """
+    Predict the clusters of logs.
+
+    Logs matching a known template get its cluster directly, the others are
+    embedded and predicted with one batched call each. Logs too far from every
+    known cluster get the NEW_CLUSTER label.
+    """
+    # The clustering service holds the model unless it is shared through MinIO
+    if os.getenv("MINIO_BUCKET_NAME") or not os.getenv("CLUSTERING_HOST"):
+        labels = template_cluster_labels(_cluster_model_cache().get(), logs)
+    else:
+        labels = [None] * len(logs)
+    pending = [index for index, label in enumerate(labels) if label is None]
+    if pending:
+        predicted = _predict_cluster_logs([logs[index] for index in pending])
+        for index, label in zip(pending, predicted):
+            labels[index] = label
+    return labels
+
+
+def _predict_cluster_logs(logs: List[str]) -> List[str]:
+    embeddings = _embed_logs(logs)
+    if os.getenv("CLUSTERING_HOST"):
+        # npy body, parsing JSON floats costs more than the prediction
+        with io.BytesIO() as buffer:
+            np.save(buffer, np.asarray(embeddings, dtype=np.float32))
+            response = requests.post(
+                f"{os.getenv('CLUSTERING_HOST')}:{os.getenv('CLUSTERING_PORT')}/cluster",
+                data=buffer.getvalue(),
+                headers={"Content-Type": "application/x-npy"},
+            )
+        response.raise_for_status()
+        labels = response.json()["labels"]
+    else:
+        cluster_model = _cluster_model_cache().get()
+        labels = cluster_model.predict(embeddings).tolist()
+    return [str(label) for label in labels]
+
+
+def infer_cluster_log(log: str):
+    return infer_cluster_logs([log])[0]
+
+
+async def _infer_cluster_batch(logs: List[str]) -> List[str]:
+    return await asyncio.to_thread(infer_cluster_logs, logs)
+
+
+# Shared by all concurrent alerts, see `ainfer_cluster_log`
+cluster_inference_batcher = MicroBatcher(
+    _infer_cluster_batch,
+    max_batch_size=CLUSTER_INFERENCE_BATCH_SIZE,
+    max_wait_ms=CLUSTER_INFERENCE_BATCH_WAIT_MS,
+)
+
+
+async def ainfer_cluster_log(log: str) -> str:
+    """Cluster one log, micro-batched with the logs of concurrent alerts."""
+    return await cluster_inference_batcher.submit(log)
 
 
 def _handle_outlaier_cluster(cluster_labels: np.ndarray):
@@ -197,6 +624,54 @@ def _handle_outlaier_cluster(cluster_labels: np.ndarray):
     return cluster_labels
 
 
+def train_cluster_embeddings(
+    embeddings: np.ndarray,
+    save_cluster_model: bool = True,
+    sample_weight: Optional[np.ndarray] = None,
+    template_miner: Optional[TemplateMiner] = None,
+    template_ids: Optional[List[int]] = None,
+) -> List[int]:
+    """
+    Train the clustering model on precomputed embeddings.
+
+    Args:
+        embeddings: Embedding matrix, one row per log
+        save_cluster_model: Persist the trained model (MinIO or local file)
+        sample_weight: Number of logs each row stands for, when the rows are
+            deduplicated logs
+        template_miner: Templates of the logs, persisted with the model and
+            mapped to the clusters of their logs
+        template_ids: Template id of every row in `template_miner`
+
+    Returns:
+        List of cluster labels for each row (same order as input)
+    """
+    if len(embeddings) == 0:
+        return []
+
+    # Train clustering model
+    cluster_model, cluster_labels = _cluster_logs(embeddings, sample_weight)
+
+    # handle outlaier cluster
+    cluster_labels = _handle_outlaier_cluster(cluster_labels)
+
+    if save_cluster_model:
+        assignment_model = ClusterAssignmentModel.from_clustering(
+            cluster_model,
+            embeddings,
+            cluster_labels,
+            threshold=CLUSTER_ASSIGN_THRESHOLD,
+            algorithm=os.getenv("CLUSTERING_ALGORITHM"),
+            sample_weight=sample_weight,
+        )
+        if template_miner is not None:
+            template_miner.assign_clusters(template_ids, cluster_labels)
+            assignment_model.template_miner = template_miner
+        persist_cluster_model(assignment_model)
+
+    return cluster_labels.tolist()
+
+
 # TODO export it to be service that is deployed once, and been called from diffrent api requests.
 # Deploy it as service.
 def train_embed_and_cluster_logs(
@@ -218,18 +693,4 @@ def train_embed_and_cluster_logs(
     # Embed logs
     embeddings = _embed_logs(logs)
 
-    # Train clustering model
-    cluster_model, cluster_labels = _cluster_logs(embeddings)
-
-    # handle outlaier cluster
-    cluster_labels = _handle_outlaier_cluster(cluster_labels)
-
-    if save_cluster_model:
-        if os.getenv("MINIO_BUCKET_NAME"):
-            upload_model_to_minio(
-                cluster_model, os.getenv("MINIO_BUCKET_NAME"), "clustering_model.joblib"
-            )
-        else:
-            joblib.dump(cluster_model, os.getenv("TMP_CLUSTER_MODEL_PATH"))
-
-    return cluster_labels.tolist()
+    return train_cluster_embeddings(embeddings, save_cluster_model=save_cluster_model)
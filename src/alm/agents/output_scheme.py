@@ -8,17 +8,21 @@ class SummarySchema(BaseModel):
     summary: str = Field(description="Summary of the log")
 
 
+LogCategory = Literal[
+    "Cloud Infrastructure / AWS Engineers",
+    "Kubernetes / OpenShift Cluster Admins",
+    "DevOps / CI/CD Engineers (Ansible + Automation Platform)",
+    "Networking / Security Engineers",
+    "System Administrators / OS Engineers",
+    "Application Developers / GitOps / Platform Engineers",
+    "Identity & Access Management (IAM) Engineers",
+    "Other / Miscellaneous",
+]
+ContextSuggestion = Literal["No More Context Needed", "Need More Context"]
+
+
 class ClassifySchema(BaseModel):
-    category: Literal[
-        "Cloud Infrastructure / AWS Engineers",
-        "Kubernetes / OpenShift Cluster Admins",
-        "DevOps / CI/CD Engineers (Ansible + Automation Platform)",
-        "Networking / Security Engineers",
-        "System Administrators / OS Engineers",
-        "Application Developers / GitOps / Platform Engineers",
-        "Identity & Access Management (IAM) Engineers",
-        "Other / Miscellaneous",
-    ] = Field(description="Category of the log")
+    category: LogCategory = Field(description="Category of the log")
 
 
 class SuggestStepByStepSolutionSchema(BaseModel):
@@ -31,6 +35,15 @@ class SuggestStepByStepSolutionSchema(BaseModel):
 
 
 class RouterStepByStepSolutionSchema(BaseModel):
-    suggestion: Literal["No More Context Needed", "Need More Context"] = Field(
+    suggestion: ContextSuggestion = Field(
         description="The suggestion for the step by step solution: 'No More Context Needed' if the solution is straightforward, 'Need More Context' if the solution is complex"
     )
+
+
+# summary, category and router suggestion of a log in a single LLM call
+class TriageLogSchema(BaseModel):
+    summary: str = Field(description="Summary of the log")
+    category: LogCategory = Field(description="Category of the log summary")
+    suggestion: ContextSuggestion = Field(
+        description="'Need More Context' if the log summary alone is not enough to solve the error, otherwise 'No More Context Needed'"
+    )
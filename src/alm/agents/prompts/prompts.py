@@ -49,3 +49,28 @@ router_step_by_step_solution_user_message = """**Error Log Summary:**
 ```
 
 **Classification:**"""
+
+# One call for summarize, classify and router: the three prompts as sections
+triage_log_system_message = f"""You are an expert in Ansible troubleshooting. Analyze the Ansible error log you are given and return three fields in one response:
+
+1. `summary`: the log summary, as described in the "Summary" section
+2. `category`: the category of your summary, as described in the "Category" section
+3. `suggestion`: the router classification of your summary, as described in the "Router" section
+
+Write the summary first, then decide the category and the router classification from the summary.
+
+# Summary
+
+{log_summary_system_message}
+
+# Category
+
+{log_category_system_message}
+
+# Router
+
+{router_step_by_step_solution_system_message}"""
+triage_log_user_message = """ansible_log_error:
+```
+{error_log}
+```"""
@@ -25,6 +25,9 @@ class GrafanaAlertState(BaseModel):
     stepByStepSolution: Optional[str] = Field(
         default=None, description="Step by step solution to the problem"
     )
+    cheatSheetContext: Optional[str] = Field(
+        default=None, description="Context from the cheat sheet, fetched ahead"
+    )
     contextForStepByStepSolution: Optional[str] = Field(
         default=None, description="Context for the step by step solution"
     )
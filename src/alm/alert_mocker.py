@@ -5,55 +5,41 @@ from pathlib import Path
 from typing import Optional
 
 from alm.models import GrafanaAlert, LogLabels, LogLevel
-from alm.patterns.ingestion import (
-    TESTING_LOG_ERROR,
-    TESTING_LOG_FATAL,
-    TESTING_LOG_FAILED,
+from alm.patterns.scanner import (
+    find_last_alert_match,
+    find_last_alert_match_in_file,
+)
+from alm.utils.log_compression import (
+    CHARS_PER_TOKEN,
+    character_offsets,
+    compress_log,
 )
 from alm.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-
-def _filter_matches_end_with_ignoring(matches: list[re.Match]) -> list[re.Match]:
-    """Filter matches that end with 'ignoring'."""
-    return [
-        match
-        for match in matches
-        if not match.groupdict().get("logmessage", "").endswith("ignoring")
-    ]
+SHRUNK_LOG_CHARS = 5_000
+# Version of the alert parsed from a job log; bump it whenever the parsing or
+# shrinking changes, so cached parse results are invalidated
+ALERT_PARSER_VERSION = 1
 
 
 def shrink_long_logs(log: str) -> str:
     """Shrink long logs."""
-    # used for very long logs that have a lot of redundent data
-    # This should be improve later to be more accurate
-    # TODO: improve this
-    # NOTE: see the 20_000 char trim
-    return log[:5_000]
-
-
-def grafana_alert_mock(path: str) -> Optional[GrafanaAlert]:
-    """Mock the Grafana alerting system."""
-    with open(path, "r") as file:
-        content = file.read()
-    matches = _filter_matches_end_with_ignoring(
-        list(re.finditer(TESTING_LOG_ERROR, content, re.MULTILINE))
+    # used for very long logs that have a lot of redundent data: repeated
+    # lines, stack traces and JSON blobs are collapsed, and the head, the error
+    # and the tail are kept within SHRUNK_LOG_CHARS
+    return compress_log(
+        log, SHRUNK_LOG_CHARS // CHARS_PER_TOKEN, token_offsets=character_offsets
     )
 
-    if not matches:
-        matches = _filter_matches_end_with_ignoring(
-            re.finditer(TESTING_LOG_FATAL, content, re.MULTILINE)
-        )
-        if not matches:
-            if not matches:
-                matches = _filter_matches_end_with_ignoring(
-                    re.finditer(TESTING_LOG_FAILED, content, re.MULTILINE)
-                )
-            return None
 
-    # Get the last match
-    last_match = matches[-1]
+def alert_from_match(
+    last_match: Optional[re.Match], filename: str
+) -> Optional[GrafanaAlert]:
+    """Build a GrafanaAlert from the record found in a job log."""
+    if last_match is None:
+        return None
     groups = last_match.groupdict()
 
     # Create GrafanaAlert instance with extracted data
@@ -70,7 +56,7 @@ def grafana_alert_mock(path: str) -> Optional[GrafanaAlert]:
             detected_level=LogLevel.ERROR
             if groups.get("status", "error") == "error"
             else LogLevel.WARN,
-            filename=Path(path).name,
+            filename=filename,
             job=groups.get("job", "").strip(),
             service_name=groups.get("host", "").strip(),
         ).model_dump(),
@@ -79,6 +65,17 @@ def grafana_alert_mock(path: str) -> Optional[GrafanaAlert]:
     return alert
 
 
+def alert_from_log(content: str, filename: str) -> Optional[GrafanaAlert]:
+    """Build a GrafanaAlert from the content of a job log."""
+    return alert_from_match(find_last_alert_match(content), filename)
+
+
+def grafana_alert_mock(path: str) -> Optional[GrafanaAlert]:
+    """Mock the Grafana alerting system."""
+    # Scan from the end of the file instead of reading huge job logs fully
+    return alert_from_match(find_last_alert_match_in_file(path), Path(path).name)
+
+
 def ingest_alerts(directory: str) -> list[GrafanaAlert]:
     """Ingest alerts from a directory."""
     alerts = []
@@ -1,18 +1,26 @@
 from __future__ import annotations
 
 import os
+import time
 from datetime import datetime
-from typing import Generator
+from typing import Generator, List
 
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 from alm.models import GrafanaAlert
 from alm.agents.state import GrafanaAlertState
 from alm.models import LogEntry
+from alm.utils.db_migrations import add_missing_columns, fill_log_hashes
+from alm.utils.dedup import log_message_hash
 from alm.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Rows per bulk write; capped below by the 32767 bind parameter limit of postgres
+ALERT_UPSERT_CHUNK_SIZE = int(os.getenv("ALERT_UPSERT_CHUNK_SIZE", "1000"))
+_MAX_BIND_PARAMS = 32767
+
 # Create SQLModel engine
 engine = create_async_engine(
     os.getenv("DATABASE_URL")
@@ -28,6 +36,9 @@ async def init_tables(delete_tables=False):
             logger.info("Starting to delete tables")
             await conn.run_sync(GrafanaAlert.metadata.drop_all)
         await conn.run_sync(GrafanaAlert.metadata.create_all)
+        # create_all leaves existing tables as they are (incremental runs)
+        await conn.run_sync(add_missing_columns, GrafanaAlert.metadata)
+        await conn.run_sync(fill_log_hashes)
 
 
 def get_session():
@@ -40,10 +51,74 @@ async def get_session_gen() -> Generator[AsyncSession, None, None]:
         yield session
 
 
+async def bulk_upsert_alerts(
+    alerts: List[GrafanaAlert], chunk_size: int = ALERT_UPSERT_CHUNK_SIZE
+) -> int:
+    """Write alerts in chunks, one session and transaction per chunk.
+
+    Alerts without an id are inserted with multi-row INSERTs and get their new
+    id assigned back. Alerts that already have an id are upserted with a
+    multi-row INSERT ... ON CONFLICT (id) DO UPDATE.
+    Missing log hashes are filled in before writing.
+
+    Returns:
+        Number of rows written
+    """
+    if not alerts:
+        return 0
+
+    table = GrafanaAlert.__table__
+    columns = [column.name for column in table.columns if column.name != "id"]
+    chunk_size = max(1, min(chunk_size, _MAX_BIND_PARAMS // (len(columns) + 1)))
+
+    insert_stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    start_time = time.perf_counter()
+    for start in range(0, len(alerts), chunk_size):
+        chunk = alerts[start : start + chunk_size]
+        new_alerts = [alert for alert in chunk if alert.id is None]
+        existing_alerts = [alert for alert in chunk if alert.id is not None]
+        for alert in chunk:
+            if alert.logHash is None:
+                alert.logHash = log_message_hash(alert.logMessage)
+
+        async with get_session() as db:
+            if new_alerts:
+                # Rendered as multi-row INSERTs; the returned ids keep input order
+                result = await db.execute(
+                    insert_stmt,
+                    [alert.model_dump(include=set(columns)) for alert in new_alerts],
+                )
+                for alert, alert_id in zip(new_alerts, result.scalars().all()):
+                    alert.id = alert_id
+            if existing_alerts:
+                upsert_stmt = insert(table).values(
+                    [
+                        alert.model_dump(include={"id", *columns})
+                        for alert in existing_alerts
+                    ]
+                )
+                upsert_stmt = upsert_stmt.on_conflict_do_update(
+                    index_elements=[table.c.id],
+                    set_={name: upsert_stmt.excluded[name] for name in columns},
+                )
+                await db.execute(upsert_stmt)
+            await db.commit()
+
+    elapsed_time = time.perf_counter() - start_time
+    logger.info(
+        "bulk upserted %d alerts - Time: %.2fs (%.0f rows/sec)",
+        len(alerts),
+        elapsed_time,
+        len(alerts) / elapsed_time if elapsed_time > 0 else float("inf"),
+    )
+    return len(alerts)
+
+
 def convert_state_to_grafana_alert(state: dict) -> GrafanaAlert:
     return GrafanaAlert(
         logTimestamp=datetime.fromisoformat(state["log_entry"].timestamp),
         logMessage=state["log_entry"].message,
+        logHash=log_message_hash(state["log_entry"].message),
         logSummary=state["logSummary"],
         expertClassification=state["expertClassification"],
         logCluster=state["logCluster"],
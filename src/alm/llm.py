@@ -1,6 +1,36 @@
+"""
+LLM client factory.
+
+`get_llm` returns a ChatOpenAI client. With LLM_MODE set to `record` every
+response is also stored, keyed by a hash of the prompt and call options. With
+LLM_MODE set to `replay` the stored responses are served locally after a
+synthetic latency and no LLM endpoint is needed, so the pipelines can be
+benchmarked end-to-end without paying for LLM calls. Structured outputs and tool
+calls are both replayed, since they are recorded at the chat message level.
+
+Environment Variables:
+    LLM_MODE: live, record or replay. Default: live
+    LLM_RECORDINGS_PATH: Recorded responses. Default: $DATA_DIR/llm_recordings.sqlite
+    LLM_REPLAY_LATENCY_MS: Mean synthetic latency of a replayed call. Default: 0
+    LLM_REPLAY_LATENCY_JITTER_MS: Uniform jitter around the mean. Default: 0
+"""
+
+import asyncio
+import hashlib
+import json
 import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
 from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from alm.utils.metrics import TokenUsageCallback
+from alm.utils.sqlite_store import SQLiteStore
 
 # Constants for API configuration
 API_KEY: str = os.getenv("OPENAI_API_TOKEN")
@@ -10,7 +40,23 @@ BASE_URL: str = os.getenv("OPENAI_API_ENDPOINT")
 MODEL: str = os.getenv("OPENAI_MODEL")
 TEMPERATURE: float = float(os.getenv("OPENAI_TEMPERATURE"))
 
-if not API_KEY or not BASE_URL:
+# Record / replay configuration
+LLM_MODE: str = os.getenv("LLM_MODE", "live").lower()
+LLM_RECORDINGS_PATH: str = os.getenv(
+    "LLM_RECORDINGS_PATH",
+    str(Path(os.getenv("DATA_DIR", "./data")) / "llm_recordings.sqlite"),
+)
+LLM_REPLAY_LATENCY_MS: float = float(os.getenv("LLM_REPLAY_LATENCY_MS", "0"))
+LLM_REPLAY_LATENCY_JITTER_MS: float = float(
+    os.getenv("LLM_REPLAY_LATENCY_JITTER_MS", "0")
+)
+
+if LLM_MODE not in ("live", "record", "replay"):
+    raise ValueError(
+        f"Unsupported LLM_MODE: {LLM_MODE}. Choose from 'live', 'record', 'replay'"
+    )
+
+if LLM_MODE != "replay" and (not API_KEY or not BASE_URL):
     raise ValueError(
         "OpenAI API configuration not found. Please set both OPENAI_API_TOKEN and OPENAI_API_ENDPOINT environment variables."
     )
@@ -19,12 +65,114 @@ if not API_KEY or not BASE_URL:
 
 # set_debug(True)  # Enables LangChain debug mode globally
 
+_recordings: Dict[str, SQLiteStore] = {}
+
+
+def _recordings_store(path: str) -> SQLiteStore:
+    if path not in _recordings:
+        _recordings[path] = SQLiteStore(path, table="llm_responses")
+    return _recordings[path]
+
+
+class RecordReplayChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that records its responses or replays recorded ones."""
+
+    llm_mode: str = "record"
+    recordings_path: str = LLM_RECORDINGS_PATH
+    replay_latency_ms: float = LLM_REPLAY_LATENCY_MS
+    replay_latency_jitter_ms: float = LLM_REPLAY_LATENCY_JITTER_MS
+
+    def _recording_key(self, messages: List[BaseMessage], stop, kwargs: dict) -> str:
+        prompt = {
+            "model": self.model_name,
+            "temperature": self.temperature,
+            # Message ids and response metadata differ between runs
+            "messages": [
+                {
+                    "type": message.type,
+                    "content": message.content,
+                    "tool_calls": getattr(message, "tool_calls", None),
+                    "tool_call_id": getattr(message, "tool_call_id", None),
+                }
+                for message in messages
+            ],
+            "stop": stop,
+            # Structured output schema, tools, ...
+            "options": kwargs,
+        }
+        payload = json.dumps(prompt, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _replay(self, key: str) -> ChatResult:
+        recorded = _recordings_store(self.recordings_path).get(key)
+        if recorded is None:
+            raise LookupError(
+                f"No recorded LLM response for prompt {key} in {self.recordings_path}, "
+                "record it first with LLM_MODE=record"
+            )
+        return ChatResult(
+            generations=[
+                ChatGeneration(message=message)
+                for message in messages_from_dict(recorded["messages"])
+            ],
+            llm_output={"model_name": self.model_name, "replayed": True},
+        )
+
+    def _record(self, key: str, result: ChatResult) -> None:
+        messages = []
+        for generation in result.generations:
+            message = generation.message.model_copy(deep=True)
+            # Parsed structured output is stored as a dict, which the output
+            # parser accepts too
+            parsed = message.additional_kwargs.get("parsed")
+            if isinstance(parsed, BaseModel):
+                message.additional_kwargs["parsed"] = parsed.model_dump()
+            messages.append(message)
+        _recordings_store(self.recordings_path).put(
+            key, {"messages": messages_to_dict(messages)}
+        )
+
+    def _replay_latency(self) -> float:
+        jitter = random.uniform(
+            -self.replay_latency_jitter_ms, self.replay_latency_jitter_ms
+        )
+        return max(0.0, self.replay_latency_ms + jitter) / 1000
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._recording_key(messages, stop, kwargs)
+        if self.llm_mode == "replay":
+            time.sleep(self._replay_latency())
+            return self._replay(key)
+        result = super()._generate(messages, stop, run_manager, **kwargs)
+        self._record(key, result)
+        return result
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        key = self._recording_key(messages, stop, kwargs)
+        if self.llm_mode == "replay":
+            await asyncio.sleep(self._replay_latency())
+            return self._replay(key)
+        result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+        self._record(key, result)
+        return result
+
 
-def get_llm(model: str = MODEL, temperature: float = TEMPERATURE):
-    llm = ChatOpenAI(
+def get_llm(
+    model: str = MODEL, temperature: float = TEMPERATURE, mode: Optional[str] = None
+):
+    mode = (mode or LLM_MODE).lower()
+    options: Dict[str, Any] = dict(
         api_key=API_KEY,
         base_url=BASE_URL,
         model=model,
         temperature=temperature,
+        callbacks=[TokenUsageCallback()],
     )
-    return llm
+    if mode == "live":
+        return ChatOpenAI(**options)
+    if mode == "replay":
+        # Replayed calls never reach the endpoint
+        options["api_key"] = API_KEY or "replay"
+    return RecordReplayChatOpenAI(llm_mode=mode, **options)
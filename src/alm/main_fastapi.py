@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import asyncio
 import importlib
+import os
 import pkgutil
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional
 
 from dotenv import load_dotenv
 from fastapi import APIRouter, FastAPI
+from alm.utils.env import env_flag
 from alm.utils.phoenix import register_phoenix
 from alm.utils.logger import configure_logging
 
@@ -18,8 +22,24 @@ load_dotenv()
 register_phoenix()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the alert encoder before serving, instead of on the first alert
+    if os.getenv("SENTENCE_TRANSFORMER_MODEL_NAME"):
+        from alm.utils.encoders import warm_up_encoder
+
+        await asyncio.to_thread(warm_up_encoder)
+    if env_flag("GRAPH_WARM_UP", default=True):
+        from alm.agents.graph import warm_up_graphs
+
+        warm_up_graphs()
+    yield
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="Ansible Logs Monitoring API", version="0.1.0")
+    app = FastAPI(
+        title="Ansible Logs Monitoring API", version="0.1.0", lifespan=lifespan
+    )
 
     _include_route_modules(app)
 
@@ -23,6 +23,11 @@ class GrafanaAlert(SQLModel, table=True):
         default_factory=datetime.now, description="Timestamp of the log message"
     )
     logMessage: str = Field(description="Original log message that triggered the alert")
+    logHash: Optional[str] = Field(
+        default=None,
+        index=True,
+        description="Hash of the whitespace-normalized log message",
+    )
     logSummary: str = Field(
         default="No summary available", description="Summary of the log message"
     )
@@ -46,6 +51,17 @@ class GrafanaAlert(SQLModel, table=True):
     )
 
 
+# Fields produced by the agent graph that are copied from the cluster
+# representative to every alert of the cluster.
+CLUSTER_RESULT_FIELDS = (
+    "logSummary",
+    "expertClassification",
+    "needMoreContext",
+    "stepByStepSolution",
+    "contextForStepByStepSolution",
+)
+
+
 # Input models
 class LogLevel(str, Enum):
     ERROR = "error"
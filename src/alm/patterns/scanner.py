@@ -0,0 +1,122 @@
+"""Scanners that locate the record an alert is built from in a job log."""
+
+import locale
+import mmap
+import re
+from typing import Optional
+
+from alm.patterns.ingestion import TESTING_LOG_ERROR, TESTING_LOG_FATAL
+
+# Record types an alert is built from, in order of preference: the last error
+# record wins, otherwise the last fatal one. Each entry is the literal prefix
+# every record starts with and the full record pattern.
+ALERT_RECORDS = (
+    ("error: [", re.compile(TESTING_LOG_ERROR, re.MULTILINE)),
+    ("fatal: [", re.compile(TESTING_LOG_FATAL, re.MULTILINE)),
+)
+
+TAIL_BLOCK_SIZE = 1 << 20
+
+
+def _last_record_match(
+    content: str, prefix: str, pattern: re.Pattern, start: int = 0, end: int = None
+) -> Optional[re.Match]:
+    """Last match of `pattern` in content[start:end], as `re.finditer` finds it.
+
+    Candidates are located with a literal search for the record prefix and the
+    pattern is only matched at those positions, skipping positions that lie
+    inside the previous match. Records whose message ends with 'ignoring' are
+    skipped.
+    """
+    end = len(content) if end is None else end
+    last_match = None
+    next_start = start
+    position = content.find(prefix, start, end)
+    while position != -1:
+        if position >= next_start:
+            match = pattern.match(content, position, end)
+            if match is not None:
+                next_start = match.end()
+                if not match.group("logmessage").endswith("ignoring"):
+                    last_match = match
+        position = content.find(prefix, position + 1, end)
+    return last_match
+
+
+def find_last_alert_match(
+    content: str, start: int = 0, end: Optional[int] = None
+) -> Optional[re.Match]:
+    """Find the record an alert is built from in a single sweep per record type.
+
+    Args:
+        content: Log text
+        start: Position to start scanning from
+        end: Position to stop scanning at (defaults to the end of `content`)
+    """
+    for prefix, pattern in ALERT_RECORDS:
+        match = _last_record_match(content, prefix, pattern, start, end)
+        if match is not None:
+            return match
+    return None
+
+
+def _sync_point(data: mmap.mmap, prefix: bytes, before: int) -> int:
+    """Largest line start <= `before` that no record match can straddle.
+
+    A record match runs from its prefix through the host (up to the first ']')
+    and then at most to the end of the line holding the first '{' after it.
+    So the line start right after a line with a '{' at `brace` is safe, unless
+    a record starting after the last ']' before that brace could still reach
+    past it.
+    """
+    brace = data.rfind(b"{", 0, before)
+    while brace != -1:
+        newline = data.find(b"\n", brace)
+        if newline != -1 and newline + 1 <= before:
+            bracket = data.rfind(b"]", 0, max(0, brace - 2))
+            risky_from = max(0, bracket - 7) if bracket != -1 else 0
+            if data.find(prefix, risky_from, newline + 1) == -1:
+                return newline + 1
+        brace = data.rfind(b"{", 0, brace)
+    return 0
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    # Same decoding and newline translation as open(path, "r")
+    return data.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+
+
+def find_last_alert_match_in_file(
+    path: str, block_size: int = TAIL_BLOCK_SIZE
+) -> Optional[re.Match]:
+    """Memory-map a log file and search it backwards for the alert record.
+
+    The file is scanned from EOF in blocks that start at safe line boundaries
+    (see `_sync_point`), so the result is identical to running
+    `find_last_alert_match` on the whole file while the cost is proportional to
+    the distance of the record from EOF. Blocks without a record prefix are
+    never decoded. The returned match refers to the decoded block only.
+    """
+    encoding = locale.getpreferredencoding(False)
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for prefix, pattern in ALERT_RECORDS:
+                prefix_bytes = prefix.encode()
+                region_end = len(data)
+                while region_end > 0:
+                    last_candidate = data.rfind(prefix_bytes, 0, region_end)
+                    if last_candidate == -1:
+                        break
+                    region_start = _sync_point(
+                        data,
+                        prefix_bytes,
+                        min(last_candidate, max(0, region_end - block_size)),
+                    )
+                    content = _decode(data[region_start:region_end], encoding)
+                    match = _last_record_match(content, prefix, pattern)
+                    if match is not None:
+                        return match
+                    region_end = region_start
+    return None
@@ -0,0 +1,212 @@
+"""
+Streaming log template miner (Drain).
+
+Logs are split on whitespace and every token is masked on its own (see
+`alm.utils.log_normalization.mask_log`), then routed through a fixed-depth parse
+tree: by token count, then by their first tokens. The leaf holds the templates of that route, and a log joins
+the most similar one (positions that differ become `<*>`) or starts a new one.
+Masked tokens are memoized and tokens that no mask can match are skipped, so
+tokenizing a log costs a few microseconds instead of running every mask over it;
+routing and matching are a few dict lookups and token comparisons per log.
+
+Templates whose logs all fell into one cluster are mapped to that cluster, so a
+later log matching such a template gets its cluster without being embedded.
+
+Usage:
+    miner = TemplateMiner()
+    template_ids = [miner.add(log) for log in logs]
+    miner.assign_clusters(template_ids, cluster_labels)
+    miner.lookup(new_log)  # cluster label, or None
+"""
+
+import functools
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from alm.utils.log_normalization import mask_log
+
+WILDCARD = "<*>"
+# Every mask needs a digit or one of these characters
+_MASKABLE_TOKEN = re.compile(r"[\d./:-]")
+
+
+@functools.lru_cache(maxsize=65536)
+def _mask_token(token: str) -> str:
+    return mask_log(token) if _MASKABLE_TOKEN.search(token) else token
+
+
+class TemplateMiner:
+    """Drain parse tree of log templates, with the cluster of every template."""
+
+    def __init__(
+        self,
+        depth: int = 4,
+        similarity_threshold: float = 0.5,
+        max_children: int = 100,
+    ):
+        """
+        Args:
+            depth: Depth of the parse tree including the root and token count
+                levels, so `depth - 2` leading tokens route a log
+            similarity_threshold: Min share of equal tokens to join a template
+            max_children: Max children of a tree node, further tokens route to
+                a shared wildcard child
+        """
+        self.depth = depth
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.templates: Dict[int, List[str]] = {}
+        self.counts: Dict[int, int] = {}
+        # Cluster of every template; None once its logs fell into several
+        self.clusters: Dict[int, Optional[str]] = {}
+        self._paths: Dict[int, List[str]] = {}
+        self._root: dict = {}
+
+    @staticmethod
+    def tokenize(log: str) -> List[str]:
+        return [_mask_token(token) for token in log.split()]
+
+    def _route(self, tokens: List[str], create: bool) -> Optional[List[str]]:
+        """Keys of the tree path of a log, None if it does not exist yet."""
+        path = [str(len(tokens))]
+        node = self._root.get(path[0])
+        if node is None:
+            if not create:
+                return None
+            node = self._root[path[0]] = {}
+        for token in tokens[: self.depth - 2]:
+            if any(char.isdigit() for char in token):
+                token = WILDCARD
+            if token not in node and (not create or len(node) >= self.max_children):
+                token = WILDCARD
+            if token not in node:
+                if not create:
+                    return None
+                node[token] = {}
+            path.append(token)
+            node = node[token]
+        return path
+
+    def _leaf(self, path: List[str], create: bool = True) -> List[int]:
+        node = self._root
+        for key in path:
+            node = node.setdefault(key, {}) if create else node[key]
+        return node.setdefault("", []) if create else node.get("", [])
+
+    def add(self, log: str) -> int:
+        """Add a log to the most similar template, or to a new one.
+
+        Returns:
+            Id of the template of the log
+        """
+        tokens = self.tokenize(log)
+        path = self._route(tokens, create=True)
+        leaf = self._leaf(path)
+        best_id, best_similarity = None, -1.0
+        for template_id in leaf:
+            template = self.templates[template_id]
+            equal = sum(a == b for a, b in zip(template, tokens) if a != WILDCARD)
+            similarity = equal / len(tokens) if tokens else 1.0
+            if similarity > best_similarity:
+                best_id, best_similarity = template_id, similarity
+
+        if best_id is not None and best_similarity >= self.similarity_threshold:
+            template = self.templates[best_id]
+            self.templates[best_id] = [
+                a if a == b else WILDCARD for a, b in zip(template, tokens)
+            ]
+            self.counts[best_id] += 1
+            return best_id
+
+        template_id = len(self.templates)
+        self.templates[template_id] = tokens
+        self.counts[template_id] = 1
+        self._paths[template_id] = path
+        leaf.append(template_id)
+        return template_id
+
+    def match(self, log: str) -> Optional[int]:
+        """Id of the template a log fully matches, without updating any."""
+        tokens = self.tokenize(log)
+        path = self._route(tokens, create=False)
+        if path is None:
+            return None
+        for template_id in self._leaf(path, create=False):
+            if all(
+                a == b or a == WILDCARD
+                for a, b in zip(self.templates[template_id], tokens)
+            ):
+                return template_id
+        return None
+
+    def assign_clusters(self, template_ids: Sequence[int], labels: Sequence) -> None:
+        """Record the clusters of logs added with `add`.
+
+        Args:
+            template_ids: Template id of every log
+            labels: Cluster label of every log
+        """
+        for template_id, label in zip(template_ids, labels):
+            label = str(label)
+            if template_id not in self.clusters:
+                self.clusters[template_id] = label
+            elif self.clusters[template_id] != label:
+                self.clusters[template_id] = None
+
+    def relabel_clusters(self, relabeled: Dict) -> None:
+        """Point templates of merged clusters to the surviving cluster.
+
+        Args:
+            relabeled: {old label: new label, or None to unmap its templates}
+        """
+        relabeled = {
+            str(old): None if new is None else str(new)
+            for old, new in relabeled.items()
+        }
+        for template_id, label in self.clusters.items():
+            if label in relabeled:
+                self.clusters[template_id] = relabeled[label]
+
+    def lookup(self, log: str) -> Optional[str]:
+        """Cluster of the template a log matches, None if it needs embedding."""
+        template_id = self.match(log)
+        if template_id is None:
+            return None
+        return self.clusters.get(template_id)
+
+    def lookup_many(self, logs: Iterable[str]) -> List[Optional[str]]:
+        return [self.lookup(log) for log in logs]
+
+    def to_dict(self) -> dict:
+        """Plain state of the miner, for persisting it."""
+        return {
+            "depth": self.depth,
+            "similarity_threshold": self.similarity_threshold,
+            "max_children": self.max_children,
+            "templates": [
+                {
+                    "id": template_id,
+                    "tokens": tokens,
+                    "count": self.counts[template_id],
+                    "path": self._paths[template_id],
+                    "cluster": self.clusters.get(template_id),
+                    "clustered": template_id in self.clusters,
+                }
+                for template_id, tokens in self.templates.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "TemplateMiner":
+        miner = cls(
+            state["depth"], state["similarity_threshold"], state["max_children"]
+        )
+        for template in state["templates"]:
+            template_id = template["id"]
+            miner.templates[template_id] = template["tokens"]
+            miner.counts[template_id] = template["count"]
+            miner._paths[template_id] = template["path"]
+            if template["clustered"]:
+                miner.clusters[template_id] = template["cluster"]
+            miner._leaf(template["path"]).append(template_id)
+        return miner
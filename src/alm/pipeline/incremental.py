@@ -0,0 +1,329 @@
+"""Incremental variant of the offline training pipeline.
+
+Instead of dropping the tables and re-clustering the whole corpus, only the
+alerts added since the previous run are processed:
+
+- each new alert is assigned to the nearest cluster of the persisted model when
+  it is close enough (see `ClusterAssignmentModel`)
+- alerts of existing clusters take the summary, classification and solution
+  already stored for that cluster
+- the remaining alerts are clustered among themselves, their clusters are added
+  to the persisted model, and only these new clusters go through the agent graph
+
+With CLUSTER_ONLINE_UPDATES the model is instead updated online: cluster
+centroids and counts absorb the new logs, logs beyond the threshold open new
+clusters, and clusters are then merged or split (see
+`ClusterAssignmentModel.partial_fit` and `maintain`). Alerts of merged clusters
+are relabeled to the surviving cluster.
+
+Duplicate log messages of the delta are embedded and assigned once. The cost of
+a run is therefore proportional to the number of distinct new logs.
+
+Without a persisted cluster model the run fails, unless a full training is
+explicitly allowed as a fallback; it never drops the tables.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, or_, update
+from sqlmodel import select
+
+from alm.agents.cluster_model import (
+    NEW_CLUSTER,
+    ClusterAssignmentModel,
+    RetrainRequiredError,
+)
+from alm.agents.node import (
+    CLUSTER_MERGE_THRESHOLD,
+    CLUSTER_SPLIT_THRESHOLD,
+    _embed_logs,
+    cluster_new_logs,
+    load_cluster_model,
+    template_cluster_labels,
+    update_cluster_model,
+)
+from alm.database import bulk_upsert_alerts, get_session, init_tables
+from alm.models import CLUSTER_RESULT_FIELDS, GrafanaAlert
+from alm.patterns.template_miner import TemplateMiner
+from alm.pipeline.ingestion import ingest_directory
+from alm.pipeline.journal import RunJournal
+from alm.pipeline.offline import process_clusters, training_pipeline
+from alm.pipeline.representatives import select_representatives
+from alm.utils.dedup import dedup_log_messages, log_message_hash
+from alm.utils.env import env_flag
+from alm.utils.logger import get_logger
+from alm.utils.metrics import stage_timer
+
+logger = get_logger(__name__)
+
+
+def _stored_alert_keys():
+    """Query of the (file name, log hash) pairs of the stored alerts."""
+    return select(
+        GrafanaAlert.log_labels["filename"].as_string(), GrafanaAlert.logHash
+    ).distinct()
+
+
+def _new_file_alerts(
+    alerts: List[GrafanaAlert], stored_keys: Set[Tuple[str, str]]
+) -> List[GrafanaAlert]:
+    """The ingested alerts whose (file name, log hash) pair is not stored."""
+    new_alerts = []
+    for alert in alerts:
+        alert.logHash = log_message_hash(alert.logMessage)
+        if (alert.log_labels.get("filename"), alert.logHash) not in stored_keys:
+            new_alerts.append(alert)
+    return new_alerts
+
+
+async def _load_new_alerts(load_alerts_from_db: bool) -> List[GrafanaAlert]:
+    if not load_alerts_from_db:
+        # The ingestion manifest re-parses the files whose mtime or size
+        # changed and serves the others. An alert is new when its
+        # (file, log hash) pair is not stored yet: a rewritten or appended file
+        # yields a new alert, and an interrupted run picks its alerts up again
+        # when it is resumed.
+        alerts = ingest_directory("data/logs/failed")
+        async with get_session() as db:
+            stored = await db.exec(_stored_alert_keys())
+            return _new_file_alerts(alerts, set(stored.all()))
+    # Alerts posted through the API that fit no cluster are stored as NEW_CLUSTER
+    async with get_session() as db:
+        alerts = await db.exec(
+            select(GrafanaAlert).where(
+                or_(
+                    GrafanaAlert.logCluster.is_(None),
+                    GrafanaAlert.logCluster == str(NEW_CLUSTER),
+                )
+            )
+        )
+        return alerts.all()
+
+
+async def _load_cluster_results(labels: Iterable[str]) -> Dict[str, GrafanaAlert]:
+    """One already processed alert per cluster label."""
+    labels = list(labels)
+    if not labels:
+        return {}
+    subquery = (
+        select(GrafanaAlert.logCluster, func.min(GrafanaAlert.id).label("min_id"))
+        .where(GrafanaAlert.logCluster.in_(labels))
+        .where(GrafanaAlert.stepByStepSolution.is_not(None))
+        .group_by(GrafanaAlert.logCluster)
+    ).alias("clusters")
+    async with get_session() as db:
+        alerts = await db.exec(
+            select(GrafanaAlert).join(subquery, GrafanaAlert.id == subquery.c.min_id)
+        )
+        return {alert.logCluster: alert for alert in alerts.all()}
+
+
+def _add_templates(
+    cluster_model: ClusterAssignmentModel, logs: List[str], labels: np.ndarray
+) -> None:
+    """Mine the templates of newly clustered logs into the model."""
+    if cluster_model.template_miner is None:
+        cluster_model.template_miner = TemplateMiner()
+    template_miner = cluster_model.template_miner
+    template_miner.assign_clusters([template_miner.add(log) for log in logs], labels)
+
+
+def _online_update(
+    embeddings: np.ndarray, sample_weight: np.ndarray, logs: List[str]
+) -> Tuple[np.ndarray, Dict[int, int]]:
+    """Update the persisted model with new logs and run its maintenance.
+
+    Returns:
+        (final cluster label of every row, {merged label: surviving label})
+    """
+
+    def apply(cluster_model: ClusterAssignmentModel):
+        labels = cluster_model.partial_fit(embeddings, sample_weight)
+        _add_templates(cluster_model, logs, labels)
+        changes = cluster_model.maintain(
+            CLUSTER_MERGE_THRESHOLD, CLUSTER_SPLIT_THRESHOLD
+        )
+        logger.info(
+            "online update: clusters %d, merged %d, split %d",
+            cluster_model.n_clusters,
+            len(changes["merged"]),
+            len(changes["split"]),
+        )
+        merged = changes["merged"]
+        return np.array([merged.get(label, label) for label in labels]), merged
+
+    return update_cluster_model(apply)
+
+
+def _add_new_clusters(
+    embeddings: np.ndarray, sample_weight: np.ndarray, logs: List[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Assign new logs to the persisted model, add clusters for the logs that
+    fit none and persist it.
+
+    Returns:
+        (cluster label of every row, True for the rows of new clusters)
+    """
+
+    def apply(cluster_model: ClusterAssignmentModel):
+        labels = cluster_model.predict(embeddings)
+        new_mask = labels == NEW_CLUSTER
+        if new_mask.any():
+            # Cluster the rest among themselves and add them to the model
+            new_embeddings = embeddings[new_mask]
+            labels[new_mask] = cluster_model.add_clusters(
+                new_embeddings,
+                cluster_new_logs(new_embeddings),
+                sample_weight[new_mask],
+            )
+        _add_templates(cluster_model, logs, labels)
+        return labels, new_mask
+
+    return update_cluster_model(apply)
+
+
+async def _relabel_merged_clusters(merged: Dict[int, int]) -> None:
+    if not merged:
+        return
+    async with get_session() as db:
+        for label, survivor in merged.items():
+            await db.execute(
+                update(GrafanaAlert)
+                .where(GrafanaAlert.logCluster == str(label))
+                .values(logCluster=str(survivor))
+            )
+        await db.commit()
+
+
+async def incremental_training_pipeline(
+    load_alerts_from_db: bool = False,
+    run_id: Optional[str] = None,
+    full_training_fallback: Optional[bool] = None,
+):
+    """Cluster and process only the alerts added since the previous run.
+
+    Args:
+        load_alerts_from_db: Process the unclustered alerts of the database
+            instead of the new log files
+        run_id: Id of the run journal (see `alm.pipeline.journal`)
+        full_training_fallback: Without a persisted cluster model, store the new
+            alerts and retrain on every stored alert instead of failing; no
+            table is dropped. Defaults to the PIPELINE_FULL_TRAINING_FALLBACK
+            env var.
+    """
+    if full_training_fallback is None:
+        full_training_fallback = env_flag("PIPELINE_FULL_TRAINING_FALLBACK")
+    await init_tables()
+
+    try:
+        cluster_model = load_cluster_model()
+    except RetrainRequiredError as e:
+        # A legacy model cannot be extended, handle it as a missing one
+        logger.warning("persisted cluster model cannot be extended: %s", e)
+        cluster_model = None
+    if cluster_model is None:
+        if not full_training_fallback:
+            raise FileNotFoundError(
+                "No persisted cluster model to extend: run a full training first "
+                "or set PIPELINE_FULL_TRAINING_FALLBACK"
+            )
+        logger.warning("no persisted cluster model to extend, running a full training")
+        if not load_alerts_from_db:
+            await bulk_upsert_alerts(await _load_new_alerts(load_alerts_from_db))
+        return await training_pipeline(
+            restart_db=False,
+            load_alerts_from_db=True,
+            incremental=False,
+            run_id=run_id,
+        )
+
+    journal = RunJournal(run_id)
+    alerts = await _load_new_alerts(load_alerts_from_db)
+    logger.info("new alerts %d", len(alerts))
+    if not alerts:
+        journal.complete()
+        return
+
+    # Distinct new logs matching a known template take its cluster, the others
+    # are embedded and assigned to existing clusters where possible
+    unique, inverse = dedup_log_messages([alert.logMessage for alert in alerts])
+    messages = [alerts[index].logMessage for index in unique]
+    unique_labels = template_cluster_labels(cluster_model, messages)
+    unmatched = [index for index, label in enumerate(unique_labels) if label is None]
+    unmatched_messages = [messages[index] for index in unmatched]
+    embeddings = np.zeros((0, cluster_model.prototypes.shape[1]), dtype=np.float32)
+    if unmatched:
+        with stage_timer("embed", items=len(unmatched)):
+            embeddings = _embed_logs(unmatched_messages)
+    online = env_flag("CLUSTER_ONLINE_UPDATES")
+    sample_weight = np.bincount(inverse, minlength=len(unique))[unmatched]
+    labels = np.zeros(0, dtype=np.int64)
+    new_mask = np.zeros(0, dtype=bool)
+    # The persisted model is updated under the lock or conditional put of
+    # `update_cluster_model`, so concurrent writers do not overwrite each other
+    with stage_timer("cluster", items=len(unmatched)):
+        if online and unmatched:
+            new_mask = cluster_model.predict(embeddings) == NEW_CLUSTER
+            labels, merged = _online_update(
+                embeddings, sample_weight, unmatched_messages
+            )
+            await _relabel_merged_clusters(merged)
+            unique_labels = [
+                None if label is None else str(merged.get(int(label), label))
+                for label in unique_labels
+            ]
+        elif unmatched:
+            labels, new_mask = _add_new_clusters(
+                embeddings, sample_weight, unmatched_messages
+            )
+    for index, label in zip(unmatched, labels.tolist()):
+        unique_labels[index] = str(label)
+    cluster_labels = [unique_labels[position] for position in inverse]
+    logger.info(
+        "distinct logs matched by template %d, assigned to existing clusters %d, "
+        "new logs clustered %d",
+        len(unique) - len(unmatched),
+        int((~new_mask).sum()),
+        int(new_mask.sum()),
+    )
+
+    # Reuse the stored results of existing clusters, run the graph for the rest
+    cluster_results = await _load_cluster_results(set(unique_labels))
+    pending = [
+        index
+        for index, label in enumerate(unique_labels)
+        if label not in cluster_results
+    ]
+    # Logs matched by template to a cluster without stored results were not
+    # embedded yet
+    row_embeddings = dict(zip(unmatched, embeddings))
+    missing = [index for index in pending if index not in row_embeddings]
+    if missing:
+        row_embeddings.update(
+            zip(missing, _embed_logs([messages[index] for index in missing]))
+        )
+    representatives = select_representatives(
+        np.array([row_embeddings[index] for index in pending]),
+        [unique_labels[index] for index in pending],
+    )
+    cluster_samples = {
+        label: [alerts[unique[pending[index]]] for index in indices]
+        for label, indices in representatives.items()
+    }
+    logger.info(
+        "clusters reused %d, clusters to process %d",
+        len(cluster_results),
+        len(cluster_samples),
+    )
+    cluster_results.update(await process_clusters(cluster_samples, journal))
+
+    for label, alert in zip(cluster_labels, alerts):
+        candidate_alert = cluster_results[label]
+        for field in CLUSTER_RESULT_FIELDS:
+            setattr(alert, field, getattr(candidate_alert, field))
+        alert.logCluster = label
+
+    with stage_timer("persist", items=len(alerts)):
+        await bulk_upsert_alerts(alerts)
+    journal.complete()
@@ -0,0 +1,223 @@
+"""Parallel, incremental ingestion of failed job logs.
+
+Log files are parsed in a process pool. A manifest keeps (mtime, size, tail
+hash, parser version) and the parsed alert of every file, so a re-run only
+parses files that are new or changed and serves the others from the manifest.
+A file whose mtime or size changed is hashed first and only parsed again when
+its tail hash changed too. Only the end of a file is hashed, so like the
+tail-first scan of the parser the cost of a changed file does not grow with its
+size. Entries of another parser version (`ALERT_PARSER_VERSION`) are parsed
+again.
+
+Environment Variables:
+    INGEST_WORKERS: Parser processes. Default: number of CPUs
+    INGEST_MANIFEST_PATH: Manifest location. Default: $DATA_DIR/ingest_manifest.sqlite
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from alm.alert_mocker import ALERT_PARSER_VERSION, grafana_alert_mock
+from alm.models import GrafanaAlert
+from alm.utils.logger import get_logger
+from alm.utils.sqlite_store import SQLiteStore
+
+logger = get_logger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST_PATH",
+    str(Path(os.getenv("DATA_DIR", "./data")) / "ingest_manifest.sqlite"),
+)
+
+# Files handed to the pool at once; bounds the results held in memory
+_CHUNK_SIZE = 512
+# Bytes hashed at the end of a file to tell a touched file from a rewritten one
+_DIGEST_WINDOW = 1 << 20
+
+
+def _alert_to_payload(alert: Optional[GrafanaAlert]) -> Optional[dict]:
+    if alert is None:
+        return None
+    return {
+        "logTimestamp": alert.logTimestamp.isoformat(),
+        "logMessage": alert.logMessage,
+        "log_labels": alert.log_labels,
+    }
+
+
+def _alert_from_payload(payload: dict) -> GrafanaAlert:
+    return GrafanaAlert(
+        logTimestamp=datetime.fromisoformat(payload["logTimestamp"]),
+        logMessage=payload["logMessage"],
+        log_labels=payload["log_labels"],
+    )
+
+
+def _tail_digest(path: str) -> str:
+    """SHA-256 of the size and the last _DIGEST_WINDOW bytes of a file."""
+    with open(path, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        file.seek(max(0, size - _DIGEST_WINDOW))
+        digest = hashlib.sha256(str(size).encode())
+        digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _parse_file(
+    path: str, previous_digest: Optional[str]
+) -> Tuple[Optional[str], Optional[dict], str]:
+    """Parse one log file in a worker process, unless its tail is unchanged.
+
+    Returns:
+        (tail hash, alert payload or None, status): the status is "parsed",
+        "unchanged" when the tail hash is `previous_digest` and the file was not
+        parsed, or "failed"
+    """
+    try:
+        # The file may have been removed or become unreadable since the scan
+        digest = _tail_digest(path)
+        if digest == previous_digest:
+            return digest, None, "unchanged"
+        alert = grafana_alert_mock(path)
+    except Exception:
+        return None, None, "failed"
+    return digest, _alert_to_payload(alert), "parsed"
+
+
+class IngestionManifest:
+    """Per-file ingestion state, keyed by file path."""
+
+    def __init__(self, path: str = INGEST_MANIFEST_PATH):
+        self._files = SQLiteStore(path, table="ingested_files")
+        self._alerts = SQLiteStore(path, table="ingested_alerts")
+
+    def files(self, directory: str) -> Dict[str, dict]:
+        prefix = os.path.join(directory, "")
+        return dict(self._files.items(prefix))
+
+    def alerts(self, paths: List[str]) -> Dict[str, dict]:
+        return self._alerts.get_many(paths)
+
+    def update(self, entries: Dict[str, dict], alerts: Dict[str, Optional[dict]]):
+        self._files.put_many(entries.items())
+        self._alerts.put_many(
+            (path, alert) for path, alert in alerts.items() if alert is not None
+        )
+        self._alerts.delete_many(
+            path for path, alert in alerts.items() if alert is None
+        )
+
+    def forget(self, paths: List[str]):
+        self._files.delete_many(paths)
+        self._alerts.delete_many(paths)
+
+
+def iter_ingested_alerts(
+    directory: str,
+    workers: int = INGEST_WORKERS,
+    manifest: Optional[IngestionManifest] = None,
+) -> Iterator[GrafanaAlert]:
+    """Yield the alerts of every log file in a directory.
+
+    Args:
+        directory: Directory with the `.txt` job logs
+        workers: Parser processes
+        manifest: Manifest to use, defaults to the one at INGEST_MANIFEST_PATH
+    """
+    manifest = manifest or IngestionManifest()
+    known = manifest.files(directory)
+
+    unchanged: List[str] = []
+    changed: List[Tuple[str, int, int, Optional[str]]] = []
+    with os.scandir(directory) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if not entry.name.endswith(".txt") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            previous = known.pop(entry.path, None)
+            if previous and previous.get("parser_version") != ALERT_PARSER_VERSION:
+                # Parsed by another parser version, parse again
+                previous = None
+            if (
+                previous
+                and previous["mtime_ns"] == stat.st_mtime_ns
+                and previous["size"] == stat.st_size
+            ):
+                unchanged.append(entry.path)
+            else:
+                previous_digest = previous.get("tail_sha256") if previous else None
+                changed.append(
+                    (entry.path, stat.st_mtime_ns, stat.st_size, previous_digest)
+                )
+
+    # Files that disappeared since the last run
+    if known:
+        manifest.forget(list(known))
+
+    logger.info(
+        "ingesting %s: %d changed, %d unchanged files",
+        directory,
+        len(changed),
+        len(unchanged),
+    )
+
+    for start in range(0, len(unchanged), _CHUNK_SIZE):
+        chunk = unchanged[start : start + _CHUNK_SIZE]
+        payloads = manifest.alerts(chunk)
+        for path in chunk:
+            if path in payloads:
+                yield _alert_from_payload(payloads[path])
+
+    if not changed:
+        return
+
+    error_count = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        for start in range(0, len(changed), _CHUNK_SIZE):
+            chunk = changed[start : start + _CHUNK_SIZE]
+            results = pool.map(
+                _parse_file,
+                [path for path, _, _, _ in chunk],
+                [previous_digest for _, _, _, previous_digest in chunk],
+                chunksize=max(1, len(chunk) // (4 * max(1, workers))),
+            )
+            entries: Dict[str, dict] = {}
+            alerts: Dict[str, Optional[dict]] = {}
+            touched: List[str] = []
+            for (path, mtime_ns, size, _), (digest, payload, status) in zip(
+                chunk, results
+            ):
+                if status == "failed":
+                    error_count += 1
+                    continue
+                entries[path] = {
+                    "mtime_ns": mtime_ns,
+                    "size": size,
+                    "tail_sha256": digest,
+                    "parser_version": ALERT_PARSER_VERSION,
+                }
+                if status == "unchanged":
+                    # Only the mtime changed, the stored alert still holds
+                    touched.append(path)
+                else:
+                    alerts[path] = payload
+            manifest.update(entries, alerts)
+            for path, payload in manifest.alerts(touched).items():
+                yield _alert_from_payload(payload)
+            for payload in alerts.values():
+                if payload is not None:
+                    yield _alert_from_payload(payload)
+
+    logger.info("%d errors while ingesting %s", error_count, directory)
+
+
+def ingest_directory(directory: str) -> List[GrafanaAlert]:
+    """Ingest alerts from a directory in parallel, reusing the manifest."""
+    alerts = list(iter_ingested_alerts(directory))
+    logger.info("alerts: %d", len(alerts))
+    return alerts
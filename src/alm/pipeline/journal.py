@@ -0,0 +1,64 @@
+"""Run journal for checkpointed, resumable offline pipeline runs.
+
+Every cluster's agent graph result is recorded as soon as it completes, keyed by
+run id, cluster label and a hash of the representative log. A run restarted with
+the same id skips the clusters that already finished instead of paying for the
+LLM calls again. The journal lives in a local SQLite file, so it survives the
+pipeline dropping the application tables.
+
+Environment Variables:
+    PIPELINE_RUN_ID: Id of the run to start or resume. Default: a new random id
+    PIPELINE_JOURNAL_PATH: Journal location. Default: $DATA_DIR/pipeline_journal.sqlite
+"""
+
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from alm.utils.logger import get_logger
+from alm.utils.sqlite_store import SQLiteStore
+
+logger = get_logger(__name__)
+
+PIPELINE_JOURNAL_PATH = os.getenv(
+    "PIPELINE_JOURNAL_PATH",
+    str(Path(os.getenv("DATA_DIR", "./data")) / "pipeline_journal.sqlite"),
+)
+
+
+class RunJournal:
+    """Graph results of the clusters finished by one pipeline run."""
+
+    def __init__(self, run_id: Optional[str] = None, path: str = PIPELINE_JOURNAL_PATH):
+        self.run_id = run_id or os.getenv("PIPELINE_RUN_ID") or uuid.uuid4().hex[:12]
+        self._store = SQLiteStore(path, table="cluster_results")
+        finished = len(self._store.keys(self._prefix))
+        if finished:
+            logger.info(
+                "resuming run %s: %d clusters already processed", self.run_id, finished
+            )
+        else:
+            logger.info("starting run %s", self.run_id)
+
+    @property
+    def _prefix(self) -> str:
+        return f"{self.run_id}/"
+
+    def _key(self, label: str, log_message: str) -> str:
+        # The log hash guards against labels that mean another cluster after a
+        # restart on different input
+        digest = hashlib.sha256(log_message.encode()).hexdigest()[:16]
+        return f"{self._prefix}{label}/{digest}"
+
+    def get(self, label: str, log_message: str) -> Optional[dict]:
+        return self._store.get(self._key(label, log_message))
+
+    def record(self, label: str, log_message: str, result: dict) -> None:
+        self._store.put(self._key(label, log_message), result)
+
+    def complete(self) -> None:
+        """Drop the run's entries once its results are persisted."""
+        self._store.delete_many(self._store.keys(self._prefix))
+        logger.info("run %s completed", self.run_id)
@@ -1,43 +1,74 @@
 import asyncio
-import time
-from typing import List, Dict, Tuple
-from alm.database import convert_grafana_alert_to_grafana_alert_state, get_session
-from alm.alert_mocker import ingest_alerts
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from alm.database import (
+    bulk_upsert_alerts,
+    convert_grafana_alert_to_grafana_alert_state,
+    get_session,
+)
+from alm.pipeline.ingestion import ingest_directory
+from alm.pipeline.journal import RunJournal
+from alm.pipeline.representatives import merge_cluster_results, select_representatives
 from alm.agents.graph import graph_without_clustering
-from alm.agents.node import train_embed_and_cluster_logs
-from alm.models import GrafanaAlert
+from alm.agents.node import _embed_logs, save_run_report, train_cluster_embeddings
+from alm.models import CLUSTER_RESULT_FIELDS, GrafanaAlert
+from alm.patterns.template_miner import TemplateMiner
 from sqlmodel import select
 from alm.database import convert_state_to_grafana_alert
 from alm.database import init_tables
+from alm.utils.dedup import dedup_log_messages
+from alm.utils.env import env_flag
 from alm.utils.logger import get_logger
+from alm.utils.metrics import current_run_report, stage_timer, track_run
 
 logger = get_logger(__name__)
 
 
-async def _add_or_update_alert(alert):
-    async with get_session() as db:
-        db.add(alert)
-        await db.commit()
-        await db.refresh(alert)
-
-
 def cluster_logs(
     alerts: List[GrafanaAlert],
-) -> Tuple[List[str], Dict[str, GrafanaAlert]]:
-    """Cluster logs and return unique alerts per cluster."""
-    cluster_labels = train_embed_and_cluster_logs(
-        [alert.logMessage for alert in alerts]
-    )
+) -> Tuple[List[str], Dict[str, List[GrafanaAlert]]]:
+    """Cluster logs and return the representative alerts of every cluster.
+
+    Duplicate log messages (up to whitespace) are embedded and clustered once,
+    weighted by their count, and their label is fanned out to every duplicate.
+    The templates of the logs are mined and persisted with the cluster model.
+    """
+    unique, inverse = dedup_log_messages([alert.logMessage for alert in alerts])
+    logger.info("distinct log messages %d of %d", len(unique), len(alerts))
+    template_miner = TemplateMiner()
+    template_ids = [template_miner.add(alerts[index].logMessage) for index in unique]
+    logger.info("log templates %d", len(template_miner.templates))
+    with stage_timer("embed", items=len(unique)):
+        embeddings = _embed_logs([alerts[index].logMessage for index in unique])
+    with stage_timer("cluster", items=len(unique)):
+        unique_labels = train_cluster_embeddings(
+            embeddings,
+            sample_weight=np.bincount(inverse, minlength=len(unique)),
+            template_miner=template_miner,
+            template_ids=template_ids,
+        )
+    cluster_labels = [str(unique_labels[position]) for position in inverse]
 
-    unique_cluster = {label: alert for alert, label in zip(alerts, cluster_labels)}
-    return cluster_labels, unique_cluster
+    representatives = select_representatives(
+        embeddings, [str(label) for label in unique_labels]
+    )
+    cluster_samples = {
+        label: [alerts[unique[index]] for index in indices]
+        for label, indices in representatives.items()
+    }
+    return cluster_labels, cluster_samples
 
 
 async def load_alerts(load_alerts_from_db):
+    with stage_timer("load"):
+        return await _load_alerts(load_alerts_from_db)
+
+
+async def _load_alerts(load_alerts_from_db):
     if not load_alerts_from_db:
-        alerts = [
-            alert for alert in ingest_alerts("data/logs/failed") if alert is not None
-        ]
+        alerts = ingest_directory("data/logs/failed")
         logger.info("alerts ingested %d", len(alerts))
     else:
         async with get_session() as db:
@@ -47,14 +78,118 @@ async def load_alerts(load_alerts_from_db):
     return alerts
 
 
-async def _process_alert(label: str, alert: GrafanaAlert) -> Tuple[str, GrafanaAlert]:
-    """Process a single alert through the graph without clustering and return (label, result)."""
+async def _process_alert(
+    label: str, alert: GrafanaAlert, journal: Optional[RunJournal] = None
+) -> Tuple[str, GrafanaAlert]:
+    """Process a single alert through the graph without clustering and return (label, result).
+
+    With a journal, a result recorded by an earlier attempt of the run is reused
+    and a new result is recorded as soon as the graph finishes. Journal reads and
+    writes run in a thread so they do not block the other alerts.
+    """
+    if journal is not None:
+        recorded = await asyncio.to_thread(journal.get, label, alert.logMessage)
+        if recorded is not None:
+            return label, GrafanaAlert(logMessage=alert.logMessage, **recorded)
+
     state = convert_grafana_alert_to_grafana_alert_state(alert)
-    result_state = await graph_without_clustering().ainvoke(state)
-    return label, convert_state_to_grafana_alert(result_state)
+    with stage_timer("graph"):
+        result_state = await graph_without_clustering().ainvoke(state)
+    result = convert_state_to_grafana_alert(result_state)
+
+    if journal is not None:
+        await asyncio.to_thread(
+            journal.record,
+            label,
+            alert.logMessage,
+            {field: getattr(result, field) for field in CLUSTER_RESULT_FIELDS},
+        )
+    return label, result
 
 
-async def training_pipeline(restart_db=True, load_alerts_from_db=False):
+async def process_clusters(
+    cluster_samples: Dict[str, List[GrafanaAlert]],
+    journal: Optional[RunJournal] = None,
+) -> Dict[str, GrafanaAlert]:
+    """Run the graph on the samples of every cluster and merge them per cluster."""
+    results = await asyncio.gather(
+        *[
+            _process_alert(label, alert, journal)
+            for label, samples in cluster_samples.items()
+            for alert in samples
+        ]
+    )
+    grouped: Dict[str, List[GrafanaAlert]] = {}
+    for label, result in results:
+        grouped.setdefault(label, []).append(result)
+    return {label: merge_cluster_results(group) for label, group in grouped.items()}
+
+
+async def training_pipeline(
+    restart_db=True,
+    load_alerts_from_db=False,
+    streaming: Optional[bool] = None,
+    incremental: Optional[bool] = None,
+    run_id: Optional[str] = None,
+):
+    """Run the offline training pipeline.
+
+    The timings of the load, embed, cluster, graph (and per node) and persist
+    stages are saved as a JSON run report next to the clustering model (see
+    `alm.utils.metrics`).
+
+    Args:
+        restart_db: Drop and recreate the tables before running
+        load_alerts_from_db: Load alerts from the database instead of the log files
+        streaming: Use the bounded-queue streaming pipeline (see
+            `alm.pipeline.streaming`). Defaults to the PIPELINE_STREAMING env var.
+        incremental: Only process alerts added since the previous run (see
+            `alm.pipeline.incremental`), `restart_db` is ignored. Defaults to the
+            PIPELINE_INCREMENTAL env var.
+        run_id: Id of the run, pass the id of a crashed run to resume it (see
+            `alm.pipeline.journal`). Defaults to the PIPELINE_RUN_ID env var.
+    """
+    if incremental is None:
+        incremental = env_flag("PIPELINE_INCREMENTAL")
+    if streaming is None:
+        streaming = env_flag("PIPELINE_STREAMING")
+
+    # A run nested in a tracked run (the incremental fallback) reports in it
+    nested = current_run_report() is not None
+    with track_run(run_id) as report:
+        if incremental:
+            from alm.pipeline.incremental import incremental_training_pipeline
+
+            await incremental_training_pipeline(
+                load_alerts_from_db=load_alerts_from_db, run_id=run_id
+            )
+        elif streaming:
+            from alm.pipeline.streaming import streaming_training_pipeline
+
+            await streaming_training_pipeline(
+                restart_db=restart_db,
+                load_alerts_from_db=load_alerts_from_db,
+                run_id=run_id,
+            )
+        else:
+            await _training_pipeline(restart_db, load_alerts_from_db, run_id)
+
+    if not nested:
+        run_report = report.to_dict()
+        location = save_run_report(run_report, report.file_name)
+        logger.info("run report saved to %s", location)
+        logger.info(
+            "run stages: %s",
+            {
+                name: (stage["calls"], stage["total_seconds"])
+                for name, stage in run_report["stages"].items()
+            },
+        )
+
+
+async def _training_pipeline(restart_db, load_alerts_from_db, run_id):
+    journal = RunJournal(run_id)
+
     if restart_db:
         await init_tables(delete_tables=True)
 
@@ -62,29 +197,20 @@ async def training_pipeline(restart_db=True, load_alerts_from_db=False):
     alerts = await load_alerts(load_alerts_from_db=load_alerts_from_db)
 
     # Cluster logs
-    cluster_labels, unique_cluster = cluster_logs(alerts)
+    cluster_labels, cluster_samples = cluster_logs(alerts)
 
-    # Process all unique cluster alerts in parallel
-    results = await asyncio.gather(
-        *[_process_alert(label, alert) for label, alert in unique_cluster.items()]
-    )
-    updated_alerts: Dict[str, GrafanaAlert] = dict(results)
+    # Process the representatives of all clusters in parallel
+    updated_alerts = await process_clusters(cluster_samples, journal)
 
     # update alerts fields by label
     for label, alert in zip(cluster_labels, alerts):
         candidate_alert = updated_alerts[label]
         # All the intermediate steps of the agent
-        alert.logSummary = candidate_alert.logSummary
-        alert.expertClassification = candidate_alert.expertClassification
-        alert.logCluster = str(label)
-        alert.needMoreContext = candidate_alert.needMoreContext
-        alert.stepByStepSolution = candidate_alert.stepByStepSolution
-        alert.contextForStepByStepSolution = (
-            candidate_alert.contextForStepByStepSolution
-        )
+        for field in CLUSTER_RESULT_FIELDS:
+            setattr(alert, field, getattr(candidate_alert, field))
+        alert.logCluster = label
 
     # update database
-    start_time = time.time()
-    await asyncio.gather(*[_add_or_update_alert(alert) for alert in alerts])
-    elapsed_time = time.time() - start_time
-    logger.info("database alerts added - Time: %.2fs", elapsed_time)
+    with stage_timer("persist", items=len(alerts)):
+        await bulk_upsert_alerts(alerts)
+    journal.complete()
@@ -0,0 +1,125 @@
+"""Cluster representative selection for the offline pipeline.
+
+One LLM graph run per cluster is spent on the most typical log of the cluster:
+its medoid, the log closest (cosine) to the cluster centroid. Large clusters can
+optionally fan out to k diverse samples whose graph results are merged.
+
+Environment Variables:
+    PIPELINE_SAMPLES_PER_CLUSTER: Samples sent to the graph per large cluster. Default: 1
+    PIPELINE_FANOUT_MIN_CLUSTER_SIZE: Cluster size from which clusters fan out. Default: 20
+"""
+
+import os
+from collections import Counter
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from alm.models import GrafanaAlert
+
+PIPELINE_SAMPLES_PER_CLUSTER = int(os.getenv("PIPELINE_SAMPLES_PER_CLUSTER", "1"))
+PIPELINE_FANOUT_MIN_CLUSTER_SIZE = int(
+    os.getenv("PIPELINE_FANOUT_MIN_CLUSTER_SIZE", "20")
+)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _diverse_samples(
+    embeddings: np.ndarray, members: np.ndarray, first: int, k: int
+) -> List[int]:
+    """Farthest-point sampling inside one cluster, starting from its medoid."""
+    chosen = [first]
+    # Cosine distance of every member to the closest chosen sample
+    distances = 1.0 - embeddings[members] @ embeddings[first]
+    for _ in range(min(k, len(members)) - 1):
+        farthest = int(np.argmax(distances))
+        if distances[farthest] <= 0:
+            break
+        candidate = int(members[farthest])
+        chosen.append(candidate)
+        distances = np.minimum(
+            distances, 1.0 - embeddings[members] @ embeddings[candidate]
+        )
+    return chosen
+
+
+def select_representatives(
+    embeddings: np.ndarray,
+    labels: Sequence,
+    samples_per_cluster: int = PIPELINE_SAMPLES_PER_CLUSTER,
+    fanout_min_cluster_size: int = PIPELINE_FANOUT_MIN_CLUSTER_SIZE,
+) -> Dict[str, List[int]]:
+    """
+    Pick the rows to send to the agent graph for every cluster.
+
+    Args:
+        embeddings: Embedding matrix, one row per log
+        labels: Cluster label per row
+        samples_per_cluster: Samples for clusters of at least
+            `fanout_min_cluster_size` logs; smaller clusters get their medoid only
+        fanout_min_cluster_size: Cluster size from which clusters fan out
+
+    Returns:
+        Row indices per cluster label (as str), the medoid first
+    """
+    if len(labels) == 0:
+        return {}
+    embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+    unique_labels, inverse, sizes = np.unique(
+        np.asarray([str(label) for label in labels]),
+        return_inverse=True,
+        return_counts=True,
+    )
+
+    # Centroid of every cluster, and similarity of every row to its centroid
+    centroids = np.zeros((len(unique_labels), embeddings.shape[1]), dtype=np.float32)
+    np.add.at(centroids, inverse, embeddings)
+    centroids = _normalize(centroids)
+    similarity = np.einsum("ij,ij->i", embeddings, centroids[inverse])
+
+    # Rows sorted by cluster, most central first
+    order = np.lexsort((-similarity, inverse))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    representatives = {}
+    for cluster, label in enumerate(unique_labels.tolist()):
+        medoid = int(order[starts[cluster]])
+        if samples_per_cluster > 1 and sizes[cluster] >= fanout_min_cluster_size:
+            members = order[starts[cluster] : starts[cluster] + sizes[cluster]]
+            representatives[label] = _diverse_samples(
+                embeddings, members, medoid, samples_per_cluster
+            )
+        else:
+            representatives[label] = [medoid]
+    return representatives
+
+
+def merge_cluster_results(results: List[GrafanaAlert]) -> GrafanaAlert:
+    """
+    Merge the graph results of the samples of one cluster.
+
+    The classification is decided by majority vote (ties go to the medoid).
+    The summary and solution come from the most central sample that agrees with
+    it, and more context is needed if any sample needed it.
+
+    Args:
+        results: Graph results in sample order, the medoid first
+    """
+    if len(results) == 1:
+        return results[0]
+    votes = Counter(result.expertClassification for result in results)
+    top_count = max(votes.values())
+    classification = next(
+        result.expertClassification
+        for result in results
+        if votes[result.expertClassification] == top_count
+    )
+    primary = next(
+        result for result in results if result.expertClassification == classification
+    )
+    primary.needMoreContext = any(result.needMoreContext for result in results)
+    return primary
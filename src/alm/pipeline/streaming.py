@@ -0,0 +1,394 @@
+"""Streaming, bounded-concurrency variant of the offline training pipeline.
+
+Alerts flow through load -> persist -> embed -> cluster -> graph -> persist
+stages connected by bounded asyncio queues. Every stage runs a fixed number of
+workers, so a slow stage (usually the LLM graph) applies backpressure to the
+stages feeding it instead of piling work up in memory.
+
+Only a batch of alerts is held in memory at a time. Raw alerts are written to
+the database as soon as they are loaded, and the graph results are applied per
+cluster with a single UPDATE. Everything that grows with the corpus is spilled
+to a temporary directory: the alert ids and embeddings of the distinct log
+messages, read back as memory maps for clustering, the content hash of every
+distinct message, in a SQLite table, and the members of every cluster, sorted
+by cluster. Duplicates (up to whitespace) are embedded once and receive the
+result of their first occurrence's cluster.
+
+Clustering and the representative selection still need the whole embedding
+matrix, loaded from the memory map, and one cluster label per distinct message
+is held in memory; both are released before the graph stage.
+
+Environment Variables:
+    PIPELINE_BATCH_SIZE: Alerts per load/embed/persist batch. Default: 256
+    PIPELINE_QUEUE_SIZE: Maximum batches waiting between two stages. Default: 4
+    PIPELINE_GRAPH_CONCURRENCY: Concurrent agent graph runs. Default: 8
+    PIPELINE_PERSIST_CONCURRENCY: Concurrent database writers. Default: 2
+    PIPELINE_SPILL_DIR: Directory of the temporary spill files. Default: system temp
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import update
+from sqlmodel import select
+
+from alm.agents.node import _embed_logs, train_cluster_embeddings
+from alm.database import bulk_upsert_alerts, get_session, init_tables
+from alm.models import CLUSTER_RESULT_FIELDS, GrafanaAlert
+from alm.patterns.template_miner import TemplateMiner
+from alm.pipeline.ingestion import iter_ingested_alerts
+from alm.pipeline.journal import RunJournal
+from alm.pipeline.offline import _process_alert
+from alm.pipeline.representatives import merge_cluster_results, select_representatives
+from alm.utils.dedup import log_message_hash
+from alm.utils.logger import get_logger
+from alm.utils.metrics import stage_timer
+from alm.utils.sqlite_store import SQLiteStore
+
+logger = get_logger(__name__)
+
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "256"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_GRAPH_CONCURRENCY = int(os.getenv("PIPELINE_GRAPH_CONCURRENCY", "8"))
+PIPELINE_PERSIST_CONCURRENCY = int(os.getenv("PIPELINE_PERSIST_CONCURRENCY", "2"))
+PIPELINE_SPILL_DIR = os.getenv("PIPELINE_SPILL_DIR") or None
+
+# Marks the end of a stream; it is passed along from stage to stage.
+_END = object()
+
+
+async def run_stage(
+    worker: Callable[[object], Awaitable[Optional[object]]],
+    inbox: asyncio.Queue,
+    outbox: Optional[asyncio.Queue],
+    concurrency: int,
+) -> None:
+    """Run `concurrency` workers that consume `inbox` until the end marker.
+
+    Non-None worker results are put on `outbox`. Since `outbox` is bounded,
+    the workers block when the next stage falls behind. Once every worker has
+    finished, the end marker is forwarded to `outbox`.
+    """
+
+    async def _loop():
+        while True:
+            item = await inbox.get()
+            if item is _END:
+                # Let the sibling workers see the end marker too
+                await inbox.put(_END)
+                return
+            result = await worker(item)
+            if outbox is not None and result is not None:
+                await outbox.put(result)
+
+    await asyncio.gather(*[_loop() for _ in range(max(1, concurrency))])
+    if outbox is not None:
+        await outbox.put(_END)
+
+
+async def _produce(source: AsyncIterator, outbox: asyncio.Queue) -> None:
+    async for item in source:
+        await outbox.put(item)
+    await outbox.put(_END)
+
+
+def _batched(iterable, batch_size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _file_alert_batches(batch_size: int) -> AsyncIterator[List[GrafanaAlert]]:
+    batches = _batched(iter_ingested_alerts("data/logs/failed"), batch_size)
+    while True:
+        # Parsing is blocking file IO, keep it off the event loop
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            return
+        yield batch
+
+
+async def _db_alert_batches(batch_size: int) -> AsyncIterator[List[GrafanaAlert]]:
+    """Page through the alerts table by primary key."""
+    last_id = 0
+    while True:
+        async with get_session() as db:
+            result = await db.exec(
+                select(GrafanaAlert)
+                .where(GrafanaAlert.id > last_id)
+                .order_by(GrafanaAlert.id)
+                .limit(batch_size)
+            )
+            batch = result.all()
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield batch
+
+
+async def _insert_alerts(alerts: List[GrafanaAlert]) -> Tuple[List[int], List[str]]:
+    """Insert raw alerts and return their ids and log messages."""
+    await bulk_upsert_alerts(alerts)
+    return [alert.id for alert in alerts], [alert.logMessage for alert in alerts]
+
+
+async def _fetch_alerts(ids: List[int]) -> List[GrafanaAlert]:
+    async with get_session() as db:
+        result = await db.exec(select(GrafanaAlert).where(GrafanaAlert.id.in_(ids)))
+        return result.all()
+
+
+async def _apply_cluster_result(
+    ids: List[int], label: str, result: GrafanaAlert, batch_size: int
+) -> None:
+    """Copy a representative's graph result to every alert of its cluster."""
+    values = {field: getattr(result, field) for field in CLUSTER_RESULT_FIELDS}
+    values["logCluster"] = label
+    async with get_session() as db:
+        for start in range(0, len(ids), batch_size):
+            await db.execute(
+                update(GrafanaAlert)
+                .where(GrafanaAlert.id.in_(ids[start : start + batch_size]))
+                .values(**values)
+            )
+        await db.commit()
+
+
+def _spill(path: str, array: np.ndarray) -> None:
+    """Append the rows of an array to a spill file."""
+    with open(path, "ab") as file:
+        file.write(np.ascontiguousarray(array).tobytes())
+
+
+def _read_spill(path: str, dtype, columns: Optional[int] = None) -> np.ndarray:
+    """Read a spill file back as a read-only memory map."""
+    shape = (-1,) if columns is None else (-1, columns)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros((0,) + shape[1:], dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r").reshape(shape)
+
+
+def _group_by_label(
+    ids: np.ndarray, labels: np.ndarray, path: str
+) -> Tuple[np.ndarray, Dict[int, slice]]:
+    """Sort ids by label into a spill file.
+
+    Returns:
+        (the sorted ids, memory mapped; the slice of every label in them)
+    """
+    order = np.argsort(labels, kind="stable")
+    _spill(path, np.asarray(ids)[order])
+    values, starts, counts = np.unique(
+        labels[order], return_index=True, return_counts=True
+    )
+    slices = {
+        int(value): slice(start, start + count)
+        for value, start, count in zip(values, starts, counts)
+    }
+    return _read_spill(path, np.int64), slices
+
+
+async def streaming_training_pipeline(
+    restart_db: bool = True,
+    load_alerts_from_db: bool = False,
+    batch_size: int = PIPELINE_BATCH_SIZE,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    graph_concurrency: int = PIPELINE_GRAPH_CONCURRENCY,
+    persist_concurrency: int = PIPELINE_PERSIST_CONCURRENCY,
+    run_id: Optional[str] = None,
+):
+    """Run the training pipeline with bounded queues between the stages."""
+    with tempfile.TemporaryDirectory(dir=PIPELINE_SPILL_DIR) as spill_dir:
+        await _streaming_training_pipeline(
+            spill_dir,
+            restart_db,
+            load_alerts_from_db,
+            batch_size,
+            queue_size,
+            graph_concurrency,
+            persist_concurrency,
+            run_id,
+        )
+
+
+async def _streaming_training_pipeline(
+    spill_dir: str,
+    restart_db: bool,
+    load_alerts_from_db: bool,
+    batch_size: int,
+    queue_size: int,
+    graph_concurrency: int,
+    persist_concurrency: int,
+    run_id: Optional[str],
+):
+    journal = RunJournal(run_id)
+
+    if restart_db:
+        await init_tables(delete_tables=True)
+
+    start_time = time.time()
+
+    # Stage 1: load -> persist raw alerts -> embed
+    loaded: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stored: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    paths = {
+        name: os.path.join(spill_dir, f"{name}.bin")
+        for name in ("ids", "embeddings", "templates", "duplicates", "members")
+    }
+    dimension = 0
+    distinct_count = 0
+
+    async def persist_raw(batch: List[GrafanaAlert]):
+        if load_alerts_from_db:
+            return [alert.id for alert in batch], [alert.logMessage for alert in batch]
+        with stage_timer("persist", items=len(batch)):
+            return await _insert_alerts(batch)
+
+    # Duplicate log messages are embedded once; the duplicates only remember
+    # the embedding row of their first occurrence
+    hash_rows = SQLiteStore(os.path.join(spill_dir, "hashes.sqlite"), "hash_rows")
+    # Templates of the embedded logs, persisted with the cluster model
+    template_miner = TemplateMiner()
+
+    async def embed(item: Tuple[List[int], List[str]]):
+        nonlocal dimension, distinct_count
+        ids, messages = item
+        digests = [log_message_hash(message) for message in messages]
+        known = await asyncio.to_thread(hash_rows.get_many, set(digests))
+        new_ids, new_messages, new_rows, duplicates = [], [], [], []
+        for alert_id, message, digest in zip(ids, messages, digests):
+            row = known.get(digest)
+            if row is None:
+                row = known[digest] = distinct_count
+                distinct_count += 1
+                new_ids.append(alert_id)
+                new_messages.append(message)
+                new_rows.append((digest, row))
+            else:
+                duplicates.append((alert_id, row))
+        await asyncio.to_thread(hash_rows.put_many, new_rows)
+        if duplicates:
+            _spill(paths["duplicates"], np.asarray(duplicates, dtype=np.int64))
+        if not new_messages:
+            return
+        _spill(
+            paths["templates"],
+            np.asarray(
+                [template_miner.add(message) for message in new_messages],
+                dtype=np.int64,
+            ),
+        )
+        with stage_timer("embed", items=len(new_messages)):
+            embeddings = await asyncio.to_thread(_embed_logs, new_messages)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        dimension = embeddings.shape[1]
+        _spill(paths["ids"], np.asarray(new_ids, dtype=np.int64))
+        _spill(paths["embeddings"], embeddings)
+
+    source = (
+        _db_alert_batches(batch_size)
+        if load_alerts_from_db
+        else _file_alert_batches(batch_size)
+    )
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(_produce(source, loaded))
+        tg.create_task(run_stage(persist_raw, loaded, stored, persist_concurrency))
+        # A single embedding worker, the encoder already uses every core
+        tg.create_task(run_stage(embed, stored, None, 1))
+    hash_rows.close()
+
+    if not distinct_count:
+        logger.info("no alerts to process")
+        return
+
+    ids = _read_spill(paths["ids"], np.int64)
+    embeddings = _read_spill(paths["embeddings"], np.float32, dimension)
+    duplicates = _read_spill(paths["duplicates"], np.int64, 2)
+    alert_count = len(ids) + len(duplicates)
+    logger.info(
+        "alerts loaded %d, distinct logs embedded %d - Time: %.2fs",
+        alert_count,
+        len(ids),
+        time.time() - start_time,
+    )
+
+    # Stage 2: cluster the whole corpus and pick the representatives
+    with stage_timer("cluster", items=len(ids)):
+        row_labels = np.asarray(
+            await asyncio.to_thread(
+                train_cluster_embeddings,
+                embeddings,
+                sample_weight=np.bincount(duplicates[:, 1], minlength=len(ids)) + 1,
+                template_miner=template_miner,
+                template_ids=_read_spill(paths["templates"], np.int64).tolist(),
+            ),
+            dtype=np.int64,
+        )
+    representatives = select_representatives(embeddings, row_labels)
+    del embeddings
+
+    # Members of every cluster, sorted by label on disk
+    members, member_slices = _group_by_label(
+        np.concatenate([ids, duplicates[:, 0]]),
+        np.concatenate([row_labels, row_labels[duplicates[:, 1]]]),
+        paths["members"],
+    )
+    logger.info("clusters found %d", len(member_slices))
+
+    def cluster_members(label: str) -> List[int]:
+        return members[member_slices[int(label)]].tolist()
+
+    # Stage 3: fetch representatives -> graph -> apply results per cluster
+    async def representative_batches():
+        samples_by_id = {
+            int(ids[index]): (label, position)
+            for label, indices in representatives.items()
+            for position, index in enumerate(indices)
+        }
+        for chunk in _batched(list(samples_by_id), batch_size):
+            for alert in await _fetch_alerts(chunk):
+                label, position = samples_by_id[alert.id]
+                yield label, position, alert
+
+    pending: asyncio.Queue = asyncio.Queue(maxsize=graph_concurrency * 2)
+    processed: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    sample_results: Dict[str, List[Optional[GrafanaAlert]]] = {}
+
+    async def run_graph(item: Tuple[str, int, GrafanaAlert]):
+        label, position, alert = item
+        _, result = await _process_alert(label, alert, journal)
+        results = sample_results.setdefault(label, [None] * len(representatives[label]))
+        results[position] = result
+        # Hand the cluster on once all of its samples are processed
+        if any(result is None for result in results):
+            return None
+        del sample_results[label]
+        return label, merge_cluster_results(results)
+
+    async def persist_result(item: Tuple[str, GrafanaAlert]):
+        label, result = item
+        cluster_ids = cluster_members(label)
+        with stage_timer("persist", items=len(cluster_ids)):
+            await _apply_cluster_result(cluster_ids, label, result, batch_size)
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(_produce(representative_batches(), pending))
+        tg.create_task(run_stage(run_graph, pending, processed, graph_concurrency))
+        tg.create_task(run_stage(persist_result, processed, None, persist_concurrency))
+
+    journal.complete()
+    logger.info(
+        "streaming pipeline finished %d alerts in %d clusters - Time: %.2fs",
+        alert_count,
+        len(member_slices),
+        time.time() - start_time,
+    )
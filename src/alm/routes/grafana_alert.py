@@ -1,17 +1,32 @@
-from typing import List
+import asyncio
+from typing import Dict, List
 from fastapi import APIRouter, Depends, Query, status
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 from alm.database import get_session_gen
-from alm.models import GrafanaAlert
+from alm.models import CLUSTER_RESULT_FIELDS, GrafanaAlert
 from alm.agents.graph import inference_graph
 from alm.models import LogEntry, LogLabels, LogLevel
 from typing import Optional
 from datetime import datetime
 from alm.database import convert_state_to_grafana_alert
+from alm.utils.dedup import log_message_hash
 
 router = APIRouter(prefix="/grafana-alert", tags=["grafana-alert"])
 
+# Graph runs in progress by log hash, shared by concurrent duplicate alerts
+_inflight_graph_runs: Dict[str, asyncio.Task] = {}
+
+
+async def _run_inference_graph(log_hash: str, log_entry: LogEntry) -> dict:
+    task = _inflight_graph_runs.get(log_hash)
+    if task is None:
+        task = asyncio.create_task(inference_graph().ainvoke({"log_entry": log_entry}))
+        _inflight_graph_runs[log_hash] = task
+        task.add_done_callback(lambda _: _inflight_graph_runs.pop(log_hash, None))
+    # A cancelled request must not cancel the run the other duplicates wait on
+    return await asyncio.shield(task)
+
 
 @router.get(
     "/{alert_id}", summary="Get grafana alert by id", response_model=GrafanaAlert
@@ -113,9 +128,28 @@ async def post_log_alert(
         service_name=service_name,
     )
     log_entry = LogEntry(timestamp=timestamp, log_labels=log_labels, message=log_alert)
-    graph_result = await inference_graph().ainvoke({"log_entry": log_entry})
 
-    grafana_alert = convert_state_to_grafana_alert(graph_result)
+    # Duplicates of an already processed log reuse its result instead of
+    # running the graph again
+    log_hash = log_message_hash(log_alert)
+    processed = await session.exec(
+        select(GrafanaAlert)
+        .where(GrafanaAlert.logHash == log_hash)
+        .where(GrafanaAlert.stepByStepSolution.is_not(None))
+        .limit(1)
+    )
+    processed = processed.first()
+    if processed is not None:
+        graph_result = {
+            field: getattr(processed, field)
+            for field in (*CLUSTER_RESULT_FIELDS, "logCluster")
+        }
+    else:
+        graph_result = await _run_inference_graph(log_hash, log_entry)
+
+    grafana_alert = convert_state_to_grafana_alert(
+        {**graph_result, "log_entry": log_entry}
+    )
 
     session.add(grafana_alert)
     await session.commit()
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from fastapi import APIRouter
+
+from alm.agents.node import cluster_inference_batcher
+from alm.utils.llm_cache import llm_response_cache
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/cluster-inference", summary="Cluster inference batching histograms")
+async def cluster_inference_metrics() -> dict:
+    return cluster_inference_batcher.stats()
+
+
+@router.get("/llm-cache", summary="LLM response cache hits and misses per node")
+async def llm_cache_metrics() -> dict:
+    return llm_response_cache.stats()
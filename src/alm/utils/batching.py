@@ -0,0 +1,129 @@
+"""
+Asyncio micro-batcher for per-request model inference.
+
+Concurrent callers submit single items. The batcher collects them for up to
+`max_wait_ms` after the first one arrives, or until `max_batch_size` items are
+waiting, runs the batch function once and resolves every caller's future with
+its own result. Batches run one at a time, so requests that arrive during a
+batch form the next one.
+
+Usage:
+    batcher = MicroBatcher(process_batch, max_batch_size=32, max_wait_ms=10)
+    result = await batcher.submit(item)
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from alm.utils.logger import get_logger
+from alm.utils.metrics import Histogram
+
+logger = get_logger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_WAIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class MicroBatcher:
+    """Collect concurrent single-item calls into batched calls."""
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10,
+    ):
+        """
+        Args:
+            process_batch: Async function mapping a list of items to the list of
+                their results, in the same order
+            max_batch_size: Most items per batch
+            max_wait_ms: Longest time the first item of a batch waits for others
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        # Time from submission to the start of the item's batch
+        self.queue_wait = Histogram(QUEUE_WAIT_BUCKETS)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Process one item as part of the next batch and return its result."""
+        loop = asyncio.get_running_loop()
+        # The worker is bound to the event loop it was started on
+        if (
+            self._worker is None
+            or self._worker.done()
+            or self._worker.get_loop() is not loop
+        ):
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+        future = loop.create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_sizes.to_dict(),
+            "queue_wait_seconds": self.queue_wait.to_dict(),
+        }
+
+    async def _collect(self, queue: asyncio.Queue, batch: list) -> None:
+        batch.append(await queue.get())
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except TimeoutError:
+                break
+        # Items that are already waiting join without further delay
+        while len(batch) < self.max_batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        batch = []
+        try:
+            while True:
+                batch = []
+                await self._collect(queue, batch)
+                await self._process(batch)
+        finally:
+            # Stopped (cancelled or crashed): fail the items it holds and those
+            # still queued, their callers would otherwise wait forever
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            error = RuntimeError("micro-batcher worker stopped")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _process(self, batch: list) -> None:
+        started = time.perf_counter()
+        for _, _, submitted in batch:
+            self.queue_wait.observe(started - submitted)
+        # Callers that gave up do not need a result
+        pending = [(item, future) for item, future, _ in batch if not future.done()]
+        if not pending:
+            return
+        self.batch_sizes.observe(len(pending))
+        try:
+            results = await self.process_batch([item for item, _ in pending])
+            if len(results) != len(pending):
+                raise ValueError(
+                    f"batch of {len(pending)} items returned {len(results)} results"
+                )
+        except Exception as e:
+            logger.exception("batch of %d items failed", len(pending))
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,110 @@
+"""
+Idempotent schema upgrades of existing tables.
+
+`create_all` creates missing tables but never changes existing ones, so columns
+added to a model later (e.g. `GrafanaAlert.logHash`) are missing from databases
+created before. `add_missing_columns` adds them, with their indexes, and does
+nothing on an up to date database. Columns derived from others are then filled
+in for the existing rows (see `fill_log_hashes`).
+
+Usage:
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        await conn.run_sync(add_missing_columns, metadata)
+        await conn.run_sync(fill_log_hashes)
+"""
+
+from typing import List
+
+from sqlalchemy import MetaData, bindparam, inspect, select, update
+from sqlalchemy.engine import Connection
+
+from alm.models import GrafanaAlert
+from alm.utils.dedup import log_message_hash
+from alm.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def add_missing_columns(conn: Connection, metadata: MetaData) -> List[str]:
+    """
+    Add the model columns missing from existing tables and create their indexes.
+
+    Args:
+        conn: Synchronous connection (see `AsyncConnection.run_sync`)
+        metadata: Metadata of the models
+
+    Returns:
+        Added columns as "table.column"
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    # Guards against a concurrent upgrade where the database supports it
+    if_not_exists = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise ValueError(
+                    f"Cannot add NOT NULL column {table.name}.{column.name} "
+                    "without a server default to existing rows"
+                )
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {if_not_exists}{preparer.format_column(column)} "
+                f"{column_type}"
+            )
+            added.append(f"{table.name}.{column.name}")
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    if added:
+        logger.info("added columns %s", ", ".join(added))
+    return added
+
+
+def fill_log_hashes(conn: Connection, chunk_size: int = 1000) -> int:
+    """
+    Compute the log hash of the alerts stored without one.
+
+    Rows written before `GrafanaAlert.logHash` existed have it NULL, so neither
+    the incremental ingestion nor the API dedup would match them.
+
+    Args:
+        conn: Synchronous connection (see `AsyncConnection.run_sync`)
+        chunk_size: Rows read and updated at once
+
+    Returns:
+        Number of rows filled in
+    """
+    table = GrafanaAlert.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values(logHash=bindparam("log_hash"))
+    )
+    filled = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.logMessage)
+            .where(table.c.logHash.is_(None))
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            statement,
+            [
+                {"row_id": row_id, "log_hash": log_message_hash(message)}
+                for row_id, message in rows
+            ],
+        )
+        filled += len(rows)
+    if filled:
+        logger.info("filled the log hash of %d alerts", filled)
+    return filled
@@ -0,0 +1,42 @@
+import hashlib
+import re
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_log_message(message: str) -> str:
+    """Collapse whitespace runs to a single space and strip the ends."""
+    return _WHITESPACE.sub(" ", message).strip()
+
+
+def log_message_hash(message: str) -> str:
+    """Content hash of a log message, equal for whitespace-equivalent messages."""
+    return hashlib.sha256(normalize_log_message(message).encode()).hexdigest()
+
+
+def dedup_log_messages(messages: Sequence[str]) -> Tuple[List[int], np.ndarray]:
+    """
+    Find the distinct log messages, up to whitespace.
+
+    Args:
+        messages: Log messages
+
+    Returns:
+        (index of the first occurrence of every distinct message, position in
+        that list of every message), so that
+        `messages[unique[inverse[i]]]` is equivalent to `messages[i]`
+    """
+    positions = {}
+    unique: List[int] = []
+    inverse = np.empty(len(messages), dtype=np.int64)
+    for index, message in enumerate(messages):
+        digest = log_message_hash(message)
+        position = positions.get(digest)
+        if position is None:
+            position = positions[digest] = len(unique)
+            unique.append(index)
+        inverse[index] = position
+    return unique, inverse
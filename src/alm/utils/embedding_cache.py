@@ -0,0 +1,99 @@
+"""
+Persistent cache of log embeddings.
+
+Embeddings are keyed by the encoder model name and a hash of the embedded text,
+so the same log is only run through the encoder once across training runs,
+retraining runs and inference. They are stored as raw float32 blobs in a local
+SQLite file (see `alm.utils.sqlite_store.SQLiteStore`).
+
+Usage:
+    from alm.utils.embedding_cache import cached_encode
+
+    embeddings = cached_encode(texts, model_name, encode)
+
+Environment Variables:
+    EMBEDDING_CACHE_ENABLED: Use the cache. Default: true
+    EMBEDDING_CACHE_PATH: Cache file. Default: $DATA_DIR/embedding_cache.sqlite
+"""
+
+import functools
+import hashlib
+import os
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+
+from alm.utils.env import env_flag
+from alm.utils.logger import get_logger
+from alm.utils.sqlite_store import SQLiteStore
+
+logger = get_logger(__name__)
+
+EMBEDDING_CACHE_ENABLED = env_flag("EMBEDDING_CACHE_ENABLED", default=True)
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(os.getenv("DATA_DIR", "./data")) / "embedding_cache.sqlite"),
+)
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode()).hexdigest()
+
+
+class EmbeddingCache(SQLiteStore):
+    """float32 embeddings by key in a SQLite database file."""
+
+    VALUE_TYPE = "BLOB"
+
+    def __init__(self, path: str):
+        super().__init__(path, table="embedding_cache")
+
+    def _encode(self, embedding: np.ndarray) -> bytes:
+        return np.asarray(embedding, dtype=np.float32).tobytes()
+
+    def _decode(self, blob: bytes) -> np.ndarray:
+        return np.frombuffer(blob, dtype=np.float32)
+
+
+@functools.cache
+def get_embedding_cache(path: str = EMBEDDING_CACHE_PATH) -> EmbeddingCache:
+    """Process-wide cache instance of a file."""
+    return EmbeddingCache(path)
+
+
+def cached_encode(
+    texts: List[str],
+    model_name: str,
+    encode: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    """
+    Embed texts, running `encode` only for texts not cached yet.
+
+    Args:
+        texts: Texts to embed
+        model_name: Encoder model, part of the cache key
+        encode: Embeds a list of texts into an N x D matrix
+
+    Returns:
+        float32 embedding matrix, one row per text (same order as input)
+    """
+    if not EMBEDDING_CACHE_ENABLED or not texts:
+        return np.asarray(encode(texts), dtype=np.float32)
+
+    cache = get_embedding_cache()
+    keys = [embedding_key(model_name, text) for text in texts]
+    cached = cache.get_many(set(keys))
+    # Each distinct missing text is encoded once
+    missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+    logger.info(
+        "embedding cache hits %d, texts to encode %d",
+        len(texts) - sum(key in missing for key in keys),
+        len(missing),
+    )
+    if missing:
+        embeddings = np.asarray(encode(list(missing.values())), dtype=np.float32)
+        new_entries = dict(zip(missing, embeddings))
+        cache.put_many(new_entries.items())
+        cached.update(new_entries)
+    return np.vstack([cached[key] for key in keys])
@@ -0,0 +1,70 @@
+"""
+Process-wide registry of SentenceTransformer encoders.
+
+Loading an encoder reads the model weights from disk, so every model is loaded
+once per process and device and shared by all callers. Loading is lazy and
+thread-safe: concurrent first calls for the same model wait for a single load.
+
+Usage:
+    from alm.utils.encoders import get_encoder
+
+    embeddings = get_encoder().encode(["some log"])
+
+Environment Variables:
+    SENTENCE_TRANSFORMER_MODEL_NAME: Default encoder model
+    SENTENCE_TRANSFORMER_DEVICE: Device to run the encoders on. Default: cpu
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from sentence_transformers import SentenceTransformer
+
+from alm.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SENTENCE_TRANSFORMER_DEVICE = os.getenv("SENTENCE_TRANSFORMER_DEVICE", "cpu")
+
+_encoders: Dict[Tuple[str, str], SentenceTransformer] = {}
+_load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_encoder(
+    model_name: Optional[str] = None, device: Optional[str] = None
+) -> SentenceTransformer:
+    """
+    Get the shared encoder for a model and device, loading it on first use.
+
+    Args:
+        model_name: Model to load. Defaults to SENTENCE_TRANSFORMER_MODEL_NAME
+        device: Device to run on. Defaults to SENTENCE_TRANSFORMER_DEVICE
+    """
+    key = (
+        model_name or os.getenv("SENTENCE_TRANSFORMER_MODEL_NAME"),
+        device or SENTENCE_TRANSFORMER_DEVICE,
+    )
+    encoder = _encoders.get(key)
+    if encoder is not None:
+        return encoder
+
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    # Only callers of the same model wait for its load
+    with load_lock:
+        encoder = _encoders.get(key)
+        if encoder is None:
+            logger.info("loading encoder %s on %s", *key)
+            encoder = SentenceTransformer(key[0], device=key[1])
+            _encoders[key] = encoder
+    return encoder
+
+
+def warm_up_encoder(
+    model_name: Optional[str] = None, device: Optional[str] = None
+) -> None:
+    """Load an encoder and run one forward pass so the first request is fast."""
+    get_encoder(model_name, device).encode(["warm up"], show_progress_bar=False)
+    logger.info("encoder warmed up")
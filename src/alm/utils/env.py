@@ -0,0 +1,25 @@
+"""
+Parsing of environment variables.
+
+Usage:
+    from alm.utils.env import env_flag
+
+    ENABLED = env_flag("FEATURE_ENABLED", default=True)
+"""
+
+import os
+
+_TRUE_VALUES = ("true", "1", "yes")
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """True if the variable is one of true, 1 or yes (any case), else False.
+
+    Args:
+        name: Environment variable
+        default: Value when the variable is not set
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in _TRUE_VALUES
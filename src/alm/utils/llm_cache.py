@@ -0,0 +1,249 @@
+"""
+Two-tier in-process cache of LLM node outputs.
+
+- exact tier: keyed by node name, prompt version, model and a hash of the
+  inputs, so an identical prompt is only sent to the LLM once
+- semantic tier (optional, per node): reuses the output of a prior input whose
+  embedding is at least LLM_CACHE_SEMANTIC_THRESHOLD cosine-similar, for
+  near-identical logs and summaries
+
+Entries expire after LLM_CACHE_TTL_SECONDS and the least recently used ones are
+evicted beyond LLM_CACHE_MAX_ENTRIES. Concurrent misses of the same key share a
+single LLM call. Hits, misses and evictions are counted per node (see `stats`).
+
+Usage:
+    output = await llm_response_cache.get_or_call(
+        "summarize_log", cache_key("summarize_log", version, model, log),
+        lambda: call_llm(log), semantic_text=log,
+    )
+
+Environment Variables:
+    LLM_CACHE_ENABLED: Use the cache. Default: true
+    LLM_CACHE_MAX_ENTRIES: Entries over all nodes. Default: 10000
+    LLM_CACHE_TTL_SECONDS: Lifetime of an entry. Default: 86400
+    LLM_CACHE_SEMANTIC_NODES: Comma separated nodes with a semantic tier, of
+        summarize_log, classify_log, router_step_by_step_solution and
+        triage_log. Default: none
+    LLM_CACHE_SEMANTIC_THRESHOLD: Min cosine similarity of a semantic hit.
+        Default: 0.95
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from alm.utils.env import env_flag
+from alm.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+LLM_CACHE_ENABLED = env_flag("LLM_CACHE_ENABLED", default=True)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_SEMANTIC_NODES = os.getenv("LLM_CACHE_SEMANTIC_NODES", "")
+LLM_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+
+
+def prompt_version(*templates: str) -> str:
+    """Short hash of a node's prompt templates; edited prompts get new keys."""
+    return hashlib.sha256("\0".join(templates).encode()).hexdigest()[:12]
+
+
+def cache_key(node: str, version: str, model: Optional[str], *inputs: Any) -> str:
+    payload = json.dumps([node, version, model, inputs], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    from alm.utils.embedding_cache import cached_encode
+    from alm.utils.encoders import get_encoder
+
+    return cached_encode(
+        texts,
+        os.getenv("SENTENCE_TRANSFORMER_MODEL_NAME"),
+        lambda missing: get_encoder().encode(missing, show_progress_bar=False),
+    )
+
+
+class LLMResponseCache:
+    """LRU + TTL cache of node outputs with an optional embedding lookup."""
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        semantic_nodes: Tuple[str, ...] = (),
+        semantic_threshold: float = LLM_CACHE_SEMANTIC_THRESHOLD,
+        embed: Callable[[List[str]], np.ndarray] = _embed,
+    ):
+        """
+        Args:
+            max_entries: Entries over all nodes, least recently used go first
+            ttl_seconds: Lifetime of an entry
+            semantic_nodes: Nodes whose outputs are also looked up by similarity
+            semantic_threshold: Min cosine similarity of a semantic hit
+            embed: Embeds a list of texts into an N x D matrix
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.semantic_nodes = set(semantic_nodes)
+        self.semantic_threshold = semantic_threshold
+        self.embed = embed
+        # key -> (node, output, expiry time)
+        self._entries: "OrderedDict[str, Tuple[str, Any, float]]" = OrderedDict()
+        # node -> {key: normalized embedding of the input}
+        self._embeddings: Dict[str, Dict[str, np.ndarray]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._counters: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, node: str, event: str) -> None:
+        self._counters.setdefault(node, Counter())[event] += 1
+
+    def _remove(self, key: str) -> None:
+        node, _, _ = self._entries.pop(key)
+        self._embeddings.get(node, {}).pop(key, None)
+
+    def _get_exact(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            node, output, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self._count(node, "expired")
+                return False, None
+            self._entries.move_to_end(key)
+            return True, output
+
+    def _get_semantic(self, node: str, embedding: np.ndarray) -> Tuple[bool, Any]:
+        with self._lock:
+            candidates = self._embeddings.get(node)
+            if not candidates:
+                return False, None
+            keys = list(candidates)
+            similarities = np.stack([candidates[key] for key in keys]) @ embedding
+        # Most similar live entry above the threshold
+        for position in np.argsort(-similarities):
+            if similarities[position] < self.semantic_threshold:
+                break
+            found, output = self._get_exact(keys[position])
+            if found:
+                return True, output
+        return False, None
+
+    def _put(
+        self, node: str, key: str, output: Any, embedding: Optional[np.ndarray]
+    ) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (node, output, time.monotonic() + self.ttl_seconds)
+            if embedding is not None:
+                self._embeddings.setdefault(node, {})[key] = embedding
+            while len(self._entries) > self.max_entries:
+                evicted_key = next(iter(self._entries))
+                self._count(self._entries[evicted_key][0], "evictions")
+                self._remove(evicted_key)
+
+    async def get_or_call(
+        self,
+        node: str,
+        key: str,
+        call: Callable[[], Awaitable[Any]],
+        semantic_text: Optional[str] = None,
+    ) -> Any:
+        """
+        Return the cached output of a node call, or make the call and cache it.
+
+        Args:
+            node: Node name, for the semantic tier and the metrics
+            key: Exact cache key, see `cache_key`
+            call: Makes the LLM call on a miss
+            semantic_text: Input text looked up by similarity, for semantic nodes
+        """
+        found, output = self._get_exact(key)
+        if found:
+            self._count(node, "exact_hits")
+            return output
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fill(node, key, call, semantic_text))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._count(node, "coalesced")
+        # A caller that gives up does not cancel the call the others wait for
+        return await asyncio.shield(task)
+
+    async def _fill(
+        self,
+        node: str,
+        key: str,
+        call: Callable[[], Awaitable[Any]],
+        semantic_text: Optional[str],
+    ) -> Any:
+        embedding = None
+        if semantic_text is not None and node in self.semantic_nodes:
+            embedding = (await asyncio.to_thread(self.embed, [semantic_text]))[0]
+            embedding = embedding / max(np.linalg.norm(embedding), 1e-12)
+            found, output = self._get_semantic(node, embedding)
+            if found:
+                self._count(node, "semantic_hits")
+                return output
+        self._count(node, "misses")
+        output = await call()
+        self._put(node, key, output, embedding)
+        return output
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counts and the hit rate per node."""
+        with self._lock:
+            entries = Counter(node for node, _, _ in self._entries.values())
+            counters = {node: dict(counts) for node, counts in self._counters.items()}
+        stats = {}
+        for node in sorted(set(counters) | set(entries)):
+            counts = counters.get(node, {})
+            hits = sum(
+                counts.get(event, 0)
+                for event in ("exact_hits", "semantic_hits", "coalesced")
+            )
+            lookups = hits + counts.get("misses", 0)
+            stats[node] = {
+                **counts,
+                "entries": entries.get(node, 0),
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+            }
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._embeddings.clear()
+
+
+llm_response_cache = LLMResponseCache(
+    semantic_nodes=tuple(
+        node.strip() for node in LLM_CACHE_SEMANTIC_NODES.split(",") if node.strip()
+    )
+)
+
+
+async def cached_llm_call(
+    node: str,
+    key: str,
+    call: Callable[[], Awaitable[Any]],
+    semantic_text: Optional[str] = None,
+) -> Any:
+    """`llm_response_cache.get_or_call`, or a plain call with the cache disabled."""
+    if not LLM_CACHE_ENABLED:
+        return await call()
+    return await llm_response_cache.get_or_call(node, key, call, semantic_text)
@@ -0,0 +1,326 @@
+"""
+Token-budgeted compression of logs before they are put into LLM prompts.
+
+A log within the budget is returned unchanged. A longer one is compressed in
+steps, stopping as soon as it fits:
+- runs of lines that only differ in variable parts (see
+  `alm.utils.log_normalization.mask_log`) keep their first and last line, and
+  later exact copies of a long line are dropped
+- stack traces keep their outermost (Java) or innermost (Python) frames
+- long JSON blobs are parsed and shrunk: `*_lines` copies of a string field are
+  dropped, long strings keep their head and tail, long lists their ends
+- what is still over the budget keeps its head, the part from the error line
+  on and its tail
+
+Tokens are counted with a Hugging Face tokenizer, by default the one of the
+sentence-transformer model, which is already installed with the encoder. Set
+LOG_TOKENIZER to the tokenizer of the chat model for exact counts. When no
+tokenizer can be loaded, tokens are estimated as 4 characters each.
+
+Usage:
+    from alm.utils.log_compression import compress_log
+
+    prompt_log = compress_log(log_message)
+
+Environment Variables:
+    LOG_PROMPT_MAX_TOKENS: Token budget of a log in a prompt. Default: 2048
+    LOG_TOKENIZER: Tokenizer name or path. Default: SENTENCE_TRANSFORMER_MODEL_NAME
+"""
+
+import bisect
+import functools
+import json
+import os
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+from alm.utils.log_normalization import mask_log
+from alm.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+LOG_PROMPT_MAX_TOKENS = int(os.getenv("LOG_PROMPT_MAX_TOKENS", "2048"))
+LOG_TOKENIZER = os.getenv("LOG_TOKENIZER") or os.getenv(
+    "SENTENCE_TRANSFORMER_MODEL_NAME"
+)
+
+CHARS_PER_TOKEN = 4
+# Lines shorter than this are never dropped as copies ("}", "---", ...)
+MIN_DEDUPED_LINE_CHARS = 20
+STACK_FRAMES_KEPT = 3
+JSON_BLOB_MIN_CHARS = 1000
+JSON_STRING_MAX_CHARS = 1000
+JSON_LIST_MAX_ITEMS = 6
+# Shares of the budget for the head and the tail of the log; the part from the
+# error line on gets the rest
+HEAD_SHARE = 0.2
+TAIL_SHARE = 0.3
+# Budget reserved for each omission marker
+MARKER_TOKENS = 16
+
+ERROR_LINE = re.compile(r"fatal:|FAILED!|Traceback \(most recent call last\)|\bERROR\b")
+PYTHON_TRACEBACK = "Traceback (most recent call last):"
+PYTHON_FRAME = re.compile(r'^\s*File "[^"]*", line \d+')
+JAVA_FRAME = re.compile(r"^\s+at \S|^\s*\.\.\. \d+ more$")
+
+TokenOffsets = Callable[[str], List[int]]
+
+
+def character_offsets(text: str) -> List[int]:
+    """Start offsets of tokens estimated as CHARS_PER_TOKEN characters each."""
+    return list(range(0, len(text), CHARS_PER_TOKEN))
+
+
+@functools.cache
+def _get_tokenizer(name: Optional[str]):
+    if not name:
+        return None
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(name)
+    except Exception as e:
+        logger.warning(
+            "tokenizer %s unavailable, estimating %d characters per token: %s",
+            name,
+            CHARS_PER_TOKEN,
+            e,
+        )
+        return None
+
+
+def tokenizer_offsets(text: str) -> List[int]:
+    """Start offsets of the tokens of the LOG_TOKENIZER tokenizer."""
+    tokenizer = _get_tokenizer(LOG_TOKENIZER)
+    if tokenizer is None or not getattr(tokenizer, "is_fast", False):
+        return character_offsets(text)
+    encoding = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        verbose=False,
+    )
+    return [start for start, _ in encoding["offset_mapping"]]
+
+
+def count_tokens(text: str, token_offsets: TokenOffsets = tokenizer_offsets) -> int:
+    return len(token_offsets(text))
+
+
+def _marker(omitted: int, unit: str) -> str:
+    return f"[... {omitted} {unit} omitted ...]"
+
+
+def collapse_repeated_lines(text: str) -> str:
+    """Keep the ends of runs of similar lines and drop copies of long lines."""
+    lines = text.split("\n")
+    templates = [mask_log(line).strip() for line in lines]
+    result = []
+    seen = set()
+    copies = 0
+
+    def keep(line: str) -> None:
+        nonlocal copies
+        key = line.strip()
+        if len(key) >= MIN_DEDUPED_LINE_CHARS and key in seen:
+            copies += 1
+            return
+        seen.add(key)
+        result.append(line)
+
+    start = 0
+    while start < len(lines):
+        end = start + 1
+        while end < len(lines) and templates[end] == templates[start]:
+            end += 1
+        keep(lines[start])
+        if end - start > 2:
+            result.append(_marker(end - start - 2, "similar lines"))
+        if end - start > 1:
+            keep(lines[end - 1])
+        start = end
+    if copies:
+        result.append(_marker(copies, "repeated lines"))
+    return "\n".join(result)
+
+
+def collapse_stack_traces(text: str) -> str:
+    """Keep the innermost Python frames and the outermost Java frames."""
+    lines = text.split("\n")
+    result = []
+    position = 0
+    while position < len(lines):
+        line = lines[position]
+        if line.strip() == PYTHON_TRACEBACK:
+            result.append(line)
+            frames, position = _python_frames(lines, position + 1)
+            if len(frames) > STACK_FRAMES_KEPT:
+                result.append(_marker(len(frames) - STACK_FRAMES_KEPT, "frames"))
+                frames = frames[-STACK_FRAMES_KEPT:]
+            result.extend(frame_line for frame in frames for frame_line in frame)
+        elif JAVA_FRAME.match(line):
+            end = position
+            while end < len(lines) and JAVA_FRAME.match(lines[end]):
+                end += 1
+            result.extend(lines[position : min(end, position + STACK_FRAMES_KEPT)])
+            if end - position > STACK_FRAMES_KEPT:
+                result.append(_marker(end - position - STACK_FRAMES_KEPT, "frames"))
+            position = end
+        else:
+            result.append(line)
+            position += 1
+    return "\n".join(result)
+
+
+def _python_frames(lines: List[str], position: int) -> Tuple[List[List[str]], int]:
+    """Frames of a Python traceback: the File line and its indented source."""
+    frames = []
+    while position < len(lines) and PYTHON_FRAME.match(lines[position]):
+        frame = [lines[position]]
+        position += 1
+        while (
+            position < len(lines)
+            and lines[position].startswith((" ", "\t"))
+            and not PYTHON_FRAME.match(lines[position])
+        ):
+            frame.append(lines[position])
+            position += 1
+        frames.append(frame)
+    return frames, position
+
+
+def _shrink_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: _shrink_json(item)
+            for key, item in value.items()
+            # Ansible results repeat stdout / stderr / msg split into lines
+            if not (key.endswith("_lines") and key[: -len("_lines")] in value)
+        }
+    if isinstance(value, list):
+        if len(value) > JSON_LIST_MAX_ITEMS:
+            half = JSON_LIST_MAX_ITEMS // 2
+            omitted = _marker(len(value) - 2 * half, "items")
+            value = [*value[:half], omitted, *value[-half:]]
+        return [_shrink_json(item) for item in value]
+    if isinstance(value, str):
+        value = collapse_stack_traces(collapse_repeated_lines(value))
+        if len(value) > JSON_STRING_MAX_CHARS:
+            half = JSON_STRING_MAX_CHARS // 2
+            omitted = _marker(len(value) - 2 * half, "characters")
+            value = f"{value[:half]}{omitted}{value[-half:]}"
+    return value
+
+
+def collapse_json_blobs(text: str) -> str:
+    """Shrink JSON objects of at least JSON_BLOB_MIN_CHARS."""
+    collapsed = _collapse_json_blobs(text)
+    if collapsed == text and "\\\\" in text:
+        # Logs often hold JSON whose backslashes were escaped once more
+        unescaped = text.replace("\\\\", "\\")
+        collapsed = _collapse_json_blobs(unescaped)
+        if collapsed == unescaped:
+            return text
+    return collapsed
+
+
+def _collapse_json_blobs(text: str) -> str:
+    decoder = json.JSONDecoder()
+    result = []
+    position = 0
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, end = decoder.raw_decode(text, start)
+        except ValueError:
+            start = text.find("{", start + 1)
+            continue
+        if end - start >= JSON_BLOB_MIN_CHARS:
+            result.append(text[position:start])
+            result.append(json.dumps(_shrink_json(value), ensure_ascii=False))
+            position = end
+        start = text.find("{", end)
+    result.append(text[position:])
+    return "".join(result)
+
+
+def keep_head_and_tail(
+    text: str, max_tokens: int, token_offsets: TokenOffsets = tokenizer_offsets
+) -> str:
+    """
+    Cut a text to its head, the part from its last error line on and its tail.
+
+    Args:
+        text: Log text
+        max_tokens: Token budget, including the omission markers
+        token_offsets: Start offsets of the tokens of a text
+    """
+    offsets = token_offsets(text)
+    if len(offsets) <= max_tokens:
+        return text
+    budget = max(max_tokens - 2 * MARKER_TOKENS, 2)
+    head = int(budget * HEAD_SHARE)
+    tail = int(budget * TAIL_SHARE)
+    errors = [match.start() for match in ERROR_LINE.finditer(text)]
+    error = None
+    if errors:
+        line_start = text.rfind("\n", 0, errors[-1]) + 1
+        error = bisect.bisect_right(offsets, line_start) - 1
+    if error is not None and head <= error < len(offsets) - tail:
+        spans = [
+            (0, head),
+            (error, error + budget - head - tail),
+            (len(offsets) - tail, len(offsets)),
+        ]
+    else:
+        head = budget - budget // 2
+        spans = [(0, head), (len(offsets) - (budget - head), len(offsets))]
+
+    merged = [spans[0]]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    def char(token: int) -> int:
+        return offsets[token] if token < len(offsets) else len(text)
+
+    parts = []
+    for index, (start, end) in enumerate(merged):
+        if index:
+            omitted = start - merged[index - 1][1]
+            parts.append(f"\n{_marker(omitted, 'tokens')}\n")
+        parts.append(text[char(start) : char(end)])
+    return "".join(parts)
+
+
+def compress_log(
+    log: str,
+    max_tokens: int = LOG_PROMPT_MAX_TOKENS,
+    token_offsets: TokenOffsets = tokenizer_offsets,
+) -> str:
+    """
+    Compress a log to a token budget, see the module docstring.
+
+    Args:
+        log: Log message
+        max_tokens: Token budget
+        token_offsets: Start offsets of the tokens of a text, by default those
+            of the LOG_TOKENIZER tokenizer
+
+    Returns:
+        The log itself if it fits the budget, otherwise its compressed form
+    """
+    # A token spans at least one character
+    if len(log) <= max_tokens or count_tokens(log, token_offsets) <= max_tokens:
+        return log
+    text = log
+    for step in (collapse_repeated_lines, collapse_stack_traces, collapse_json_blobs):
+        text = step(text)
+        if count_tokens(text, token_offsets) <= max_tokens:
+            break
+    else:
+        text = keep_head_and_tail(text, max_tokens, token_offsets)
+    logger.debug("log compressed from %d to %d characters", len(log), len(text))
+    return text
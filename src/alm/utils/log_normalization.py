@@ -0,0 +1,148 @@
+"""
+Log normalization before embedding.
+
+Logs of the same failure differ in hostnames, IPs, paths, ids, numbers and
+timestamps. Masking these variables with placeholder tokens (Drain-style
+templating) lets such logs embed alike, which gives fewer and tighter clusters
+and so fewer LLM calls. After normalization a window of the text is selected
+for embedding.
+
+Normalizers are plain `str -> str` functions applied in the configured order;
+more can be added with `register_normalizer`.
+
+Usage:
+    from alm.utils.log_normalization import prepare_log_for_embedding
+
+    text = prepare_log_for_embedding(log_message)
+
+Environment Variables:
+    LOG_EMBED_NORMALIZERS: Comma separated normalizers. Default: whitespace,mask
+    LOG_EMBED_WINDOW: Part of the text to embed: tail, head, head_tail or full.
+        Default: tail
+    LOG_EMBED_WINDOW_CHARS: Characters in the window. Default: 50
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+from alm.utils.dedup import normalize_log_message
+
+LOG_EMBED_NORMALIZERS = os.getenv("LOG_EMBED_NORMALIZERS", "whitespace,mask")
+LOG_EMBED_WINDOW = os.getenv("LOG_EMBED_WINDOW", "tail").lower()
+LOG_EMBED_WINDOW_CHARS = int(os.getenv("LOG_EMBED_WINDOW_CHARS", "50"))
+
+# (pattern, placeholder) in order: specific patterns go before the generic ones
+# they contain (an IP before its numbers, a URL before its path)
+LOG_MASKS = (
+    (
+        re.compile(
+            r"\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?"
+            r"(?:Z|[+-]\d{2}:?\d{2})?"
+        ),
+        "<TS>",
+    ),
+    (
+        re.compile(
+            r"\b(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep"
+            r"|Oct|Nov|Dec)\w* +\d{1,2}(?: +\w+ +\d{4})? +\d{2}:\d{2}:\d{2}"
+            r"(?:[.,]\d+)?(?: +[+-]\d{4})?"
+        ),
+        "<TS>",
+    ),
+    (re.compile(r"\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<TS>"),
+    (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}"
+            r"-[0-9a-fA-F]{12}\b"
+        ),
+        "<UUID>",
+    ),
+    (re.compile(r"\b[a-zA-Z][\w+.-]*://[^\s'\"<>]+"), "<URL>"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b"), "<IP>"),
+    (
+        re.compile(r"(?<![\w:])(?:[0-9a-fA-F]{0,4}:){2,7}[0-9a-fA-F]{1,4}(?![\w:])"),
+        "<IP>",
+    ),
+    # Absolute and relative paths as a whole (roles/web/tasks/main.yml)
+    (re.compile(r"(?:~|[\w.@+-]+)?(?:/[\w.@+-]+){2,}/?"), "<PATH>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{12,}\b"), "<HEX>"),
+    # Only known host suffixes: file names (main.py) and keys (task.id) are kept
+    (
+        re.compile(
+            r"\b(?=[\w-]*[a-zA-Z])[\w-]+(?:\.[\w-]+)*\."
+            r"(?:com|net|org|io|local|internal|lan|corp|cluster|svc)\b"
+        ),
+        "<HOST>",
+    ),
+    # Numbers with a unit keep the unit (3.5s), versions keep their prefix (v2.9)
+    (re.compile(r"(?<![\w.])\d+(?:\.\d+)*"), "<NUM>"),
+)
+
+
+def mask_log(text: str) -> str:
+    """Replace variable parts of a log with placeholder tokens."""
+    for pattern, placeholder in LOG_MASKS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+_normalizers: Dict[str, Callable[[str], str]] = {
+    "whitespace": normalize_log_message,
+    "mask": mask_log,
+}
+
+
+def register_normalizer(name: str, normalizer: Callable[[str], str]) -> None:
+    """Make a normalizer available to LOG_EMBED_NORMALIZERS."""
+    _normalizers[name] = normalizer
+
+
+def select_window(text: str, window: str, chars: int) -> str:
+    """
+    Select the part of a text to embed.
+
+    Args:
+        text: Normalized log
+        window: tail (last chars), head (first chars), head_tail (half of the
+            chars from each end) or full
+        chars: Characters to keep
+    """
+    if window == "full" or len(text) <= chars:
+        return text
+    if window == "tail":
+        return text[-chars:]
+    if window == "head":
+        return text[:chars]
+    if window == "head_tail":
+        head = chars // 2
+        return f"{text[:head]} ... {text[-(chars - head) :]}"
+    raise ValueError(
+        f"Unsupported log window: {window}. Choose from 'tail', 'head', "
+        "'head_tail', 'full'"
+    )
+
+
+def prepare_log_for_embedding(
+    text: str,
+    normalizers: Optional[List[str]] = None,
+    window: str = LOG_EMBED_WINDOW,
+    chars: int = LOG_EMBED_WINDOW_CHARS,
+) -> str:
+    """
+    Normalize a log and select the window to embed.
+
+    Args:
+        text: Log message
+        normalizers: Names of the normalizers to apply, in order. Defaults to
+            LOG_EMBED_NORMALIZERS
+        window: See `select_window`
+        chars: See `select_window`
+    """
+    if normalizers is None:
+        normalizers = [
+            name.strip() for name in LOG_EMBED_NORMALIZERS.split(",") if name.strip()
+        ]
+    for name in normalizers:
+        text = _normalizers[name](text)
+    return select_window(text, window, chars)
@@ -0,0 +1,209 @@
+"""
+Per-stage timing and token metrics of an offline pipeline run.
+
+Stages are timed with `stage_timer` and agent graph nodes with `timed_node`.
+Nothing is recorded unless a run is being tracked, so the same code paths cost
+nothing when they serve API requests.
+
+Usage:
+    from alm.utils.metrics import stage_timer, track_run
+
+    with track_run() as report:
+        with stage_timer("embed", items=len(logs)):
+            ...
+    report.to_dict()  # p50/p95/p99, throughput and token counts per stage
+"""
+
+import bisect
+import functools
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+_current_report: ContextVar[Optional["RunReport"]] = ContextVar(
+    "run_report", default=None
+)
+# Stage that LLM token usage is attributed to
+_current_stage: ContextVar[Optional[str]] = ContextVar("run_stage", default=None)
+
+
+@dataclass
+class StageStats:
+    durations: List[float] = field(default_factory=list)
+    items: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    first_start: Optional[float] = None
+    last_end: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        stats = {
+            "calls": len(self.durations),
+            "items": self.items,
+            "total_seconds": round(sum(self.durations), 4),
+        }
+        if self.durations:
+            p50, p95, p99 = np.percentile(self.durations, [50, 95, 99])
+            # Calls can overlap, throughput is measured over the stage's wall time
+            wall = self.last_end - self.first_start
+            stats.update(
+                wall_seconds=round(wall, 4),
+                p50_seconds=round(float(p50), 4),
+                p95_seconds=round(float(p95), 4),
+                p99_seconds=round(float(p99), 4),
+                items_per_second=round(self.items / wall, 2) if wall > 0 else None,
+            )
+        if self.input_tokens or self.output_tokens:
+            stats.update(
+                input_tokens=self.input_tokens, output_tokens=self.output_tokens
+            )
+        return stats
+
+
+class Histogram:
+    """Cumulative bucket histogram, like a Prometheus histogram."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            cumulative = list(itertools.accumulate(self._counts))
+            return {
+                "count": self.count,
+                "sum": round(self.sum, 6),
+                "mean": round(self.sum / self.count, 6) if self.count else None,
+                "buckets": {
+                    **{str(le): n for le, n in zip(self.buckets, cumulative)},
+                    "+Inf": cumulative[-1],
+                },
+            }
+
+
+class RunReport:
+    """Timings and token counts of the stages of one run."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or os.getenv("PIPELINE_RUN_ID")
+        self.started_at = datetime.now(timezone.utc)
+        self.stages: Dict[str, StageStats] = {}
+        self._start = time.perf_counter()
+
+    def record(self, stage: str, start: float, end: float, items: int = 1) -> None:
+        stats = self.stages.setdefault(stage, StageStats())
+        stats.durations.append(end - start)
+        stats.items += items
+        if stats.first_start is None or start < stats.first_start:
+            stats.first_start = start
+        if stats.last_end is None or end > stats.last_end:
+            stats.last_end = end
+
+    def record_tokens(self, stage: str, input_tokens: int, output_tokens: int) -> None:
+        stats = self.stages.setdefault(stage, StageStats())
+        stats.input_tokens += input_tokens
+        stats.output_tokens += output_tokens
+
+    @property
+    def file_name(self) -> str:
+        return f"run_report_{self.started_at:%Y%m%dT%H%M%SZ}.json"
+
+    def to_dict(self) -> dict:
+        stages = {name: stats.to_dict() for name, stats in self.stages.items()}
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(),
+            "total_seconds": round(time.perf_counter() - self._start, 4),
+            "input_tokens": sum(
+                stage.get("input_tokens", 0) for stage in stages.values()
+            ),
+            "output_tokens": sum(
+                stage.get("output_tokens", 0) for stage in stages.values()
+            ),
+            "stages": stages,
+        }
+
+
+def current_run_report() -> Optional[RunReport]:
+    return _current_report.get()
+
+
+@contextmanager
+def track_run(run_id: Optional[str] = None) -> Iterator[RunReport]:
+    """Record the stages run inside the block; joins the run already tracked."""
+    report = _current_report.get()
+    if report is not None:
+        yield report
+        return
+    report = RunReport(run_id)
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+
+@contextmanager
+def stage_timer(stage: str, items: int = 1) -> Iterator[None]:
+    """Time the block as one call of `stage` processing `items` items."""
+    report = _current_report.get()
+    if report is None:
+        yield
+        return
+    stage_token = _current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.record(stage, start, time.perf_counter(), items)
+        _current_stage.reset(stage_token)
+
+
+def timed_node(node):
+    """Time an async graph node as the stage `node.<name>`."""
+
+    @functools.wraps(node)
+    async def wrapper(*args, **kwargs):
+        with stage_timer(f"node.{node.__name__}"):
+            return await node(*args, **kwargs)
+
+    return wrapper
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Attribute the token usage of LLM calls to the current stage."""
+
+    run_inline = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        report = _current_report.get()
+        if report is None:
+            return
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        report.record_tokens(_current_stage.get() or "llm", input_tokens, output_tokens)
@@ -1,18 +1,36 @@
 import os
+from typing import Optional, Tuple
+
+import minio
 from minio import Minio
+from minio.error import S3Error
 import sklearn
 
+from alm.utils.logger import get_logger
 
-def upload_model_to_minio(
-    model: sklearn.base.BaseEstimator, bucket_name: str, file_name: str
-):
-    minio_client = Minio(
+logger = get_logger(__name__)
+
+# minio versions whose private Minio._put_object sends its headers as they are.
+# The public put_object sends extra headers as user metadata (x-amz-meta-*),
+# so it cannot send If-Match. The window matches the minio pin of pyproject.toml
+# and tests/utils/test_minio.py checks the signature.
+CONDITIONAL_PUT_MINIO_VERSIONS = ((7, 2), (8, 0))
+
+
+def _minio_client() -> Minio:
+    return Minio(
         endpoint=os.getenv("MINIO_ENDPOINT") + ":" + os.getenv("MINIO_PORT"),
         access_key=os.getenv("MINIO_ACCESS_KEY"),
         secret_key=os.getenv("MINIO_SECRET_KEY"),
         secure=False,  # Use HTTP instead of HTTPS for internal OpenShift services
     )
 
+
+def upload_model_to_minio(
+    model: sklearn.base.BaseEstimator, bucket_name: str, file_name: str
+):
+    minio_client = _minio_client()
+
     # Ensure bucket exists
     if not minio_client.bucket_exists(bucket_name):
         minio_client.make_bucket(bucket_name)
@@ -28,3 +46,122 @@ def upload_model_to_minio(
         minio_client.put_object(
             bucket_name, file_name, buffer, length=buffer.getbuffer().nbytes
         )
+
+
+def upload_bytes_to_minio(data: bytes, bucket_name: str, file_name: str):
+    import io
+
+    minio_client = _minio_client()
+    if not minio_client.bucket_exists(bucket_name):
+        minio_client.make_bucket(bucket_name)
+    minio_client.put_object(bucket_name, file_name, io.BytesIO(data), length=len(data))
+
+
+def upload_model_to_minio_if_match(
+    model: sklearn.base.BaseEstimator, bucket_name: str, file_name: str, etag: str
+) -> bool:
+    """Overwrite a model only if the object still has the given ETag.
+
+    Uses an S3 conditional write (If-Match), so of two writers that loaded the
+    same object only the first one succeeds.
+
+    Returns:
+        False if the object changed since it was loaded with `etag`
+    """
+    import io
+    import joblib
+
+    with io.BytesIO() as buffer:
+        joblib.dump(model, buffer)
+        data = buffer.getvalue()
+    minio_client = _minio_client()
+    if not _conditional_put_supported():
+        logger.warning(
+            "minio %s has no conditional put, %s is written without If-Match and "
+            "concurrent updates may be lost",
+            minio.__version__,
+            file_name,
+        )
+        minio_client.put_object(bucket_name, file_name, io.BytesIO(data), len(data))
+        return True
+    try:
+        minio_client._put_object(
+            bucket_name,
+            file_name,
+            data,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "If-Match": f'"{etag}"',
+            },
+        )
+    except S3Error as e:
+        if e.code in ("PreconditionFailed", "ConditionalRequestConflict"):
+            return False
+        raise
+    return True
+
+
+def _conditional_put_supported() -> bool:
+    version = tuple(int(part) for part in minio.__version__.split(".")[:2])
+    low, high = CONDITIONAL_PUT_MINIO_VERSIONS
+    return low <= version < high
+
+
+def get_object_version_in_minio(bucket_name: str, file_name: str) -> Optional[str]:
+    """Version id (or ETag when unversioned) of an object, None if it does not exist."""
+    try:
+        stat = _minio_client().stat_object(bucket_name, file_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchBucket"):
+            return None
+        raise
+    return stat.version_id or stat.etag
+
+
+def get_object_bytes_from_minio(bucket_name: str, file_name: str) -> bytes:
+    response = _minio_client().get_object(bucket_name, file_name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def download_model_with_etag_from_minio(
+    bucket_name: str, file_name: str
+) -> Optional[Tuple[sklearn.base.BaseEstimator, str]]:
+    """Load a model and the ETag of the loaded object, or None if it does not exist."""
+    import io
+    import joblib
+
+    try:
+        response = _minio_client().get_object(bucket_name, file_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchBucket"):
+            return None
+        raise
+    try:
+        data = response.read()
+        etag = response.headers.get("etag", "").strip('"')
+    finally:
+        response.close()
+        response.release_conn()
+    with io.BytesIO(data) as buffer:
+        return joblib.load(buffer), etag
+
+
+def download_model_from_minio(
+    bucket_name: str, file_name: str
+) -> Optional[sklearn.base.BaseEstimator]:
+    """Load a model from MinIO, or None if the object does not exist."""
+    import io
+    import joblib
+
+    try:
+        data = get_object_bytes_from_minio(bucket_name, file_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchBucket"):
+            return None
+        raise
+    with io.BytesIO(data) as buffer:
+        return joblib.load(buffer)
@@ -0,0 +1,122 @@
+"""
+In-process cache of a persisted model that reloads when the artifact changes.
+
+A local file is re-checked on every access with a `stat`, and its content hash
+is only computed when the mtime or size changed. A MinIO object is re-checked at
+most every MODEL_REFRESH_SECONDS by its ETag / version id. A changed artifact is
+fully deserialized before it replaces the cached model, so callers always get
+either the old or the new model and never a partially loaded one.
+
+Environment Variables:
+    MODEL_REFRESH_SECONDS: Interval between MinIO version checks. Default: 30
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+import joblib
+
+from alm.utils.logger import get_logger
+from alm.utils.minio import get_object_bytes_from_minio, get_object_version_in_minio
+
+logger = get_logger(__name__)
+
+MODEL_REFRESH_SECONDS = float(os.getenv("MODEL_REFRESH_SECONDS", "30"))
+
+
+class CachedModel:
+    """Model loaded from a local file or a MinIO object, reloaded when it changes."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        bucket_name: Optional[str] = None,
+        file_name: Optional[str] = None,
+        refresh_seconds: float = MODEL_REFRESH_SECONDS,
+        load: Optional[Callable[[Any], Any]] = None,
+    ):
+        """
+        Args:
+            path: Local model file
+            bucket_name: MinIO bucket, when there is no local file
+            file_name: MinIO object name
+            refresh_seconds: Interval between MinIO version checks
+            load: Converts the deserialized artifact into the model to serve
+        """
+        if path is None and (bucket_name is None or file_name is None):
+            raise ValueError("Either path or bucket_name and file_name are required")
+        self.path = path
+        self.bucket_name = bucket_name
+        self.file_name = file_name
+        self.refresh_seconds = refresh_seconds
+        self.load = load
+        # (model, version) is replaced as a whole so readers see a consistent pair
+        self._current: Tuple[Any, Any] = (None, None)
+        self._checked_at = 0.0
+        self._stat: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        """The current model, reloaded first if the artifact changed."""
+        model, _ = self._current
+        # While another thread reloads, keep serving the loaded model
+        if not self._lock.acquire(blocking=model is None):
+            return model
+        try:
+            self._refresh()
+        except Exception:
+            if model is None:
+                raise
+            logger.exception("reloading model failed, keeping the loaded one")
+        finally:
+            self._lock.release()
+        return self._current[0]
+
+    def _refresh(self) -> None:
+        if self.path is not None:
+            self._refresh_from_file()
+        else:
+            self._refresh_from_minio()
+
+    def _refresh_from_file(self) -> None:
+        stat = os.stat(self.path)
+        file_stat = (stat.st_mtime_ns, stat.st_size)
+        if file_stat == self._stat:
+            return
+        with open(self.path, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != self._current[1]:
+            self._swap(data, digest)
+        self._stat = file_stat
+
+    def _refresh_from_minio(self) -> None:
+        model, version = self._current
+        now = time.monotonic()
+        if model is not None and now - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = now
+        latest = get_object_version_in_minio(self.bucket_name, self.file_name)
+        if latest is None:
+            raise FileNotFoundError(
+                f"Model {self.file_name} not found in bucket {self.bucket_name}"
+            )
+        if latest != version:
+            data = get_object_bytes_from_minio(self.bucket_name, self.file_name)
+            self._swap(data, latest)
+
+    def _swap(self, data: bytes, version: Any) -> None:
+        with io.BytesIO(data) as buffer:
+            model = joblib.load(buffer)
+        if self.load is not None:
+            model = self.load(model)
+        self._current = (model, version)
+        logger.info(
+            "loaded model %s (version %s)",
+            self.path or f"{self.bucket_name}/{self.file_name}",
+            str(version)[:16],
+        )
@@ -0,0 +1,122 @@
+"""
+Small persistent key/value store backed by a local SQLite file.
+
+Used for pipeline bookkeeping that must survive process restarts and must not
+live in the application database (which the training pipeline may drop).
+
+Usage:
+    from alm.utils.sqlite_store import SQLiteStore
+
+    store = SQLiteStore("data/cache.sqlite", table="manifest")
+    store.put("key", {"any": "json"})
+    store.get("key")
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class SQLiteStore:
+    """JSON key/value table in a SQLite database file.
+
+    A single connection is shared between threads and guarded by a lock. The
+    database runs in WAL mode so other processes can read while one writes.
+    Subclasses store other values by overriding `VALUE_TYPE`, `_encode` and
+    `_decode`.
+    """
+
+    # SQLite column type of the values
+    VALUE_TYPE = "TEXT"
+
+    def __init__(self, path: str, table: str = "kv"):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"(key TEXT PRIMARY KEY, value {self.VALUE_TYPE} NOT NULL)"
+            )
+
+    def _encode(self, value: Any) -> Any:
+        return json.dumps(value)
+
+    def _decode(self, value: Any) -> Any:
+        return json.loads(value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        return self._decode(row[0]) if row else default
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return the stored values for the given keys, skipping missing ones."""
+        keys = list(keys)
+        result = {}
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(keys), 900):
+            chunk = keys[start : start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            result.update((key, self._decode(value)) for key, value in rows)
+        return result
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        rows = [(key, self._encode(value)) for key, value in items]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                rows,
+            )
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def keys(self, prefix: Optional[str] = None) -> List[str]:
+        query = f"SELECT key FROM {self.table}"
+        params: tuple = ()
+        if prefix is not None:
+            query += " WHERE key >= ? AND key < ?"
+            params = (prefix, prefix + "\U0010ffff")
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def items(self, prefix: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        query = f"SELECT key, value FROM {self.table}"
+        params: tuple = ()
+        if prefix is not None:
+            query += " WHERE key >= ? AND key < ?"
+            params = (prefix, prefix + "\U0010ffff")
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for key, value in rows:
+            yield key, self._decode(value)
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return row[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1 @@
+# Agents tests package
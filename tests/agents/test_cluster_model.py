@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the online updates of the cluster assignment model.
+
+Embeddings are small unit vectors, so distances between them are known.
+"""
+
+import numpy as np
+import pytest
+
+from alm.agents.cluster_model import ClusterAssignmentModel, RetrainRequiredError
+from alm.patterns.template_miner import TemplateMiner
+
+pytest.importorskip("faiss")
+
+AXES = np.eye(4, dtype=np.float32)
+
+
+def _near(axis, other, weight=0.05):
+    vector = AXES[axis] + weight * AXES[other]
+    return vector / np.linalg.norm(vector)
+
+
+def _two_cluster_model():
+    return ClusterAssignmentModel(AXES[:2], np.array([0, 1]), threshold=0.2)
+
+
+def _miner(logs_per_label):
+    miner = TemplateMiner()
+    template_ids, labels = [], []
+    for label, log in logs_per_label.items():
+        template_ids.append(miner.add(log))
+        labels.append(str(label))
+    miner.assign_clusters(template_ids, labels)
+    return miner
+
+
+def test_partial_fit_assigns_to_the_nearest_cluster():
+    model = _two_cluster_model()
+    labels = model.partial_fit(np.stack([_near(0, 2), _near(1, 3), _near(1, 2)]))
+    assert labels.tolist() == [0, 1, 1]
+    assert model.prototype_counts.tolist() == [2, 3]
+    assert len(model.prototypes) == 2
+    assert model.revision == 1
+    # The prototype moved toward the log it attracted
+    assert model.prototypes[0] @ AXES[2] > 0
+
+
+def test_partial_fit_opens_one_cluster_per_group_of_new_logs():
+    model = _two_cluster_model()
+    labels = model.partial_fit(
+        np.stack([AXES[2], _near(0, 1), _near(2, 3), AXES[3]]),
+        sample_weight=np.array([1, 1, 2, 1]),
+    )
+    assert labels.tolist() == [2, 0, 2, 3]
+    assert model.prototype_labels.tolist() == [0, 1, 2, 3]
+    assert model.prototype_counts.tolist() == [2, 1, 3, 1]
+    assert model.predict(np.stack([AXES[2], AXES[3]])).tolist() == [2, 3]
+
+
+def test_add_clusters_widens_the_threshold_to_fit_the_members():
+    model = _two_cluster_model()
+    # Both members are further than the model threshold from their centroid
+    members = np.stack([AXES[2], AXES[3]])
+    labels = model.add_clusters(
+        members, np.array([0, 0]), sample_weight=np.array([2, 1])
+    )
+    assert labels.tolist() == [2, 2]
+    assert model.prototype_counts.tolist() == [1, 1, 3]
+    assert model.predict(members).tolist() == [2, 2]
+
+
+def test_maintain_merges_converged_clusters_into_the_largest():
+    model = ClusterAssignmentModel(
+        np.stack([AXES[0], _near(0, 1), AXES[2]]),
+        np.array([0, 1, 2]),
+        threshold=0.2,
+        prototype_counts=np.array([2, 5, 1]),
+        template_miner=_miner(
+            {0: "connection refused", 1: "disk is full on db", 2: "timeout"}
+        ),
+    )
+    changes = model.maintain(merge_threshold=0.01, split_threshold=1.0)
+    assert changes == {"merged": {0: 1}, "split": {}}
+    assert model.prototype_labels.tolist() == [1, 1, 2]
+    assert model.predict(AXES[:1]).tolist() == [1]
+    assert model.template_miner.lookup("connection refused") == "1"
+    assert model.template_miner.lookup("disk is full on db") == "1"
+    assert model.template_miner.lookup("timeout") == "2"
+    assert model.revision == 1
+
+
+def test_maintain_splits_a_widely_spread_cluster():
+    samples = np.stack(
+        [_near(0, 2, 0.1 * n) for n in range(4)]
+        + [_near(1, 3, 0.1 * n) for n in range(4)]
+    )
+    center = (AXES[0] + AXES[1]) / np.sqrt(2)
+    model = ClusterAssignmentModel(
+        center[None],
+        np.array([0]),
+        threshold=0.35,
+        prototype_counts=np.array([8]),
+        prototype_spread=np.array([8 * 0.3]),
+        prototype_samples=[samples],
+        template_miner=_miner({0: "error on web"}),
+    )
+    changes = model.maintain(merge_threshold=0.01, split_threshold=0.2)
+    assert changes == {"merged": {}, "split": {0: 1}}
+    assert model.prototype_labels.tolist() == [0, 1]
+    assert model.prototype_counts.sum() == pytest.approx(8)
+    labels = model.predict(np.stack([AXES[0], AXES[1]])).tolist()
+    assert sorted(labels) == [0, 1]
+    # The logs of the split cluster's templates may belong to either half
+    assert model.template_miner.lookup("error on web") is None
+
+
+def test_maintain_without_changes_keeps_the_revision():
+    model = _two_cluster_model()
+    assert model.maintain(0.01, 1.0) == {"merged": {}, "split": {}}
+    assert model.revision == 0
+
+
+def test_legacy_centroid_estimator_is_converted():
+    sklearn_cluster = pytest.importorskip("sklearn.cluster")
+    estimator = sklearn_cluster.KMeans(n_clusters=2, n_init=1, random_state=0)
+    estimator.fit(np.stack([AXES[0], _near(0, 1), AXES[2], _near(2, 3)]))
+    model = ClusterAssignmentModel.from_artifact(estimator, legacy_threshold=0.2)
+    labels = model.predict(np.stack([AXES[0], AXES[2]]))
+    assert labels[0] != labels[1]
+
+
+def test_legacy_estimator_without_centers_requires_a_retrain():
+    sklearn_cluster = pytest.importorskip("sklearn.cluster")
+    estimator = sklearn_cluster.DBSCAN(eps=0.3, min_samples=2, metric="precomputed")
+    estimator.fit(np.zeros((3, 3)))
+    with pytest.raises(RetrainRequiredError, match="retrain"):
+        ClusterAssignmentModel.from_artifact(estimator, legacy_threshold=0.2)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parity of DBSCAN on the sparse FAISS neighbor graph with the dense path.
+
+The sparse graph must give every log the same neighborhood as the dense
+cosine distance matrix, so both paths yield identical clusters.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+node = pytest.importorskip("alm.agents.node")
+
+
+def _fixture_embeddings():
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(4, 32))
+    rows = [
+        center + spread * rng.normal(size=(30, 32))
+        for center, spread in zip(centers, (0.05, 0.1, 0.2, 0.3))
+    ]
+    # Scattered logs (noise) and exact duplicates (zero distances)
+    rows.append(rng.normal(size=(20, 32)))
+    embeddings = np.vstack(rows)
+    return np.vstack([embeddings, embeddings[:10]]).astype(np.float32)
+
+
+def _dbscan(monkeypatch, embeddings, sparse_min_rows, sample_weight=None):
+    monkeypatch.setenv("CLUSTERING_ALGORITHM", "dbscan")
+    monkeypatch.setattr(node, "DBSCAN_SPARSE_MIN_ROWS", sparse_min_rows)
+    return node._cluster_logs(embeddings, sample_weight)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_sparse_dbscan_matches_dense(monkeypatch, weighted):
+    embeddings = _fixture_embeddings()
+    sample_weight = (
+        np.random.default_rng(0).integers(1, 4, len(embeddings)) if weighted else None
+    )
+    dense_model, dense_labels = _dbscan(
+        monkeypatch, embeddings, len(embeddings) + 1, sample_weight
+    )
+    sparse_model, sparse_labels = _dbscan(monkeypatch, embeddings, 0, sample_weight)
+    assert len(set(dense_labels) - {-1}) > 1
+    assert (dense_labels == -1).any()
+    np.testing.assert_array_equal(sparse_labels, dense_labels)
+    np.testing.assert_array_equal(
+        sparse_model.core_sample_indices_, dense_model.core_sample_indices_
+    )
+
+
+def test_radius_neighbors_graph_matches_dense_distances():
+    embeddings = _fixture_embeddings()
+    graph = node._radius_neighbors_graph(embeddings, eps=0.3).toarray()
+    dense = node.cosine_distances(embeddings)
+    within = dense <= 0.3
+    np.testing.assert_array_equal(graph > 0, within)
+    np.testing.assert_allclose(graph[within], dense[within], atol=1e-5)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Deduplicated logs must cluster as the logs they stand for.
+
+Estimators without sample_weight are fitted on the rows repeated by their
+weight, so they give the duplicated corpus's clusters.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+node = pytest.importorskip("alm.agents.node")
+
+
+def _fixture_embeddings():
+    rng = np.random.default_rng(11)
+    centers = rng.normal(size=(3, 16))
+    rows = [
+        center + spread * rng.normal(size=(12, 16))
+        for center, spread in zip(centers, (0.05, 0.2, 0.4))
+    ]
+    return np.vstack(rows).astype(np.float32)
+
+
+@pytest.mark.parametrize("algorithm", ["meanshift", "agglomerative"])
+def test_weighted_rows_match_the_duplicated_corpus(monkeypatch, algorithm):
+    monkeypatch.setenv("CLUSTERING_ALGORITHM", algorithm)
+    embeddings = _fixture_embeddings()
+    sample_weight = np.random.default_rng(3).integers(1, 5, size=len(embeddings))
+
+    _, weighted_labels = node._cluster_logs(embeddings, sample_weight)
+    _, duplicated_labels = node._cluster_logs(
+        np.repeat(embeddings, sample_weight, axis=0)
+    )
+
+    first = np.cumsum(sample_weight) - sample_weight
+    np.testing.assert_array_equal(weighted_labels, duplicated_labels[first])
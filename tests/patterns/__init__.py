@@ -0,0 +1 @@
+# Log pattern tests package
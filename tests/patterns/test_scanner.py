@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the alert record scanners.
+
+The tail-first file scanner must return the same record as scanning the
+whole log, for any block size.
+"""
+
+import random
+import re
+
+from alm.patterns.ingestion import TESTING_LOG_ERROR, TESTING_LOG_FATAL
+from alm.patterns.scanner import (
+    find_last_alert_match,
+    find_last_alert_match_in_file,
+)
+
+
+def _reference_match(content):
+    """The original three-pass finditer implementation."""
+
+    def not_ignoring(matches):
+        return [
+            match
+            for match in matches
+            if not match.groupdict().get("logmessage", "").endswith("ignoring")
+        ]
+
+    matches = not_ignoring(re.finditer(TESTING_LOG_ERROR, content, re.MULTILINE))
+    if not matches:
+        matches = not_ignoring(re.finditer(TESTING_LOG_FATAL, content, re.MULTILINE))
+    return matches[-1] if matches else None
+
+
+def _groups(match):
+    return match.groupdict() if match else None
+
+
+def test_prefers_last_error_over_fatal(tmp_path):
+    log = (
+        'fatal: [a]: FAILED! => {"msg": "first"}\n'
+        'error: [b]: FAILED! => {"msg": "skipped"} ignoring\n'
+        'error: [c]: FAILED! => {"msg": "second"}\n'
+        'fatal: [d]: FAILED! => {"msg": "third"}\n'
+    )
+    path = tmp_path / "job.txt"
+    path.write_text(log)
+
+    match = find_last_alert_match_in_file(str(path), block_size=8)
+
+    assert match.group("host") == "c"
+    assert _groups(match) == _groups(find_last_alert_match(log))
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "job.txt"
+    path.write_text("")
+
+    assert find_last_alert_match_in_file(str(path)) is None
+
+
+def test_matches_reference_on_random_logs(tmp_path):
+    tokens = [
+        "error: [",
+        "fatal: [",
+        "host",
+        "]",
+        "]: ",
+        " ",
+        "{",
+        "}",
+        "\n",
+        "\r\n",
+        "FAILED! => ",
+        "ignoring",
+        "é",
+    ]
+    rng = random.Random(0)
+    path = tmp_path / "job.txt"
+    for _ in range(2000):
+        log = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 60)))
+        path.write_text(log, newline="")
+        expected = _groups(_reference_match(path.read_text()))
+
+        assert _groups(find_last_alert_match(path.read_text())) == expected
+        for block_size in (1, 16, 1 << 20):
+            match = find_last_alert_match_in_file(str(path), block_size=block_size)
+            assert _groups(match) == expected, (log, block_size)
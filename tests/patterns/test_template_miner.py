@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Drain log template miner.
+
+Logs of one template must get the cluster of that template, also after the
+miner went through its persisted state.
+"""
+
+from alm.patterns.template_miner import WILDCARD, TemplateMiner
+
+
+def _unreachable(index):
+    return (
+        f"fatal: [web-{index}.example.com]: UNREACHABLE! Failed to connect to "
+        f"10.0.0.{index}:22 as user{index}"
+    )
+
+
+def _package(index):
+    return f"error: [host{index}]: No package matching 'nginx-{index}' found"
+
+
+def _trained_miner():
+    miner = TemplateMiner()
+    logs = [_unreachable(index) for index in range(20)]
+    logs += [_package(index) for index in range(20)]
+    template_ids = [miner.add(log) for log in logs]
+    miner.assign_clusters(template_ids, ["0"] * 20 + ["1"] * 20)
+    return miner
+
+
+def test_logs_of_a_template_share_it():
+    miner = _trained_miner()
+    assert len(miner.templates) == 2
+    assert WILDCARD in miner.templates[0]
+    assert miner.lookup(_unreachable(99)) == "0"
+    assert miner.lookup(_package(99)) == "1"
+    assert miner.lookup("Something else went wrong") is None
+
+
+def test_lookup_after_persisting():
+    miner = TemplateMiner.from_dict(_trained_miner().to_dict())
+    assert miner.lookup(_unreachable(42)) == "0"
+    assert miner.lookup(_package(42)) == "1"
+
+
+def test_templates_of_several_clusters_are_not_mapped():
+    miner = _trained_miner()
+    miner.assign_clusters([miner.add(_package(7))], ["5"])
+    assert miner.lookup(_package(8)) is None
+
+
+def test_relabel_merged_clusters():
+    miner = _trained_miner()
+    miner.relabel_clusters({1: 0})
+    assert miner.lookup(_package(3)) == "0"
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the asyncio micro-batcher.
+
+Every caller must get its own result or an exception, never wait forever.
+"""
+
+import asyncio
+
+import pytest
+
+from alm.utils.batching import MicroBatcher
+
+
+def test_concurrent_items_share_a_batch():
+    batches = []
+
+    async def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=20)
+        return await asyncio.gather(*(batcher.submit(item) for item in range(5)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+
+
+def test_batches_are_capped_at_max_size():
+    batches = []
+
+    async def identity(items):
+        batches.append(len(items))
+        return list(items)
+
+    async def main():
+        batcher = MicroBatcher(identity, max_batch_size=3, max_wait_ms=20)
+        return await asyncio.gather(*(batcher.submit(item) for item in range(7)))
+
+    assert asyncio.run(main()) == list(range(7))
+    assert batches == [3, 3, 1]
+
+
+def test_batch_exception_reaches_every_caller():
+    async def fail(items):
+        raise RuntimeError("model unavailable")
+
+    async def main():
+        batcher = MicroBatcher(fail, max_wait_ms=5)
+        return await asyncio.gather(
+            batcher.submit(1), batcher.submit(2), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert [str(result) for result in results] == ["model unavailable"] * 2
+
+
+def test_short_result_list_fails_the_batch():
+    async def drop_last(items):
+        return list(items)[:-1]
+
+    async def main():
+        batcher = MicroBatcher(drop_last, max_wait_ms=5)
+        return await asyncio.gather(
+            batcher.submit(1), batcher.submit(2), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_worker_fails_pending_callers():
+    started = asyncio.Event()
+
+    async def hang(items):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def main():
+        batcher = MicroBatcher(hang, max_batch_size=1, max_wait_ms=1)
+        in_batch = asyncio.ensure_future(batcher.submit(1))
+        queued = asyncio.ensure_future(batcher.submit(2))
+        await started.wait()
+        batcher._worker.cancel()
+        return await asyncio.wait_for(
+            asyncio.gather(in_batch, queued, return_exceptions=True), 1
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_worker_restarts_after_being_stopped():
+    async def identity(items):
+        return list(items)
+
+    async def main():
+        batcher = MicroBatcher(identity, max_wait_ms=1)
+        assert await batcher.submit("a") == "a"
+        batcher._worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await batcher._worker
+        return await batcher.submit("b")
+
+    assert asyncio.run(main()) == "b"
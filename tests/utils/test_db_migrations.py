@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the upgrade of tables created with an older schema.
+
+The grafanaalert table is created as the first release did, without logHash,
+and must get the column and its index without losing rows, then the log hash of
+the stored alerts.
+"""
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("sqlmodel")
+
+from alm.models import GrafanaAlert  # noqa: E402
+from alm.utils.db_migrations import (  # noqa: E402
+    add_missing_columns,
+    fill_log_hashes,
+)
+from alm.utils.dedup import log_message_hash  # noqa: E402
+
+BASELINE_SCHEMA = """
+CREATE TABLE grafanaalert (
+    id INTEGER PRIMARY KEY,
+    "logTimestamp" TIMESTAMP,
+    "logMessage" VARCHAR NOT NULL,
+    "logSummary" VARCHAR NOT NULL,
+    "expertClassification" VARCHAR,
+    "logCluster" VARCHAR,
+    "needMoreContext" BOOLEAN,
+    "stepByStepSolution" VARCHAR,
+    "contextForStepByStepSolution" VARCHAR,
+    log_labels JSON
+)
+"""
+
+
+@pytest.fixture
+def baseline_engine():
+    engine = sqlalchemy.create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(BASELINE_SCHEMA)
+        conn.exec_driver_sql(
+            'INSERT INTO grafanaalert ("logMessage", "logSummary", log_labels) '
+            """VALUES ('fatal: boom', 'summary', '{"filename": "job_1.txt"}')"""
+        )
+    return engine
+
+
+def test_adds_log_hash_column_and_index(baseline_engine):
+    metadata = GrafanaAlert.metadata
+    with baseline_engine.begin() as conn:
+        metadata.create_all(conn)
+        assert add_missing_columns(conn, metadata) == ["grafanaalert.logHash"]
+
+    inspector = sqlalchemy.inspect(baseline_engine)
+    columns = {column["name"] for column in inspector.get_columns("grafanaalert")}
+    indexes = {index["name"] for index in inspector.get_indexes("grafanaalert")}
+    assert "logHash" in columns
+    assert "ix_grafanaalert_logHash" in indexes
+    with baseline_engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            'SELECT "logMessage", "logHash" FROM grafanaalert'
+        ).fetchall()
+    assert rows == [("fatal: boom", None)]
+
+
+def test_is_idempotent(baseline_engine):
+    metadata = GrafanaAlert.metadata
+    with baseline_engine.begin() as conn:
+        add_missing_columns(conn, metadata)
+    with baseline_engine.begin() as conn:
+        assert add_missing_columns(conn, metadata) == []
+
+
+def _migrate(engine):
+    with engine.begin() as conn:
+        GrafanaAlert.metadata.create_all(conn)
+        add_missing_columns(conn, GrafanaAlert.metadata)
+        return fill_log_hashes(conn, chunk_size=1)
+
+
+def test_fills_log_hashes_once(baseline_engine):
+    with baseline_engine.begin() as conn:
+        conn.exec_driver_sql(
+            'INSERT INTO grafanaalert ("logMessage", "logSummary") '
+            "VALUES ('fatal:  other', 'summary')"
+        )
+    assert _migrate(baseline_engine) == 2
+    with baseline_engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            'SELECT "logMessage", "logHash" FROM grafanaalert ORDER BY id'
+        ).fetchall()
+    assert rows == [
+        ("fatal: boom", log_message_hash("fatal: boom")),
+        ("fatal:  other", log_message_hash("fatal: other")),
+    ]
+    assert _migrate(baseline_engine) == 0
+
+
+def test_unchanged_file_is_not_ingested_again(baseline_engine):
+    pytest.importorskip("sentence_transformers")
+    from alm.pipeline.incremental import _new_file_alerts, _stored_alert_keys
+
+    _migrate(baseline_engine)
+    with baseline_engine.connect() as conn:
+        stored_keys = set(conn.execute(_stored_alert_keys()).all())
+    unchanged = GrafanaAlert(
+        logMessage="fatal:  boom", log_labels={"filename": "job_1.txt"}
+    )
+    appended = GrafanaAlert(
+        logMessage="fatal: boom again", log_labels={"filename": "job_1.txt"}
+    )
+    assert _new_file_alerts([unchanged, appended], stored_keys) == [appended]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the persistent embedding cache.
+"""
+
+import numpy as np
+
+from alm.utils import embedding_cache
+from alm.utils.embedding_cache import EmbeddingCache, cached_encode, embedding_key
+
+
+def test_embeddings_round_trip_as_float32(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    cache.put_many([("a", np.arange(4, dtype=np.float64))])
+    stored = cache.get_many(["a", "missing"])
+    assert list(stored) == ["a"]
+    assert stored["a"].dtype == np.float32
+    np.testing.assert_array_equal(stored["a"], np.arange(4))
+
+
+def test_only_texts_not_cached_are_encoded(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_ENABLED", True)
+    monkeypatch.setattr(embedding_cache, "get_embedding_cache", lambda: cache)
+    encoded = []
+
+    def encode(texts):
+        encoded.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts])
+
+    first = cached_encode(["ab", "c", "ab"], "model", encode)
+    second = cached_encode(["c", "def"], "model", encode)
+    assert encoded == [["ab", "c"], ["def"]]
+    np.testing.assert_array_equal(first, [[2, 1], [1, 1], [2, 1]])
+    np.testing.assert_array_equal(second, [[1, 1], [3, 1]])
+    assert len(cache) == 3
+    assert embedding_key("model", "c") != embedding_key("other", "c")
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the parsing of boolean environment variables.
+"""
+
+import pytest
+
+from alm.utils.env import env_flag
+
+
+@pytest.mark.parametrize("value", ["true", "True", "1", "yes", " YES "])
+def test_true_values(monkeypatch, value):
+    monkeypatch.setenv("ALM_TEST_FLAG", value)
+    assert env_flag("ALM_TEST_FLAG") is True
+
+
+@pytest.mark.parametrize("value", ["false", "0", "no", ""])
+def test_other_values_are_false(monkeypatch, value):
+    monkeypatch.setenv("ALM_TEST_FLAG", value)
+    assert env_flag("ALM_TEST_FLAG", default=True) is False
+
+
+def test_unset_uses_the_default(monkeypatch):
+    monkeypatch.delenv("ALM_TEST_FLAG", raising=False)
+    assert env_flag("ALM_TEST_FLAG") is False
+    assert env_flag("ALM_TEST_FLAG", default=True) is True
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the two-tier cache of LLM node outputs.
+
+LLM calls are counted coroutines and the embedding function is injected, so
+neither an LLM nor an encoder is needed.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from alm.utils.llm_cache import LLMResponseCache, cache_key
+
+# Fixed embeddings of the texts looked up by similarity
+VECTORS = {
+    "disk full on /var": [1.0, 0.0, 0.0],
+    "disk full on /tmp": [0.99, 0.14, 0.0],
+    "connection refused": [0.0, 0.0, 1.0],
+}
+
+
+def _embed(texts):
+    return np.array([VECTORS[text] for text in texts])
+
+
+def _counted(output="answer"):
+    calls = []
+
+    async def call():
+        calls.append(output)
+        await asyncio.sleep(0.01)
+        return output
+
+    return call, calls
+
+
+def test_exact_hit_skips_the_call():
+    cache = LLMResponseCache()
+    call, calls = _counted()
+
+    async def main():
+        first = await cache.get_or_call("node", "key", call)
+        second = await cache.get_or_call("node", "key", call)
+        return first, second
+
+    assert asyncio.run(main()) == ("answer", "answer")
+    assert len(calls) == 1
+    assert cache.stats()["node"]["exact_hits"] == 1
+
+
+def test_entries_expire_after_their_ttl():
+    cache = LLMResponseCache(ttl_seconds=0.05)
+    call, calls = _counted()
+
+    async def main():
+        await cache.get_or_call("node", "key", call)
+        await cache.get_or_call("node", "key", call)
+        await asyncio.sleep(0.1)
+        await cache.get_or_call("node", "key", call)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert cache.stats()["node"]["expired"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LLMResponseCache(max_entries=2)
+    call, calls = _counted()
+
+    async def main():
+        for key in ("a", "b", "a", "c", "a", "b"):
+            await cache.get_or_call("node", key, call)
+
+    asyncio.run(main())
+    # "a" was used again before "c" came in, so "b" was evicted
+    assert len(calls) == 4
+    assert cache.stats()["node"]["evictions"] == 2
+
+
+def test_concurrent_misses_share_one_call():
+    cache = LLMResponseCache()
+    call, calls = _counted()
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_call("node", "key", call) for _ in range(5))
+        )
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["node"]["coalesced"] == 4
+
+
+def test_failed_call_reaches_every_waiter_and_is_not_cached():
+    cache = LLMResponseCache()
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM unavailable")
+
+    async def main():
+        results = await asyncio.gather(
+            *(cache.get_or_call("node", "key", failing) for _ in range(3)),
+            return_exceptions=True,
+        )
+        retry, _ = _counted("recovered")
+        return results, await cache.get_or_call("node", "key", retry)
+
+    results, retried = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(attempts) == 1
+    assert retried == "recovered"
+
+
+def test_semantic_hit_needs_the_threshold():
+    cache = LLMResponseCache(
+        semantic_nodes=("summarize_log",), semantic_threshold=0.95, embed=_embed
+    )
+    call, calls = _counted()
+
+    async def lookup(text):
+        key = cache_key("summarize_log", "v1", "model", text)
+        return await cache.get_or_call("summarize_log", key, call, text)
+
+    async def main():
+        for text in ("disk full on /var", "disk full on /tmp", "connection refused"):
+            await lookup(text)
+
+    asyncio.run(main())
+    # /tmp is 0.99 similar to /var, the refused connection is orthogonal
+    assert len(calls) == 2
+    assert cache.stats()["summarize_log"]["semantic_hits"] == 1
+
+
+def test_semantic_tier_is_off_for_other_nodes():
+    cache = LLMResponseCache(semantic_nodes=("summarize_log",), embed=_embed)
+    call, calls = _counted()
+
+    async def main():
+        for text in ("disk full on /var", "disk full on /tmp"):
+            await cache.get_or_call("classify_log", text, call, text)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("threshold, calls_made", [(0.999, 2), (0.9, 1)])
+def test_semantic_threshold_is_configurable(threshold, calls_made):
+    cache = LLMResponseCache(
+        semantic_nodes=("node",), semantic_threshold=threshold, embed=_embed
+    )
+    call, calls = _counted()
+
+    async def main():
+        for text in ("disk full on /var", "disk full on /tmp"):
+            await cache.get_or_call("node", text, call, text)
+
+    asyncio.run(main())
+    assert len(calls) == calls_made
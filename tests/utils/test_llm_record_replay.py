@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the record / replay mode of the LLM client.
+
+The OpenAI call underneath is replaced by a counted fake, so no endpoint is
+needed: responses are recorded through it and then replayed without it.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+# alm.llm reads its configuration at import
+os.environ.setdefault("OPENAI_API_TOKEN", "test")
+os.environ.setdefault("OPENAI_API_ENDPOINT", "http://localhost:1")
+os.environ.setdefault("OPENAI_MODEL", "test-model")
+os.environ.setdefault("OPENAI_TEMPERATURE", "0")
+
+llm = pytest.importorskip("alm.llm")
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+
+@pytest.fixture
+def live_calls(monkeypatch):
+    calls = []
+
+    def generate(self, messages, stop=None, run_manager=None, **kwargs):
+        calls.append(messages)
+        return ChatResult(
+            generations=[
+                ChatGeneration(message=AIMessage(content=f"answer {len(calls)}"))
+            ]
+        )
+
+    async def agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return generate(self, messages, stop, run_manager, **kwargs)
+
+    monkeypatch.setattr(ChatOpenAI, "_generate", generate)
+    monkeypatch.setattr(ChatOpenAI, "_agenerate", agenerate)
+    return calls
+
+
+def _client(mode, tmp_path):
+    return llm.RecordReplayChatOpenAI(
+        llm_mode=mode,
+        recordings_path=str(tmp_path / "recordings.sqlite"),
+        api_key="test",
+        base_url="http://localhost:1",
+        model="test-model",
+        temperature=0,
+    )
+
+
+def test_replays_recorded_responses_offline(live_calls, tmp_path):
+    recorder = _client("record", tmp_path)
+    assert recorder.invoke("disk full").content == "answer 1"
+    assert asyncio.run(recorder.ainvoke("connection refused")).content == "answer 2"
+    assert len(live_calls) == 2
+
+    replayer = _client("replay", tmp_path)
+    assert replayer.invoke("disk full").content == "answer 1"
+    assert asyncio.run(replayer.ainvoke("connection refused")).content == "answer 2"
+    assert len(live_calls) == 2
+
+
+def test_replay_miss_raises(live_calls, tmp_path):
+    _client("record", tmp_path).invoke("disk full")
+    with pytest.raises(LookupError):
+        _client("replay", tmp_path).invoke("disk full on /tmp")
+    assert len(live_calls) == 1
+
+
+def test_recording_key_ignores_message_ids(tmp_path):
+    client = _client("record", tmp_path)
+    first = client._recording_key([HumanMessage("disk full", id="a")], None, {})
+    second = client._recording_key([HumanMessage("disk full", id="b")], None, {})
+    assert first == second
+    assert first != client._recording_key([HumanMessage("disk full")], ["\n"], {})
+    assert first != client._recording_key(
+        [HumanMessage("disk full")], None, {"tools": ["lookup"]}
+    )
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the token-budgeted log compression applied before LLM prompts.
+
+Tokens are estimated from characters so no tokenizer is downloaded.
+"""
+
+import json
+
+from alm.utils.log_compression import (
+    CHARS_PER_TOKEN,
+    character_offsets,
+    collapse_json_blobs,
+    collapse_repeated_lines,
+    collapse_stack_traces,
+    compress_log,
+    count_tokens,
+)
+
+
+def test_log_within_budget_is_unchanged():
+    log = 'fatal: [host]: FAILED! => {"msg": "boom"}'
+    assert compress_log(log, 100, character_offsets) == log
+
+
+def test_retry_lines_collapse_to_their_ends():
+    retries = [
+        f"FAILED - RETRYING: [localhost]: Wait for pods ({left} retries left)."
+        for left in range(60, 0, -1)
+    ]
+    collapsed = collapse_repeated_lines("\n".join(["TASK [wait]", *retries]))
+    lines = collapsed.split("\n")
+    assert lines == [
+        "TASK [wait]",
+        retries[0],
+        "[... 58 similar lines omitted ...]",
+        retries[-1],
+    ]
+
+
+def test_python_traceback_keeps_innermost_frames():
+    frames = [
+        f'  File "/app/module_{n}.py", line {n}, in f{n}\n    g()' for n in range(10)
+    ]
+    trace = "\n".join(
+        ["Traceback (most recent call last):", *frames, "ValueError: bad value"]
+    )
+    collapsed = collapse_stack_traces(trace)
+    assert "[... 7 frames omitted ...]" in collapsed
+    assert "module_9.py" in collapsed and "module_0.py" not in collapsed
+    assert collapsed.endswith("ValueError: bad value")
+
+
+def test_json_blob_drops_line_copies_and_shrinks_long_values():
+    stdout = "\n".join(f"line {n} of the output" for n in range(500))
+    result = {
+        "changed": False,
+        "msg": "non-zero return code",
+        "stdout": stdout,
+        "stdout_lines": stdout.split("\n"),
+    }
+    log = f"fatal: [bastion]: FAILED! => {json.dumps(result)}"
+    collapsed = collapse_json_blobs(log)
+    shrunk = json.loads(collapsed[collapsed.index("{") :])
+    assert "stdout_lines" not in shrunk
+    assert shrunk["msg"] == "non-zero return code"
+    assert len(collapsed) < len(log) // 5
+
+
+def test_long_log_fits_budget_and_keeps_the_error():
+    names = ["".join(chr(97 + n // 26**k % 26) for k in range(3)) for n in range(5000)]
+    noise = "\n".join(f"ok: [{name}] task {name[::-1]}" for name in names)
+    error = "fatal: [bastion]: FAILED! => the cluster API is unreachable"
+    log = f"PLAY [provision]\n{noise}\n{error}\n" + "-" * 40 + "\nPLAY RECAP"
+    max_tokens = 256
+    compressed = compress_log(log, max_tokens, character_offsets)
+    assert count_tokens(compressed, character_offsets) <= max_tokens
+    assert "tokens omitted" in compressed
+    assert compressed.startswith("PLAY [provision]")
+    assert error in compressed
+    assert compressed.endswith("PLAY RECAP")
+    assert len(compressed) <= max_tokens * CHARS_PER_TOKEN
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the log normalization applied before embedding.
+
+Logs of the same failure that only differ in variable parts must normalize to
+the same text.
+"""
+
+import pytest
+
+from alm.utils.log_normalization import (
+    mask_log,
+    prepare_log_for_embedding,
+    select_window,
+)
+
+
+def test_same_failure_on_different_hosts_masks_alike():
+    first = mask_log(
+        "fatal: [web-01.prod.example.com]: UNREACHABLE! Failed to connect to "
+        "10.0.3.17:22 at 2024-05-01T12:00:01Z"
+    )
+    second = mask_log(
+        "fatal: [db-7.stage.example.com]: UNREACHABLE! Failed to connect to "
+        "192.168.1.5:2222 at 2024-06-11T08:30:59.123+02:00"
+    )
+    assert first == second
+    assert "<HOST>" in first and "<IP>" in first and "<TS>" in first
+
+
+def test_masks_paths_ids_and_numbers():
+    masked = mask_log(
+        "Unable to open /var/lib/pgsql/data/pg_hba.conf for job "
+        "123e4567-e89b-12d3-a456-426614174000, rc=1 after 3.5s"
+    )
+    assert masked == "Unable to open <PATH> for job <UUID>, rc=<NUM> after <NUM>s"
+
+
+@pytest.mark.parametrize(
+    "log, masked",
+    [
+        ("failed to run main.py", "failed to run main.py"),
+        ("sh setup.sh returned 2", "sh setup.sh returned <NUM>"),
+        ("bad value task.id=abc", "bad value task.id=abc"),
+        ("error in roles/web/tasks/main.yml", "error in <PATH>"),
+        ("error in ../roles/db/tasks/main.yml", "error in <PATH>"),
+        ("cannot reach api.cluster.example.com", "cannot reach <HOST>"),
+    ],
+)
+def test_file_names_and_relative_paths(log, masked):
+    assert mask_log(log) == masked
+
+
+def test_distinct_files_do_not_normalize_alike():
+    assert mask_log("syntax error in main.py") != mask_log("syntax error in setup.sh")
+
+
+def test_windows():
+    text = "a" * 10 + "b" * 10
+    assert select_window(text, "tail", 5) == "bbbbb"
+    assert select_window(text, "head", 5) == "aaaaa"
+    assert select_window(text, "head_tail", 4) == "aa ... bb"
+    assert select_window(text, "full", 5) == text
+    with pytest.raises(ValueError):
+        select_window(text, "middle", 5)
+
+
+def test_prepare_normalizes_before_selecting_the_window():
+    log = "error:   retries exhausted after 12 attempts"
+    assert (
+        prepare_log_for_embedding(log, ["whitespace", "mask"], "tail", 30)
+        == "exhausted after <NUM> attempts"
+    )
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the conditional put of MinIO models, which relies on a private
+minio client method.
+"""
+
+import inspect
+import logging
+
+import minio
+import pytest
+from minio import Minio
+
+from alm.utils import minio as minio_utils
+
+
+def _version():
+    return tuple(int(part) for part in minio.__version__.split(".")[:2])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = Minio("localhost:9000", secure=False)
+    monkeypatch.setattr(minio_utils, "_minio_client", lambda: client)
+    return client
+
+
+def test_installed_minio_supports_the_conditional_put():
+    low, high = minio_utils.CONDITIONAL_PUT_MINIO_VERSIONS
+    assert low <= _version() < high
+
+
+def test_private_put_object_signature():
+    parameters = list(inspect.signature(Minio._put_object).parameters)
+    assert parameters[:5] == ["self", "bucket_name", "object_name", "data", "headers"]
+
+
+def test_if_match_header_is_sent_as_it_is(monkeypatch, client):
+    calls = []
+    monkeypatch.setattr(
+        Minio, "_put_object", lambda self, *args, **kwargs: calls.append(kwargs)
+    )
+    assert minio_utils.upload_model_to_minio_if_match(
+        {"model": 1}, "bucket", "model.joblib", "etag"
+    )
+    assert calls[0]["headers"]["If-Match"] == '"etag"'
+
+
+def test_unsupported_minio_version_warns_and_writes(monkeypatch, client, caplog):
+    monkeypatch.setattr(minio, "__version__", "8.0.0")
+    calls = []
+    monkeypatch.setattr(
+        Minio, "put_object", lambda self, *args, **kwargs: calls.append(args)
+    )
+    with caplog.at_level(logging.WARNING):
+        assert minio_utils.upload_model_to_minio_if_match(
+            {"model": 1}, "bucket", "model.joblib", "etag"
+        )
+    assert len(calls) == 1
+    assert "without If-Match" in caplog.text